@@ -1,15 +1,23 @@
-import datetime
+import gzip
+import io
 import logging
 import math
 import multiprocessing
 import os
-import tempfile
 
-import matplotlib.pyplot as plt
 import numpy as np
+from astropy.io import fits
 from radiospectra.sources import CallistoSpectrogram
 
-from utils.validation import calculate_snr
+from manifest import ObservationResult
+from utils import background, instrumentation, tensorexport
+from utils.rendering import get_renderer
+from utils.validation import INVALID_SNR, Screening, spectrogram_stats
+
+# What write_observation produces: a .jpg and a .fit.gz per observation or
+# a record for the monthly dataset, see utils.dataset
+OUTPUT_FILES = "files"
+OUTPUT_DATASET = "dataset"
 
 
 class RadioBurstObservation:
@@ -26,20 +34,57 @@ class RadioBurstObservation:
         self.spectrum: CallistoSpectrogram = None
         self.__spec_max = 0.0
 
-        # logger is set in method write_observation. See comment there.
-        self.__logger = None
+        # If set, the raw FITS files are read through this cache
+        self.fits_cache = None
+
+        # Use our own background subtraction instead of the one of radiospectra
+        self.fast_background = False
+
+        # Hash of the row in the burst list and the name of the files written,
+        # for the manifest
+        self.row_hash = ""
+        self.remote_name = None
+
+        # If set, observations without a burst are dropped before the
+        # expensive steps. See utils.validation.Screening
+        self.screening = None
+
+        # Wall time and bytes of the stages, for the run report
+        self.stages = instrumentation.StageTimer()
 
-    def __prettify(self):
+        # With OUTPUT_DATASET write_observation keeps the spectrogram in
+        # record instead of writing files
+        self.output = OUTPUT_FILES
+        self.record = None
+        # With a grid (frequencies, times) write_observation also resamples
+        # the spectrogram for the tensor export, see utils.tensorexport
+        self.tensor_grid = None
+        self.tensor = None
+
+        # logger is replaced in method write_observation. See comment there.
+        # Until then create_spectrogram logs to the logger of the module.
+        self.__logger = logging.getLogger(__name__)
+
+    def __prettify(self, in_place: bool = False):
         """
         Applies some error corrections to the spectrogram. Those shall make the
         spectrogram look nicer.
         """
-        self.spectrum = self.spectrum.subtract_bg("constbacksub", "elimwrongchannels")
+        with self.stages.stage("prettify"):
+            self.spectrum = background.prettify(self.spectrum, fast=self.fast_background, in_place=in_place)
         # self.spectrum = self.spectrum.subtract_bg("subtract_bg_sliding_window", window_width=800, affected_width=1, amount=0.05, change_points=True).denoise()
         # Recalculate the values
         # self.spectrum.elimwrongchannels(overwrite=True)
-        self.__spec_max = np.nanmax(self.spectrum.data)
-        self.snr = calculate_snr(self.spectrum)
+        self.__update_stats()
+
+    def __update_stats(self):
+        """
+        Max and snr of the spectrogram, computed in one pass over the data
+        """
+        with self.stages.stage("snr"):
+            stats = spectrogram_stats(self.spectrum)
+        self.__spec_max = stats.max
+        self.snr = stats.snr
 
     def reverse_extract_instrument_name(self, instrument_name, include_number=False):
         """
@@ -74,17 +119,43 @@ class RadioBurstObservation:
         instrument_name = self.reverse_extract_instrument_name(self.instrument, include_number=False)
         return f"{instrument_name}_{self.event_time_start.strftime('%Y%m%d')}_{self.event_time_start.strftime('%H%M')}_{self.event_time_end.strftime('%H%M')}"
 
-    def create_spectrogram(self, prettify=True):
+    def create_spectrogram(self, prettify=True, source: CallistoSpectrogram = None, screening: Screening = None):
+        """
+        Loads the spectrogram of the observation. If source is given the
+        observation is cut out of it instead of loading the data again.
+        If screening is given the raw spectrogram is screened first.
+
+        Returns: the reason why the screening rejected the observation or
+        None
+        """
         self.__logger.debug(f"Create spectrogram for {self.__repr__()}")
         instrument_name = self.instrument   # self.reverse_extract_instrument_name(self.instrument, include_number=False)
         self.__logger.debug(instrument_name)
-        self.spectrum = CallistoSpectrogram.from_range(
-                instrument_name, self.event_time_start, self.event_time_end)
-        self.spectrum = self.spectrum.in_interval(self.event_time_start, self.event_time_end)
-        self.__spec_max = np.nanmax(self.spectrum.data)
-        self.snr = calculate_snr(self.spectrum.data)
+        if source is not None:
+            self.spectrum = source
+        elif self.fits_cache is not None:
+            with self.stages.stage("fetch"):
+                self.spectrum = self.fits_cache.from_range(
+                        instrument_name, self.event_time_start, self.event_time_end)
+        else:
+            with self.stages.stage("fetch"):
+                self.spectrum = CallistoSpectrogram.from_range(
+                        instrument_name, self.event_time_start, self.event_time_end)
+        with self.stages.stage("slice"):
+            self.spectrum = self.__in_interval(self.spectrum)
+            if source is not None:
+                # The slices of a shared spectrogram share its header as well
+                self.spectrum.header = self.spectrum.header.copy()
+        if screening is not None:
+            with self.stages.stage("screen"):
+                rejection = screening.reject(self.spectrum)
+            if rejection is not None:
+                return rejection
         if prettify:
-            self.__prettify()
+            # Data read for this observation alone may be changed in place
+            self.__prettify(in_place=source is None)
+        else:
+            self.__update_stats()
 
         if math.isnan(self.snr):
             self.snr = -1.0
@@ -92,39 +163,119 @@ class RadioBurstObservation:
 
         # Adding snr to the fits header for further reference
         self.spectrum.header.append(("snr", self.snr))
+        return None
+
+    def __in_interval(self, spectrum: CallistoSpectrogram) -> CallistoSpectrogram:
+        """
+        Same as spectrum.in_interval for the event times. radiospectra
+        computes float indices there, which numpy does not accept for slicing.
+        """
+        def time_to_x(time):
+            x = int((time - spectrum.start).total_seconds() // spectrum.t_delt)
+            return min(max(x, 0), spectrum.shape[1])
+        return spectrum[:, time_to_x(self.event_time_start):time_to_x(self.event_time_end)]
+
+    def write_observation(self, connector=None, source: CallistoSpectrogram = None) -> str:
+        """
+        Creates the spectrogram and writes the image and the FITS file. With
+        OUTPUT_DATASET nothing is written, the spectrogram goes to the main
+        process with the result.
 
-    def write_observation(self, connector=None):
-        # Because this method is run in multiprocessing env.
-        # we must create an individual file handle for it
+        Returns: the reason why the observation was not written or None
+        """
+        # Because this method is run in multiprocessing env. every process
+        # logs to its own file. The handler is set up once per process by
+        # worker.init_worker.
         self.__logger = logging.getLogger(f'observations_{multiprocessing.current_process().pid}')
-        formatter = logging.Formatter('%(asctime)s:%(name)s:%(levelname)s - %(message)s')
-        datei_handler = logging.FileHandler(f'logs/observations_{multiprocessing.current_process().pid}_{datetime.datetime.now().strftime("%Y%m%d-%H%M%S")}.log', 'w+')
-        datei_handler.setFormatter(formatter)
-        self.__logger.setLevel(logging.INFO)
-        self.__logger.addHandler(datei_handler)
 
-        self.create_spectrogram(prettify=True)
+        rejection = self.create_spectrogram(prettify=True, source=source, screening=self.screening)
+        if rejection is not None:
+            self.__logger.info(f"{self.__repr__()} rejected: {rejection} - not writing")
+            return rejection
         self.__logger.debug(f"Writing for instrument {self.instrument}")
         if self.snr < 0.0:
             self.__logger.info(f"snr undetermined for {self.instrument} - not writing")
-            return
+            return INVALID_SNR
+
+        remotename = os.path.join(f"type_{self.radio_burst_type.upper()}", f"{self.suggest_filename()}")
+        self.remote_name = remotename
+        if self.tensor_grid is not None:
+            with self.stages.stage("export"):
+                self.tensor = self.tensor_record()
+        if self.output == OUTPUT_DATASET:
+            self.record = self.dataset_record()
+            return None
+        with self.stages.stage("render"):
+            image = self.encode_jpeg()
+        with self.stages.stage("fits"):
+            fits_file = self.encode_fits()
+        self.stages.bytes["render"] += len(image)
+        self.stages.bytes["fits"] += len(fits_file)
+        for suffix, content in ((".jpg", image), (".fit.gz", fits_file)):
+            with self.stages.stage("put_file", len(content)):
+                connector.put_file(remote_name=f"{remotename}{suffix}", local_name=content, overwrite=True)
+        return None
+
+    def dataset_record(self) -> dict:
+        """
+        Returns: the spectrogram, its axes and its FITS header for
+        utils.dataset.BurstStore
+        """
+        return {
+            "data": np.asarray(self.spectrum.data, dtype=np.float32),
+            "freq_axis": np.asarray(self.spectrum.freq_axis, dtype=np.float64),
+            "time_axis": np.asarray(self.spectrum.time_axis, dtype=np.float64),
+            "header": self.spectrum.get_header().tostring(),
+        }
+
+    def tensor_record(self) -> dict:
+        """
+        Returns: the spectrogram resampled onto tensor_grid and its frequency
+        range for utils.tensorexport.TensorStore
+        """
+        freq_axis = np.asarray(self.spectrum.freq_axis, dtype=np.float64)
+        return {
+            "tensor": tensorexport.resample(self.spectrum.data, freq_axis, self.spectrum.time_axis,
+                                            self.tensor_grid),
+            "freq_min": float(freq_axis.min()),
+            "freq_max": float(freq_axis.max()),
+        }
 
-        plt.ioff()
-        fig = plt.figure(figsize=(10, 6.2))
+    def encode_jpeg(self) -> bytes:
+        """
+        Plots the spectrogram and returns the image as JPEG. The figure of
+        the renderer is shared by all observations of a process.
+        """
         assert isinstance(self.spectrum, CallistoSpectrogram)
-        self.spectrum.plot(fig, vmin=-2, vmax=17, cmap=plt.get_cmap('plasma'))
-        fig.tight_layout()
-
-        with tempfile.NamedTemporaryFile() as tmpfile:
-            tmp_filename = tmpfile.name
-            plt.savefig(f"{tmp_filename}.jpg")
-            plt.close(fig)
-            self.spectrum.save(f"{tmp_filename}.fit.gz")
-            remotename = os.path.join(f"type_{self.radio_burst_type.upper()}", f"{self.suggest_filename()}")
-            connector.put_file(remote_name=f"{remotename}.jpg", local_name=f"{tmp_filename}.jpg", overwrite=True)
-            connector.put_file(remote_name=f"{remotename}.fit.gz", local_name=f"{tmp_filename}.fit.gz", overwrite=True)
-            os.unlink(f"{tmp_filename}.jpg")
-            os.unlink(f"{tmp_filename}.fit.gz")
+        return get_renderer().render(self.spectrum)
+
+    def encode_fits(self) -> bytes:
+        """
+        Serializes the spectrogram as gzip compressed FITS file, the same
+        layout as the files of the e-Callisto archive. Nothing is written
+        to disk.
+        """
+        primary = fits.PrimaryHDU(np.asarray(self.spectrum.data), header=self.spectrum.get_header())
+        freq_axis = np.asarray(self.spectrum.freq_axis, dtype=np.float64)
+        time_axis = np.asarray(self.spectrum.time_axis, dtype=np.float64)
+        cols = fits.ColDefs([
+            fits.Column(name="TIME", format=f"{len(time_axis)}D", array=time_axis[np.newaxis, :]),
+            fits.Column(name="FREQUENCY", format=f"{len(freq_axis)}D", array=freq_axis[np.newaxis, :]),
+        ])
+        table = fits.BinTableHDU.from_columns(cols, header=self.spectrum.axes_header)
+        buffer = io.BytesIO()
+        fits.HDUList([primary, table]).writeto(buffer)
+        return gzip.compress(buffer.getvalue())
+
+    def result(self, rejection: str = None) -> ObservationResult:
+        """
+        Returns: the outcome of write_observation for the main process
+        """
+        snr = self.snr if rejection is None else None
+        self.stages.peak_rss = instrumentation.peak_rss()
+        return ObservationResult(self.instrument, self.radio_burst_type, self.event_time_start, self.event_time_end,
+                                 row_hash=self.row_hash, remote_name=self.remote_name, snr=snr, rejection=rejection,
+                                 stages=self.stages.as_dict(), record=self.record, tensor=self.tensor)
 
     def __repr__(self) -> str:
         return f"{self.instrument} - {self.event_time_start} - {self.event_time_end}"
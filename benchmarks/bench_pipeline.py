@@ -0,0 +1,162 @@
+"""
+Benchmarks of the stages of the extractor and of the whole pipeline of a
+day. The data comes from the synthetic archive of conftest.py, the images
+go to a local WebDAV server.
+
+The observations use the fast background subtraction, the one of the
+radiospectra fork is not measured.
+
+Usage, from the root of the repository:
+    python -m pytest benchmarks --benchmark-compare=0001 --benchmark-compare-fail=mean:20%
+    python -m pytest benchmarks --benchmark-save=baseline
+
+The first command compares against the baseline committed in
+benchmarks/.benchmarks and fails on regressions, the second saves a new
+one.
+version 1.0
+author: Andreas Wassmer
+project: Raumschiff
+"""
+import os
+import sys
+
+import pytest
+from conftest import DAY, N_EVENTS, N_LIST_ROWS, STATIONS
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import burstlist
+import burstprocessor
+import main
+from connectors.defaultconnector import DefaultConnector
+from connectors.spoolconnector import SpoolConnector
+from connectors.uploadqueue import UploadQueue
+from utils import rendering, validation
+from utils.fitscache import FitsCache
+from utils.validation import Screening
+
+
+def day_plan(burst_list_file):
+    events = burstlist.process_burst_list(burst_list_file, date=DAY.strftime("%Y%m%d"), use_cache=False)
+    return burstprocessor.plan_observations(events)
+
+
+@pytest.fixture()
+def fits_cache(archive_server, tmp_path):
+    return FitsCache(str(tmp_path / "cache"), archive_url=archive_server.url + "/")
+
+
+@pytest.fixture()
+def instrument_day(fits_cache, burst_list_file):
+    """
+    The observations of the first station, with the files in the cache
+    """
+    observations = burstprocessor.observations_from_plan(day_plan(burst_list_file), fits_cache=fits_cache,
+                                                         fast_background=True)
+    instrument_day = burstprocessor.plan_days(observations)[0]
+    instrument_day.load(burstprocessor.load_windows(instrument_day))
+    return instrument_day
+
+
+@pytest.fixture()
+def spectrogram(instrument_day):
+    """
+    The spectrogram of the first observation after the background
+    subtraction, as it is passed to the renderer
+    """
+    obs = instrument_day.observations[0]
+    obs.create_spectrogram(source=instrument_day.window(obs.event_time_start, obs.event_time_end))
+    return obs.spectrum
+
+
+@pytest.mark.benchmark(group="stages")
+def test_process_burst_list(benchmark, burst_list_file):
+    events = benchmark(burstlist.process_burst_list, burst_list_file, use_cache=False)
+    benchmark.extra_info["rows"] = N_LIST_ROWS
+    assert len(events) == N_LIST_ROWS
+
+
+@pytest.mark.benchmark(group="stages")
+def test_extract_bursts(benchmark, burst_list_file, tmp_path):
+    burst_list = burstlist.process_burst_list(burst_list_file, use_cache=False)
+    connector = DefaultConnector()
+    connector.base_dir = str(tmp_path / "bursts")
+    plan = benchmark(main.extract_bursts, burst_list, "all", connector=connector)
+    benchmark.extra_info["observations"] = len(plan)
+    assert (plan["instrument"].isin(STATIONS)).sum() == N_EVENTS * len(STATIONS)
+
+
+@pytest.mark.benchmark(group="stages")
+def test_load_instrument_day(benchmark, instrument_day):
+    windows = burstprocessor.load_windows(instrument_day)
+    benchmark(instrument_day.load, windows)
+    benchmark.extra_info["files"] = len(instrument_day.known_files or instrument_day.file_names(windows))
+
+
+@pytest.mark.benchmark(group="stages")
+def test_create_spectrogram(benchmark, instrument_day):
+    obs = instrument_day.observations[0]
+
+    def create():
+        return obs.create_spectrogram(source=instrument_day.window(obs.event_time_start, obs.event_time_end))
+
+    assert benchmark(create) is None
+    assert obs.snr > 0
+
+
+@pytest.mark.benchmark(group="stages")
+def test_calculate_snr(benchmark, spectrogram):
+    snr = benchmark(validation.calculate_snr, spectrogram)
+    benchmark.extra_info["samples"] = int(spectrogram.data.size)
+    assert snr > 0
+
+
+@pytest.mark.benchmark(group="stages")
+def test_screening(benchmark, spectrogram):
+    assert benchmark(Screening().reject, spectrogram) is None
+
+
+@pytest.mark.benchmark(group="stages")
+def test_render(benchmark, spectrogram):
+    image = benchmark(rendering.get_renderer().render, spectrogram)
+    benchmark.extra_info["bytes"] = len(image)
+
+
+@pytest.mark.benchmark(group="stages")
+def test_put_file(benchmark, spectrogram, webdav_connector, webdav_root):
+    image = rendering.get_renderer().render(spectrogram)
+    benchmark(webdav_connector.put_file, remote_name="type_III/bench.jpg", local_name=image, overwrite=True)
+    benchmark.extra_info["bytes"] = len(image)
+    assert (webdav_root / "bursts" / "type_III" / "bench.jpg").stat().st_size == len(image)
+
+
+@pytest.mark.benchmark(group="end-to-end")
+def test_day_end_to_end(benchmark, archive_server, burst_list_file, webdav_connector, webdav_root, tmp_path):
+    """
+    A day from the burst list to the files on the WebDAV server, in one
+    process: download, decode, screen, render and upload
+    """
+    plan = day_plan(burst_list_file)
+    screening = Screening()
+    runs = list()
+
+    def run():
+        # Every round starts with an empty cache, so the downloads count
+        fits_cache = FitsCache(str(tmp_path / f"cache_{len(runs)}"), archive_url=archive_server.url + "/")
+        observations = burstprocessor.observations_from_plan(plan, fits_cache=fits_cache, screening=screening,
+                                                             fast_background=True)
+        spool = SpoolConnector()
+        uploader = UploadQueue(webdav_connector)
+        results = list()
+        for instrument_day in burstprocessor.plan_days(observations):
+            results += burstprocessor.write_instrument_day(instrument_day, spool)
+            for remote_name, content, overwrite in spool.take():
+                uploader.put_file(remote_name=remote_name, local_name=content, overwrite=overwrite)
+        failed = uploader.close()
+        runs.append(results)
+        return results, failed
+
+    results, failed = benchmark.pedantic(run, rounds=3)
+    benchmark.extra_info["observations"] = len(results)
+    assert failed == []
+    assert all(r.rejection is None for r in results)
+    assert len(os.listdir(webdav_root / "bursts" / "type_III")) == 2 * len(results)
@@ -0,0 +1,83 @@
+"""
+Compares the rendering of observation images with a new figure and
+CallistoSpectrogram.plot per image against the reused figure of
+utils.rendering.
+
+Usage: python benchmarks/bench_rendering.py [number of images]
+version 1.0
+author: Andreas Wassmer
+project: Raumschiff
+"""
+import datetime
+import io
+import os
+import sys
+import time
+
+import matplotlib
+
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import numpy as np
+from radiospectra.sources import CallistoSpectrogram
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from utils.rendering import SpectrogramRenderer
+
+
+def synthetic_spectrogram(n_freq: int = 200, minutes: int = 30, t_delt: float = 0.25,
+                          seed: int = 0) -> CallistoSpectrogram:
+    """
+    A spectrogram with the shape of a typical observation: noise, a few hot
+    channels and a drifting burst
+    """
+    rng = np.random.default_rng(seed)
+    n_time = int(minutes * 60 / t_delt)
+    data = rng.normal(0.0, 2.0, (n_freq, n_time)).astype(np.float32)
+    data[rng.integers(0, n_freq, 5)] += 40.0
+    for i in range(n_freq):
+        x = n_time // 3 + i * 4
+        data[i, x:x + 20] += 25.0
+    start = datetime.datetime(2023, 6, 1, 12, 0)
+    end = start + datetime.timedelta(seconds=n_time * t_delt)
+    freq_axis = np.linspace(870.0, 45.0, n_freq)
+    time_axis = np.arange(n_time) * t_delt
+    header = {"DATE-OBS": "2023/06/01", "TIME-OBS": "12:00:00.000"}
+    return CallistoSpectrogram(data, time_axis, freq_axis, start, end, 12 * 3600.0, t_delt,
+                               "Time [UT]", "Frequency [MHz]", "Radio flux density",
+                               {"BENCH-STATION"}, header, None, False)
+
+
+def render_with_plot(spectrum: CallistoSpectrogram) -> bytes:
+    """
+    How Observation.write_observation rendered before the renderer existed
+    """
+    fig = plt.figure(figsize=(10, 6.2))
+    spectrum.plot(fig, vmin=-2, vmax=17, cmap=plt.get_cmap("plasma"))
+    fig.tight_layout()
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="jpg")
+    plt.close(fig)
+    return buffer.getvalue()
+
+
+def images_per_second(render, spectra: list) -> float:
+    render(spectra[0])  # warm up
+    begin = time.perf_counter()
+    for spectrum in spectra:
+        render(spectrum)
+    return len(spectra) / (time.perf_counter() - begin)
+
+
+def main(n_images: int = 10) -> None:
+    spectra = [synthetic_spectrogram(seed=i) for i in range(n_images)]
+    renderer = SpectrogramRenderer()
+    legacy = images_per_second(render_with_plot, spectra)
+    reused = images_per_second(renderer.render, spectra)
+    print(f"spectrogram: {spectra[0].shape[0]} channels x {spectra[0].shape[1]} samples")
+    print(f"plot per image:  {legacy:6.2f} images/s")
+    print(f"reused renderer: {reused:6.2f} images/s ({reused / legacy:.1f}x)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10)
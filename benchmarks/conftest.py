@@ -0,0 +1,105 @@
+"""
+Fixtures of the benchmarks: a synthetic archive with Callisto-like FITS
+files and a burst list, served by the stand-ins of the tests.
+"""
+import datetime
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "tests"))
+from standins import (ArchiveHandler, StandInServer, write_burst_list,
+                      write_callisto_fits)
+
+# The archive holds two hours of data of these stations on DAY
+STATIONS = ["BENCH-GLASGOW", "BENCH-OOTY", "BENCH-IRSOL"]
+DAY = datetime.date(2023, 6, 1)
+FIRST_FILE = datetime.datetime(2023, 6, 1, 12, 0)
+N_FILES = 8
+
+# Size of a file like the ones of a typical station: 200 channels,
+# 15 minutes at 4 samples per second
+N_FREQ = 200
+N_TIME = 3600
+T_DELT = 0.25
+
+# Events on DAY, one every 15 minutes. Every event lists all stations.
+N_EVENTS = 7
+
+# The burst list is padded with events on other days to the size of a busy
+# month
+N_LIST_ROWS = 600
+
+
+@pytest.fixture(scope="session")
+def bench_archive(tmp_path_factory):
+    """
+    A local directory with the layout of the e-Callisto archive. Every file
+    has a burst in it.
+    """
+    archive = tmp_path_factory.mktemp("archive")
+    day_dir = archive / DAY.strftime("%Y/%m/%d")
+    os.makedirs(day_dir)
+    for s, station in enumerate(STATIONS):
+        for i in range(N_FILES):
+            file_start = FIRST_FILE + datetime.timedelta(minutes=15 * i)
+            name = f"{station}_{file_start.strftime('%Y%m%d_%H%M%S')}_01.fit.gz"
+            write_callisto_fits(day_dir / name, station, file_start, n_freq=N_FREQ, n_time=N_TIME,
+                                t_delt=T_DELT, seed=s * N_FILES + i, burst_at=N_TIME // 3)
+    return str(archive)
+
+
+@pytest.fixture(scope="session")
+def archive_server(bench_archive):
+    """
+    Serves the synthetic archive over HTTP
+    """
+    with StandInServer(bench_archive, handler=ArchiveHandler) as server:
+        yield server
+
+
+@pytest.fixture(scope="session")
+def burst_list_file(tmp_path_factory):
+    """
+    A monthly burst list. The first N_EVENTS rows are on DAY and match the
+    bursts of the archive.
+    """
+    rows = list()
+    for i in range(N_EVENTS):
+        begin = FIRST_FILE + datetime.timedelta(minutes=15 * i + 5)
+        rows.append(f"{DAY.strftime('%Y%m%d')}\t{begin.strftime('%H:%M')}-"
+                    f"{(begin + datetime.timedelta(minutes=2)).strftime('%H:%M')}\tIII\t{', '.join(STATIONS)}")
+    types = ["I", "II", "III", "IV", "V"]
+    for i in range(N_LIST_ROWS - N_EVENTS):
+        day = DAY + datetime.timedelta(days=1 + i % 29)
+        rows.append(f"{day.strftime('%Y%m%d')}\t{i % 24:02d}:{i % 60:02d}-{i % 24:02d}:{(i % 60) // 2 + 30:02d}"
+                    f"\t{types[i % 5]}\tALASKA-ANCHORAGE, (INDIA-OOTY), e-Callisto")
+    path = tmp_path_factory.mktemp("burstlists") / "e-CALLISTO_2023_06.txt"
+    write_burst_list(path, rows)
+    return str(path)
+
+
+@pytest.fixture()
+def webdav_root(tmp_path):
+    root = tmp_path / "webdav"
+    os.makedirs(root / "bursts" / "type_III")
+    return root
+
+
+@pytest.fixture()
+def webdav_connector(webdav_root, monkeypatch):
+    """
+    A WebdavConnector talking to a local WebDAV server
+    """
+    from connectors.webdavconnector import WebdavConnector
+
+    with StandInServer(str(webdav_root)) as server:
+        monkeypatch.setenv("HOST_URL", server.url)
+        monkeypatch.setenv("USERNAME", "raumschiff")
+        monkeypatch.setenv("PASSWORD", "secret")
+        connector = WebdavConnector()
+        connector.client.verbose = False
+        connector.base_dir = "bursts"
+        yield connector
@@ -1,10 +1,15 @@
 """
 Reads a burst list compiled by C. Monstein from server and processes its data
-version 1.3
+version 1.6
 author: Andreas Wassmer
 project: Raumschiff
 """
 import datetime
+import glob
+import hashlib
+import io
+import json
+import logging
 import os
 
 import pandas as pd
@@ -12,30 +17,87 @@ import requests
 
 import utils.timeutils
 
-BASE_URL = "http://soleil.i4ds.ch/solarradio/data/BurstLists/"
-+ "2010-yyyy_Monstein"
+BASE_URL = ("http://soleil.i4ds.ch/solarradio/data/BurstLists/"
+            + "2010-yyyy_Monstein")
 
+# Lines before and after the table in the burst list
+HEADER_LINES = 8
+FOOTER_LINES = 4
 
-def process_burst_list(filename, date=None) -> pd.DataFrame:
+COLUMNS = ['Date', 'Time', 'Type', 'Instruments']
+
+
+def parse_burst_list(content: bytes) -> pd.DataFrame:
     """
-    Let's discard the entries with missing data.
-    These events have a time stamp of "##:##-##:##" with no further data
-    in the row except the date. I like to use a conditional for filtering.
-    I think the filter is more readable. Especially if there are several
-    conditions. If the user wants the data of a specific day this data
-    is extracted as well.
+    Parses the raw content of a burst list. The header and the footer are cut
+    off before the table is handed to the C parser of pandas, which is a lot
+    faster than the python engine needed for skipfooter.
+    The entries with missing data are discarded. These events have a time
+    stamp of "##:##-##:##" with no further data in the row except the date.
 
     Returns: A Pandas Dataframe with valid events
     """
-    col_names = ['Date', 'Time', 'Type', 'Instruments']
-    data = pd.read_csv(filename, sep="\t", skiprows=8, skipfooter=4,
-                       index_col=False, encoding="latin-1",
-                       names=col_names, engine="python")
+    lines = content.decode("latin-1").splitlines()
+    table = "\n".join(lines[HEADER_LINES:len(lines) - FOOTER_LINES])
+    data = pd.read_csv(io.StringIO(table), sep="\t", index_col=False,
+                       names=COLUMNS, engine="c")
 
     # on some random occasions the date is in int format. Set this to string
     data['Date'] = data['Date'].astype('string')
     missing_conditional = data['Time'] != "##:##-##:##"
-    cleaned = data.loc[missing_conditional]
+    return data.loc[missing_conditional]
+
+
+def cached_burst_list_name(filename: str, digest: str) -> str:
+    """
+    The parsed list is stored next to the text file. The name contains
+    the hash of the text, so a changed list never hits an old cache file.
+    """
+    stem = os.path.splitext(filename)[0]
+    return f"{stem}.{digest[:16]}.parquet"
+
+
+def load_burst_list(filename, use_cache=True, content: bytes = None) -> pd.DataFrame:
+    """
+    Returns the cleaned burst list. If the text file did not change since
+    the last call, the list is read from the parquet cache instead of
+    being parsed again. If the content is given, the file is not read.
+    """
+    if content is None:
+        with open(filename, "rb") as f:
+            content = f.read()
+    if not use_cache:
+        return parse_burst_list(content)
+
+    digest = hashlib.sha256(content).hexdigest()
+    cache_name = cached_burst_list_name(filename, digest)
+    if os.path.exists(cache_name):
+        try:
+            return pd.read_parquet(cache_name)
+        except (OSError, ValueError, ImportError) as e:
+            logging.warning(f"Cannot read cached burst list {cache_name}: {e.__repr__()}")
+
+    data = parse_burst_list(content)
+    stem = os.path.splitext(filename)[0]
+    for old in glob.glob(f"{glob.escape(stem)}.*.parquet"):
+        os.unlink(old)
+    try:
+        data.to_parquet(cache_name)
+    except (OSError, ValueError, ImportError) as e:
+        logging.warning(f"Cannot cache burst list {filename}: {e.__repr__()}")
+    return data
+
+
+def process_burst_list(filename, date=None, use_cache=True, content: bytes = None) -> pd.DataFrame:
+    """
+    Reads the burst list without the entries with missing data. I like to use
+    a conditional for filtering. I think the filter is more readable. If the
+    user wants the data of a specific day this data is extracted as well.
+    If the content of the list is given, the file is not read.
+
+    Returns: A Pandas Dataframe with valid events
+    """
+    cleaned = load_burst_list(filename, use_cache=use_cache, content=content)
 
     if date is not None:
         date_conditional = cleaned['Date'] == date
@@ -44,11 +106,121 @@ def process_burst_list(filename, date=None) -> pd.DataFrame:
     return cleaned
 
 
+def process_burst_range(first: datetime.date, last: datetime.date, use_cache=True,
+                        fetcher=None) -> pd.DataFrame:
+    """
+    Downloads and reads the burst lists of all months between first and last
+    and joins them into one list, so that the events of a long period can
+    be planned at once. All months are fetched through the same connection.
+    A month whose list cannot be fetched, e.g. the current one that is not
+    published yet, is skipped with a warning.
+
+    Returns: A Pandas Dataframe with the valid events from first to last
+    """
+    own_fetcher = fetcher is None
+    if own_fetcher:
+        fetcher = BurstListFetcher()
+    lists = list()
+    try:
+        for year, month in utils.timeutils.months_in_range(first, last):
+            try:
+                filename, content = fetcher.fetch(year, month)
+            except requests.RequestException as e:
+                logging.warning(f"No burst list for {year}-{month:02d}, the month is skipped: {e.__repr__()}")
+                continue
+            lists.append(process_burst_list(filename, use_cache=use_cache, content=content))
+    finally:
+        if own_fetcher:
+            fetcher.close()
+    if len(lists) == 0:
+        return pd.DataFrame(columns=COLUMNS).astype({'Date': 'string'})
+    data = pd.concat(lists, ignore_index=True)
+    in_range = (data['Date'] >= first.strftime("%Y%m%d")) & (data['Date'] <= last.strftime("%Y%m%d"))
+    return data.loc[in_range.fillna(False)]
+
+
+class BurstListFetcher:
+    """
+    Gets the monthly burst lists from the server with conditional requests.
+    The ETag and Last-Modified of every list are kept next to the file, so
+    an unchanged list costs a single 304 response instead of a download.
+    One HTTP session is used for all months.
+    """
+    def __init__(self, base_url: str = BASE_URL, directory: str = ".") -> None:
+        self.base_url = base_url.rstrip("/")
+        self.directory = directory
+        self.session = requests.Session()
+        self.downloaded = 0
+        self.not_modified = 0
+
+    def file_name(self, year, month) -> str:
+        year, month, _ = utils.timeutils.adjust_year_month_day(year, month)
+        return os.path.join(self.directory, f"e-CALLISTO_{year}_{month}.txt")
+
+    def fetch(self, year, month) -> tuple:
+        """
+        Returns: the file name and the content of the burst list. The
+        content comes from the response if the list has changed, otherwise
+        from the local file.
+        """
+        filename = self.file_name(year, month)
+        meta = self.__read_meta(filename) if os.path.exists(filename) else dict()
+        headers = dict()
+        if "etag" in meta:
+            headers["If-None-Match"] = meta["etag"]
+        if "last_modified" in meta:
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+        url = f"{self.base_url}/{year}/{os.path.basename(filename)}"
+        try:
+            response = self.session.get(url, headers=headers, timeout=60)
+        except requests.RequestException as e:
+            if not os.path.exists(filename):
+                raise
+            logging.warning(f"Cannot fetch {url}, using the local copy: {e.__repr__()}")
+            return filename, self.__read(filename)
+
+        if response.status_code == 304:
+            self.not_modified += 1
+            return filename, self.__read(filename)
+        response.raise_for_status()
+        self.downloaded += 1
+
+        content = response.content
+        # The file is kept for the next conditional request and for other tools
+        with open(filename, "wb") as f:
+            f.write(content)
+        meta = dict()
+        if "ETag" in response.headers:
+            meta["etag"] = response.headers["ETag"]
+        if "Last-Modified" in response.headers:
+            meta["last_modified"] = response.headers["Last-Modified"]
+        with open(f"{filename}.meta.json", "w") as f:
+            json.dump(meta, f)
+        return filename, content
+
+    def close(self) -> None:
+        self.session.close()
+
+    @staticmethod
+    def __read(filename: str) -> bytes:
+        with open(filename, "rb") as f:
+            return f.read()
+
+    @staticmethod
+    def __read_meta(filename: str) -> dict:
+        try:
+            with open(f"{filename}.meta.json") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return dict()
+
+
 def download_burst_list(select_year, select_month):
     """
     The burst list contains all (manually) detected radio bursts per
     month and year. This function gets the file from the server, if
-    necessary (i.e. not available or older than 6 hrs.)
+    it has changed since the last download.
     Parameters:
     int:year of the event
     int:month of the event
@@ -59,33 +231,9 @@ def download_burst_list(select_year, select_month):
     location of the file. This keeps the data for further
     processing with other tools if needed.
     """
-
-    # Check for valid date has been done in main
-    year, month, day = utils.timeutils.adjust_year_month_day(
-        select_year, select_month
-    )
-    filename = f"e-CALLISTO_{year}_{month}.txt"
-    if burstlist_exists(filename):
-        return filename
-    flare_list = requests.get(f"{BASE_URL}/{year}/{filename}")
-    with open(filename, "w") as f:
-        f.write(flare_list.content.decode("utf-8"))
+    fetcher = BurstListFetcher()
+    try:
+        filename, _ = fetcher.fetch(select_year, select_month)
+    finally:
+        fetcher.close()
     return filename
-
-
-def burstlist_exists(filename):
-    if not os.path.exists(filename):
-        return False
-
-    # Get creation time
-    f_stats = os.stat(filename)
-    b_time = datetime.datetime.fromtimestamp(f_stats.st_ctime)
-    now = datetime.datetime.now()
-
-    # if file is older than 6 hours then reload
-    age_hrs = (now-b_time).days*24 + (now-b_time).seconds/3600
-    if age_hrs >= 6:
-        return False
-
-    # No need to download the file
-    return True
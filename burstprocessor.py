@@ -9,8 +9,66 @@ import datetime
 import logging
 import os
 
+import pandas as pd
+
+import utils.background
 import utils.timeutils
-from Observation import RadioBurstObservation
+from dayloader import InstrumentDay
+from Observation import OUTPUT_FILES, RadioBurstObservation
+from utils import validation
+from utils.availability import AvailabilityIndex
+from utils.instrumentation import StageTimer
+from utils.validation import Screening
+
+# At most this many observations go to a worker as one task, see chunk_days
+CHUNK_OBSERVATIONS = 16
+
+# The event is extended by this amount on both sides
+EVENT_PADDING = datetime.timedelta(minutes=2)
+
+# Instruments that have to be looked up under other names in the archive
+INSTRUMENT_ALIASES = {
+    # MEXICO-LANCE has got 2 instruments
+    "MEXICO-LANCE": ["MEXICO-LANCE-A", "MEXICO-LANCE-B"],
+    # Instrument Malaysia Banting has changed name. Before 2022-07 it was
+    # written with an underscore '_'. After that there is a dash '-'.
+    "Malaysia_Banting": ["Malaysia_Banting", "Malaysia-Banting"],
+    "Malaysia-Banting": ["Malaysia-Banting", "Malaysia_Banting"],
+}
+
+PLAN_COLUMNS = ["event", "date", "time", "type", "instrument", "start", "end", "row_hash"]
+
+# Windows of one instrument closer than this are loaded together
+MERGE_GAP = datetime.timedelta(minutes=0)
+
+# Reasons for observations that are not written, besides the ones of
+# utils.validation
+LOAD_FAILED = "load failed"
+WRITE_FAILED = "write failed"
+
+# Observations not written for these reasons are tried again in the next
+# run. Some stations upload their data late. An invalid snr is mostly
+# caused by broken data, which may be repaired later.
+RETRY_REASONS = (LOAD_FAILED, WRITE_FAILED, validation.NO_DATA, validation.INVALID_SNR)
+
+# Merging stops at this length. Otherwise a busy day would end up in one
+# huge spectrogram.
+MAX_MERGED_SPAN = datetime.timedelta(hours=2)
+
+
+class ObservationGroup:
+    """
+    Observations of one instrument whose time windows overlap or touch each
+    other. Their data is loaded in one go.
+    """
+    def __init__(self, instrument: str, start: datetime.datetime, end: datetime.datetime) -> None:
+        self.instrument = instrument
+        self.start = start
+        self.end = end
+        self.observations = list()
+
+    def __repr__(self) -> str:
+        return f"{self.instrument} - {self.start} - {self.end} ({len(self.observations)} observations)"
 
 
 def prettify(spectro):
@@ -18,11 +76,275 @@ def prettify(spectro):
     Applies some error corrections to the spectrogram. Those shall make the
     spectrogram look nicer.
     """
-    return spectro.subtract_bg("constbacksub", "elimwrongchannels")
+    return utils.background.prettify(spectro)
     # return no_bg.subtract_bg("subtract_bg_sliding_window", window_width=800, affected_width=1,
     # amount=0.05, change_points=True).denoise()
 
 
+def plan_loads(observations: list, max_gap=MERGE_GAP, max_span=MAX_MERGED_SPAN) -> list:
+    """
+    Groups the observations by instrument and merges overlapping or adjacent
+    time windows. The windows are already padded and moved away from the
+    15 minutes boundaries by extract_radio_burst.
+
+    Returns: a list of ObservationGroup
+    """
+    by_instrument = dict()
+    for obs in observations:
+        by_instrument.setdefault(obs.instrument, list()).append(obs)
+
+    groups = list()
+    for instrument, instr_obs in by_instrument.items():
+        instr_obs.sort(key=lambda o: (o.event_time_start, o.event_time_end))
+        group = None
+        for obs in instr_obs:
+            if (group is not None
+                    and obs.event_time_start <= group.end + max_gap
+                    and max(group.end, obs.event_time_end) - group.start <= max_span):
+                group.end = max(group.end, obs.event_time_end)
+            else:
+                group = ObservationGroup(instrument, obs.event_time_start, obs.event_time_end)
+                groups.append(group)
+            group.observations.append(obs)
+    return groups
+
+
+def plan_days(observations: list, availability: AvailabilityIndex = None) -> list:
+    """
+    Groups the observations by instrument and day. Every group is processed
+    by one worker which decodes the data of that day only once.
+    If an availability index is given, the workers get the names of the
+    files they need and do not list the archive themselves.
+
+    Returns: a list of InstrumentDay, sorted by instrument and day
+    """
+    days = dict()
+    for obs in observations:
+        key = (obs.instrument, obs.event_time_start.date())
+        if key not in days:
+            days[key] = InstrumentDay(*key)
+            days[key].fits_cache = obs.fits_cache
+            if availability is not None:
+                days[key].known_files = list()
+        days[key].observations.append(obs)
+        if availability is not None:
+            known = days[key].known_files
+            known += [f for f in availability.file_names(obs.instrument, obs.event_time_start, obs.event_time_end)
+                      if f not in known]
+    return [days[key] for key in sorted(days)]
+
+
+def chunk_days(instrument_days, max_observations: int = CHUNK_OBSERVATIONS):
+    """
+    Groups consecutive instrument days of the same instrument. A group is
+    sent to a worker as one task. It holds at most max_observations
+    observations unless a single day has more.
+
+    Returns: an iterator over lists of InstrumentDay
+    """
+    chunk = list()
+    size = 0
+    for instrument_day in instrument_days:
+        if len(chunk) > 0 and (instrument_day.instrument != chunk[0].instrument
+                               or size + len(instrument_day.observations) > max_observations):
+            yield chunk
+            chunk = list()
+            size = 0
+        chunk.append(instrument_day)
+        size += len(instrument_day.observations)
+    if len(chunk) > 0:
+        yield chunk
+
+
+class DayChunk:
+    """
+    Instrument days of one instrument as a task of the worker pool. Only
+    the times of the observations are pickled, the worker creates the
+    observations again. The settings all observations share are stored once.
+    """
+    def __init__(self, instrument_days: list) -> None:
+        first = instrument_days[0]
+        self.instrument = first.instrument
+        self.archive_url = first.archive_url
+        self.fits_cache = first.fits_cache
+        self.fast_background = first.observations[0].fast_background
+        self.screening = first.observations[0].screening
+        self.output = first.observations[0].output
+        self.tensor_grid = first.observations[0].tensor_grid
+        self.days = [(d.day, d.known_files,
+                      [(o.event_time_start, o.event_time_end, o.radio_burst_type, o.row_hash) for o in d.observations])
+                     for d in instrument_days]
+
+    def __len__(self) -> int:
+        return sum(len(observations) for _, _, observations in self.days)
+
+    def instrument_days(self) -> list:
+        """
+        Returns: the InstrumentDay objects of the chunk, in their order
+        """
+        instrument_days = list()
+        for day, known_files, observations in self.days:
+            instrument_day = InstrumentDay(self.instrument, day)
+            instrument_day.archive_url = self.archive_url
+            instrument_day.fits_cache = self.fits_cache
+            instrument_day.known_files = known_files
+            for start, end, burst_type, row_hash in observations:
+                obs = RadioBurstObservation()
+                obs.instrument = self.instrument
+                obs.event_time_start = start
+                obs.event_time_end = end
+                obs.radio_burst_type = burst_type
+                obs.row_hash = row_hash
+                obs.fits_cache = self.fits_cache
+                obs.fast_background = self.fast_background
+                obs.screening = self.screening
+                obs.output = self.output
+                obs.tensor_grid = self.tensor_grid
+                instrument_day.observations.append(obs)
+            instrument_days.append(instrument_day)
+        return instrument_days
+
+
+def load_windows(instrument_day: InstrumentDay) -> list:
+    """
+    Returns: the (start, end) windows of data an instrument day needs
+    """
+    return [(g.start, g.end) for g in plan_loads(instrument_day.observations)]
+
+
+def write_instrument_day(instrument_day: InstrumentDay, connector=None) -> list:
+    """
+    Loads the data of an instrument for one day and writes every observation
+    of it. This function runs in the worker processes.
+
+    Returns: an ObservationResult for every observation
+    """
+    windows = load_windows(instrument_day)
+    load = StageTimer()
+    try:
+        with load.stage("load"):
+            instrument_day.load(windows)
+        failed = False
+    except BaseException:
+        logging.error(f"Cannot load data for {instrument_day}")
+        logging.error("Exception occurred", exc_info=True)
+        failed = True
+    # The observations of the day share the fetch and the load equally
+    n = len(instrument_day.observations)
+    fetch = instrument_day.fetch_seconds
+    for obs in instrument_day.observations:
+        obs.stages.add("fetch", fetch / n, instrument_day.loaded_bytes // n)
+        obs.stages.add("load", (load.seconds["load"] - fetch) / n, instrument_day.loaded_bytes // n)
+    if failed:
+        return [obs.result(LOAD_FAILED) for obs in instrument_day.observations]
+
+    results = list()
+    for obs in instrument_day.observations:
+        try:
+            with obs.stages.stage("slice"):
+                source = instrument_day.window(obs.event_time_start, obs.event_time_end)
+            rejection = obs.write_observation(connector, source=source)
+        except BaseException:
+            logging.error(f"While writing observation {obs}")
+            logging.error("Exception occurred", exc_info=True)
+            rejection = WRITE_FAILED
+        results.append(obs.result(rejection))
+        # The results go back to the main process, the data is not needed there
+        obs.spectrum = None
+    return results
+
+
+def plan_observations(burst_list: pd.DataFrame, availability: AvailabilityIndex = None) -> pd.DataFrame:
+    """
+    Turns the events of a burst list into the observation plan. This does the
+    same as extract_radio_burst but for the whole list at once.
+    The events whose time cannot be parsed are reported in the log.
+    With an availability index the e-Callisto rows are replaced by the
+    instruments that recorded data, and observations without data in the
+    archive are dropped.
+
+    Returns: A Pandas Dataframe with one row per event and instrument. The
+    columns are given by PLAN_COLUMNS. start and end are the padded
+    observation window.
+    """
+    events = burst_list.reset_index(drop=True)
+    dates = events['Date'].astype('string')
+
+    start, end, invalid = utils.timeutils.extract_and_correct_times(events['Time'], dates)
+    start = pd.Series(start, index=events.index)
+    end = pd.Series(end, index=events.index)
+    for _, event in events.loc[invalid].iterrows():
+        logging.error(f"Cannot parse time {event['Time']} of event on {event['Date']} - skipped")
+
+    # Keep clear of the 15 minutes boundaries of the FITS files
+    start = start - EVENT_PADDING
+    start = start.where(start.dt.minute % 15 != 0, start - datetime.timedelta(minutes=1))
+    end = end + EVENT_PADDING
+    end = end.where(end.dt.minute % 15 != 0, end + datetime.timedelta(minutes=1))
+    # The event lasts over midnight
+    end = end.where(end >= start, end + datetime.timedelta(days=1))
+
+    # Tells later runs whether the row in the burst list has changed
+    row_hash = pd.util.hash_pandas_object(events[['Date', 'Time', 'Type', 'Instruments']].astype('string'),
+                                          index=False).map(lambda h: f"{h:016x}")
+
+    valid = pd.DataFrame({
+        "event": events.index,
+        "date": dates,
+        "time": events['Time'],
+        "type": events['Type'].astype('string'),
+        "start": start,
+        "end": end,
+        "row_hash": row_hash,
+    }).loc[~invalid]
+
+    instruments = events.loc[~invalid, 'Instruments'].astype('string').str.split(",").explode().str.strip()
+    plan = valid.join(instruments.rename("instrument").to_frame(), how="inner")
+
+    aliases = pd.DataFrame([(name, alias) for name, alias_list in INSTRUMENT_ALIASES.items() for alias in alias_list],
+                           columns=["instrument", "alias"])
+    plan = plan.merge(aliases, on="instrument", how="left")
+    plan["instrument"] = plan["alias"].fillna(plan["instrument"])
+    if availability is not None:
+        plan = availability.expand_wildcards(plan)
+
+    # Instrument name "e-Callisto" means that there are too many stations
+    # to report or PI on vacation or out of office.
+    # Data from instruments marked with () or [] are either uncertain or
+    # messed up. We don't process them.
+    keep = (plan["instrument"].notna()
+            & (plan["instrument"] != "")
+            & (plan["instrument"] != "e-Callisto")
+            & ~plan["instrument"].str.match(r"[\(\[]", na=False))
+    plan = plan.loc[keep, PLAN_COLUMNS].drop_duplicates(["event", "instrument"])
+    if availability is not None:
+        plan = availability.filter_plan(plan)
+    return plan.reset_index(drop=True)
+
+
+def observations_from_plan(plan: pd.DataFrame, fits_cache=None, fast_background: bool = False,
+                           screening: Screening = None, output: str = OUTPUT_FILES,
+                           tensor_grid: tuple = None) -> list:
+    """
+    Creates a RadioBurstObservation for every row of an observation plan
+    """
+    observation_list = list()
+    for row in plan.itertuples(index=False):
+        obs = RadioBurstObservation()
+        obs.instrument = row.instrument
+        obs.event_time_start = row.start.to_pydatetime()
+        obs.event_time_end = row.end.to_pydatetime()
+        obs.radio_burst_type = str(row.type)
+        obs.fits_cache = fits_cache
+        obs.fast_background = fast_background
+        obs.screening = screening
+        obs.row_hash = row.row_hash
+        obs.output = output
+        obs.tensor_grid = tensor_grid
+        observation_list.append(obs)
+    return observation_list
+
+
 def extract_radio_burst(event, connector=None) -> list:
     # There may be a typo in the event time. If so the time cannot be parsed.
     # We raise an exception, report it in the log an return without processing.
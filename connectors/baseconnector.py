@@ -1,3 +1,5 @@
+import os
+import posixpath
 from abc import ABC, abstractmethod
 
 
@@ -12,6 +14,32 @@ class BaseConnector(ABC):
     project: Raumschiff
     """
     def __init__(self) -> None:
+        # Directories known to exist. Answers make_dir and check_dir_exists
+        # without asking the file system again.
+        self.known_dirs = set()
+
+    @staticmethod
+    def normalize_dir(dir_name: str) -> str:
+        dir_name = posixpath.normpath(str(dir_name).replace("\\", "/"))
+        return dir_name if dir_name == "/" else dir_name.rstrip("/")
+
+    def is_known_dir(self, dir_name: str) -> bool:
+        return self.normalize_dir(dir_name) in self.known_dirs
+
+    def add_known_dir(self, dir_name: str) -> None:
+        """
+        Remembers a directory and all its parents
+        """
+        dir_name = self.normalize_dir(dir_name)
+        while dir_name not in ("", ".", "/"):
+            self.known_dirs.add(dir_name)
+            dir_name = posixpath.dirname(dir_name)
+
+    def load_known_dirs(self) -> None:
+        """
+        Fills the known directories in bulk, i.e. with one listing of the
+        base directory. Connectors that can do it override this method.
+        """
         pass
 
     @abstractmethod
@@ -23,9 +51,32 @@ class BaseConnector(ABC):
         pass
 
     @abstractmethod
-    def put_file(self, file_name: str, local_file_name: str = None, overwrite: bool = False):
+    def put_file(self, remote_name: str = None, local_name=None, overwrite: bool = False):
+        """
+        local_name is the path of a local file, bytes or a binary file-like
+        object. The latter two never touch the local disk.
+        """
         pass
 
+    @staticmethod
+    def is_local_file(source) -> bool:
+        """
+        True if the source given to put_file is the path of a local file
+        """
+        return isinstance(source, (str, os.PathLike))
+
+    @staticmethod
+    def read_source(source) -> bytes:
+        """
+        Returns the content of a source given to put_file
+        """
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            return bytes(source)
+        if BaseConnector.is_local_file(source):
+            with open(source, "rb") as f:
+                return f.read()
+        return source.read()
+
     @abstractmethod
     def make_dir(self, dir_name: str):
         pass
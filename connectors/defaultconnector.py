@@ -15,6 +15,7 @@ class DefaultConnector(BaseConnector):
     """
 
     def __init__(self) -> None:
+        super().__init__()
         self.base_dir = ""
 
     def list_dir(self, dir_name: str = None) -> list:
@@ -34,7 +35,7 @@ class DefaultConnector(BaseConnector):
                 raise FileNotFoundError
             shutil.copy(local_file_name, file_name)
 
-    def put_file(self, remote_name: str = None, local_name: str = None, overwrite: bool = False):
+    def put_file(self, remote_name: str = None, local_name=None, overwrite: bool = False):
         """
         Puts the file with on the file system with name file_name . Raises an exception if
         the file cannot be written.
@@ -42,9 +43,15 @@ class DefaultConnector(BaseConnector):
         already exists on the file system. If local_name is given, then the
         file is copied to the new location. The original file is unchanged.
         For local file systems this method works the same as get_file.
+        local_name may also be bytes or a file-like object. Their content is
+        written to the new location.
         """
         path = os.path.join(self.base_dir, remote_name)
-        self.get_file(path, local_name)
+        if local_name is None or self.is_local_file(local_name):
+            self.get_file(path, local_name)
+            return
+        with open(path, "wb") as f:
+            f.write(self.read_source(local_name))
 
     def make_dir(self, dir_name: str):
         """
@@ -53,13 +60,30 @@ class DefaultConnector(BaseConnector):
         if self.check_dir_exists(dir_name):
             return
         os.makedirs(dir_name)
+        self.add_known_dir(dir_name)
 
     def check_dir_exists(self, dir_name: str) -> bool:
+        if self.is_known_dir(dir_name):
+            return True
         subdir = Path(dir_name)
+        if subdir.is_dir():
+            self.add_known_dir(dir_name)
+            return True
         if subdir.exists():
             return True
         return False
 
+    def load_known_dirs(self) -> None:
+        """
+        Remembers the base directory and its direct sub directories
+        """
+        if not self.base_dir or not os.path.isdir(self.base_dir):
+            return
+        self.add_known_dir(self.base_dir)
+        for entry in os.scandir(self.base_dir):
+            if entry.is_dir():
+                self.add_known_dir(os.path.join(self.base_dir, entry.name))
+
 
 if __name__ == "__main__":
     con = DefaultConnector()
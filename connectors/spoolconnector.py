@@ -0,0 +1,32 @@
+from connectors.baseconnector import BaseConnector
+
+
+class SpoolConnector:
+    """
+    Used by the worker processes instead of the real connector. The content
+    of the files is kept in memory and handed to the main process, which
+    uploads it with an UploadQueue.
+    The spool only takes files, so it has put_file but not the rest of
+    BaseConnector. The directories are made by the main process.
+    version 2.0
+    author: Andreas Wassmer
+    project: Raumschiff
+    """
+
+    def __init__(self) -> None:
+        self.__pending = list()
+
+    def put_file(self, remote_name: str = None, local_name=None, overwrite: bool = False):
+        """
+        Keeps the content of the file and remembers where it has to go
+        """
+        self.__pending.append((remote_name, BaseConnector.read_source(local_name), overwrite))
+
+    def take(self) -> list:
+        """
+        Returns the spooled files as (remote name, content, overwrite) and
+        empties the list
+        """
+        pending = self.__pending
+        self.__pending = list()
+        return pending
@@ -0,0 +1,84 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+
+class UploadQueue:
+    """
+    Uploads files through a connector with a fixed number of threads, so the
+    upload latency overlaps with the processing of the next observations.
+    At most max_pending uploads may wait in the queue. put_file blocks once
+    the limit is reached, which slows down the producer (back-pressure).
+    version 1.0
+    author: Andreas Wassmer
+    project: Raumschiff
+    """
+    def __init__(self, connector, concurrency: int = 4, max_pending: int = 16) -> None:
+        self.connector = connector
+        self.uploaded = 0
+        self.failed = list()
+        # (remote name, seconds, bytes) of every finished upload
+        self.timings = list()
+        self.__executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="upload")
+        self.__slots = threading.BoundedSemaphore(max_pending)
+        self.__lock = threading.Lock()
+        self.__futures = set()
+
+    def put_file(self, remote_name: str = None, local_name=None, overwrite: bool = False,
+                 remove_local: bool = False):
+        """
+        Queues the upload of a local file or of bytes. Blocks while the queue
+        is full. If remove_local is True the local file is deleted after the
+        upload.
+        """
+        self.__slots.acquire()
+        future = self.__executor.submit(self.__upload, remote_name, local_name, overwrite, remove_local)
+        with self.__lock:
+            self.__futures.add(future)
+        future.add_done_callback(self.__done)
+        return future
+
+    def __upload(self, remote_name, local_name, overwrite, remove_local):
+        begin = time.perf_counter()
+        try:
+            self.connector.put_file(remote_name=remote_name, local_name=local_name, overwrite=overwrite)
+            if isinstance(local_name, bytes):
+                size = len(local_name)
+            elif self.connector.is_local_file(local_name) and os.path.exists(local_name):
+                size = os.path.getsize(local_name)
+            else:
+                size = 0
+            with self.__lock:
+                self.timings.append((remote_name, time.perf_counter() - begin, size))
+        finally:
+            if remove_local and self.connector.is_local_file(local_name) and os.path.exists(local_name):
+                os.unlink(local_name)
+        return remote_name
+
+    def __done(self, future):
+        with self.__lock:
+            self.__futures.discard(future)
+            if future.exception() is not None:
+                self.failed.append(future)
+                logging.error(f"Upload failed: {future.exception().__repr__()}")
+            else:
+                self.uploaded += 1
+        self.__slots.release()
+
+    def join(self) -> list:
+        """
+        Waits for all queued uploads.
+
+        Returns: the futures of the failed uploads
+        """
+        with self.__lock:
+            futures = list(self.__futures)
+        wait(futures)
+        return self.failed
+
+    def close(self) -> list:
+        failed = self.join()
+        self.__executor.shutdown(wait=True)
+        return failed
@@ -2,6 +2,7 @@ import os
 
 from dotenv import load_dotenv
 from webdav3.client import Client, RemoteResourceNotFound
+from webdav3.urn import Urn
 
 from connectors.baseconnector import BaseConnector
 
@@ -15,6 +16,7 @@ class WebdavConnector (BaseConnector):
     project: Raumschiff
     """
     def __init__(self) -> None:
+        super().__init__()
         load_dotenv()
         options = {
             'webdav_hostname': os.environ.get('HOST_URL'),
@@ -56,14 +58,25 @@ class WebdavConnector (BaseConnector):
         Arguments:
         remote_name: full path of file on the server
         local_name: name of the file to upload. Add path if necessary.
+                    Bytes or a file-like object are uploaded from memory.
+        The parent folder is made with make_dir, so a known folder costs no
+        request. The PUT is sent directly, the upload methods of the client
+        would ask the server for the parent folder every time.
         """
         assert remote_name is not None
         assert local_name is not None
 
         path = os.path.join(self.base_dir, remote_name)
-        # only write the file if it doesn't exist
-        if not self.client.check(path) or overwrite:
-            self.client.upload_sync(remote_path=path, local_path=local_name)
+        # only write the file if it doesn't exist. No need to ask the
+        # server if the file is overwritten anyway.
+        if overwrite or not self.client.check(path):
+            self.make_dir(os.path.dirname(path))
+            if self.is_local_file(local_name):
+                with open(local_name, "rb") as f:
+                    self.client.execute_request(action="upload", path=Urn(path).quote(), data=f)
+            else:
+                self.client.execute_request(action="upload", path=Urn(path).quote(),
+                                            data=self.read_source(local_name))
 
     def put_file_async(self, remote_name=None, local_name=None, callback=None):
         """
@@ -83,13 +96,19 @@ class WebdavConnector (BaseConnector):
     def make_dir(self, dir_name) -> bool:
         """
         Creates a directory in the webdav server.
-        Does nothing if folder already exists
+        Does nothing if folder already exists. Known folders don't cost a
+        request to the server.
         Arguments:
         dir_name: name of the folder
         Return:
         True if successful, False otherwise
         """
-        return self.client.mkdir(dir_name)
+        if self.is_known_dir(dir_name):
+            return True
+        created = self.client.mkdir(dir_name)
+        if created:
+            self.add_known_dir(dir_name)
+        return created
 
     def check_dir_exists(self, dir_name):
         """
@@ -97,12 +116,32 @@ class WebdavConnector (BaseConnector):
         Arguments:
         dir_name: name of the folder to check.
         """
+        if self.is_known_dir(dir_name):
+            return True
         try:
             self.client.info(dir_name)
+            self.add_known_dir(dir_name)
             return True
         except RemoteResourceNotFound:
             return False
 
+    def load_known_dirs(self) -> None:
+        """
+        Lists the base directory once and remembers all folders in it
+        """
+        if not self.base_dir:
+            return
+        try:
+            entries = self.client.list(self.base_dir, get_info=True)
+        except RemoteResourceNotFound:
+            return
+        self.add_known_dir(self.base_dir)
+        for entry in entries:
+            if entry.get("isdir"):
+                # The path of the entry contains the prefix of the server url
+                name = os.path.basename(entry["path"].rstrip("/"))
+                self.add_known_dir(os.path.join(self.base_dir, name))
+
 
 if __name__ == "__main__":
     con = WebdavConnector()
@@ -0,0 +1,232 @@
+"""
+Loads the data of one instrument for one day. Every FITS file is decoded
+only once and all observations of that day are served from it.
+version 1.0
+author: Andreas Wassmer
+project: Raumschiff
+"""
+import datetime
+import gzip
+import io
+import logging
+import os
+import time
+import urllib.request
+from collections import defaultdict
+
+import numpy as np
+from radiospectra.sources import CallistoSpectrogram
+
+from utils.fitscache import (DEFAULT_ARCHIVE_URL, archive_file_url,
+                             archive_files, is_remote)
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+class _FrequencySetup:
+    """
+    The data of the files of one load window that share the same frequency
+    channels, placed in one contiguous float32 array. Time gaps between
+    files are filled with the last time step before the gap, as
+    radiospectra's JOIN_REPEAT does. recorded holds the (x0, x1) ranges
+    that came from a file.
+    """
+    def __init__(self, freq_axis, t_delt, start, n_samples, first) -> None:
+        self.freq_axis = freq_axis
+        self.t_delt = t_delt
+        self.start = start
+        self.data = np.empty((len(freq_axis), n_samples), dtype=np.float32)
+        self.recorded = list()
+        self.filled_to = 0
+        self.time_axis = np.arange(n_samples) * t_delt
+        self.header = first.header
+        self.axes_header = first.axes_header
+        self.t_label = first.t_label
+        self.f_label = first.f_label
+        self.content = first.content
+        self.swapped = first.swapped
+
+    def x_of(self, time: datetime.datetime) -> int:
+        return int((time - self.start).total_seconds() / self.t_delt)
+
+    def covers(self, start: datetime.datetime, end: datetime.datetime) -> bool:
+        x0, x1 = self.x_of(start), self.x_of(end)
+        return any(x0 < r1 and x1 > r0 for r0, r1 in self.recorded)
+
+    def place(self, spec: CallistoSpectrogram) -> None:
+        """
+        Copies the data of a file into the array. The files must be placed
+        in the order of their start.
+        """
+        x0 = int(round((spec.start - self.start).total_seconds() / self.t_delt))
+        width = min(spec.shape[1], self.data.shape[1] - x0)
+        if x0 > self.filled_to > 0:
+            self.data[:, self.filled_to:x0] = self.data[:, self.filled_to - 1, np.newaxis]
+        self.data[:, x0:x0 + width] = spec.data[:, :width]
+        self.recorded.append((x0, x0 + width))
+        self.filled_to = max(self.filled_to, x0 + width)
+
+
+def _end_of(spec: CallistoSpectrogram) -> datetime.datetime:
+    return spec.start + datetime.timedelta(seconds=spec.shape[1] * spec.t_delt)
+
+
+def _blocks(specs: list, windows: list) -> list:
+    """
+    Groups the files of a frequency setup by the (start, end) windows they
+    overlap. Windows that share a file go into the same group. Files
+    outside of all windows are left out.
+
+    Returns: the groups, each sorted by the start of its files
+    """
+    spans = list()
+    for start, end in windows:
+        files = [s for s in specs if s.start < end and _end_of(s) > start]
+        if len(files) > 0:
+            spans.append([min(s.start for s in files), max(_end_of(s) for s in files)])
+    spans.sort()
+    merged = list()
+    for span in spans:
+        if len(merged) > 0 and span[0] < merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], span[1])
+        else:
+            merged.append(span)
+    return [sorted((s for s in specs if s.start < end and _end_of(s) > start), key=lambda s: s.start)
+            for start, end in merged]
+
+
+class InstrumentDay:
+    """
+    All observations of one instrument on one day together with the data
+    they need. load() reads the files covering the observations and
+    window() returns the spectrogram of an observation as a view into
+    the loaded data, i.e. without copying it.
+    """
+    def __init__(self, instrument: str, day: datetime.date) -> None:
+        self.instrument = instrument
+        self.day = day
+        self.observations = list()
+        self.fits_cache = None
+        self.archive_url = DEFAULT_ARCHIVE_URL
+        # The files of the observations if the planner knows them already
+        self.known_files = None
+        # Size of the files read by load() and the time it took to get
+        # them from the cache or the archive, before decoding
+        self.loaded_bytes = 0
+        self.fetch_seconds = 0.0
+        self.__setups = list()
+
+    def file_names(self, windows: list) -> list:
+        """
+        Returns the names of the archive files that overlap with the
+        (start, end) windows
+        """
+        if self.known_files is not None:
+            return list(self.known_files)
+        names = list()
+        for start, end in windows:
+            if self.fits_cache is not None:
+                files = self.fits_cache.files_for_range(self.instrument, start, end)
+            else:
+                files = archive_files(self.archive_url, self.instrument, start, end)
+            names += [f for f in files if f not in names]
+        return names
+
+    def __read(self, filename: str) -> CallistoSpectrogram:
+        begin = time.perf_counter()
+        if self.fits_cache is not None:
+            source = self.fits_cache.fetch(filename)
+            self.loaded_bytes += os.path.getsize(source)
+        else:
+            # The file is read into memory first, so the download is timed
+            # apart from the decoding
+            url = archive_file_url(self.archive_url, filename)
+            if is_remote(self.archive_url):
+                with urllib.request.urlopen(url) as resp:
+                    content = resp.read()
+            else:
+                with open(url, "rb") as f:
+                    content = f.read()
+            self.loaded_bytes += len(content)
+        self.fetch_seconds += time.perf_counter() - begin
+        if self.fits_cache is None:
+            # astropy does not recognize gzip in a file object by itself
+            if content[:2] == GZIP_MAGIC:
+                content = gzip.decompress(content)
+            source = io.BytesIO(content)
+        return CallistoSpectrogram.read(source)
+
+    def load(self, windows: list) -> None:
+        """
+        Decodes every file that overlaps with one of the (start, end)
+        windows once
+        """
+        specs = [self.__read(f) for f in self.file_names(windows)]
+        if len(specs) == 0:
+            raise ValueError("No data found.")
+
+        buckets = defaultdict(list)
+        for spec in specs:
+            buckets[tuple(spec.freq_axis)].append(spec)
+
+        # One array per frequency setup and load window. The hours between
+        # the windows are never allocated.
+        self.__setups = list()
+        for bucket in buckets.values():
+            for block in _blocks(bucket, windows):
+                t_delt = min(s.t_delt for s in block)
+                start = block[0].start
+                end = max(_end_of(s) for s in block)
+                n_samples = int(round((end - start).total_seconds() / t_delt))
+                setup = _FrequencySetup(np.asarray(block[0].freq_axis), t_delt, start, n_samples, block[0])
+                for spec in block:
+                    if spec.t_delt != t_delt:
+                        spec = spec.resample_time(t_delt)
+                    setup.place(spec)
+                self.__setups.append(setup)
+        logging.debug(f"Loaded {len(specs)} file(s) for {self.instrument} on {self.day}")
+
+    def window(self, start: datetime.datetime, end: datetime.datetime) -> CallistoSpectrogram:
+        """
+        Returns the spectrogram for [start, end). If the instrument recorded
+        with a single frequency setup, the data is a view into the day array.
+        """
+        specs = [self.__view(s, start, end) for s in self.__setups if s.covers(start, end)]
+        if len(specs) == 0:
+            raise ValueError("No data found.")
+        if len(specs) == 1:
+            return specs[0]
+        return CallistoSpectrogram.combine_frequencies(specs)
+
+    def __view(self, setup: _FrequencySetup, start: datetime.datetime, end: datetime.datetime) -> CallistoSpectrogram:
+        x0 = max(setup.x_of(start), 0)
+        x1 = min(setup.x_of(end), setup.data.shape[1])
+        view_start = setup.start + datetime.timedelta(seconds=x0 * setup.t_delt)
+        view_end = setup.start + datetime.timedelta(seconds=x1 * setup.t_delt)
+        midnight = datetime.datetime(view_start.year, view_start.month, view_start.day)
+
+        header = setup.header.copy()
+        header["DATE-OBS"] = view_start.strftime("%Y/%m/%d")
+        header["TIME-OBS"] = view_start.strftime("%H:%M:%S.%f")[:-3]
+        header["DATE-END"] = view_end.strftime("%Y/%m/%d")
+        header["TIME-END"] = view_end.strftime("%H:%M:%S.%f")[:-3]
+
+        return CallistoSpectrogram(
+            setup.data[:, x0:x1],
+            setup.time_axis[x0:x1] - setup.time_axis[x0],
+            setup.freq_axis,
+            view_start,
+            view_end,
+            (view_start - midnight).total_seconds(),
+            setup.t_delt,
+            setup.t_label,
+            setup.f_label,
+            setup.content,
+            {self.instrument},
+            header,
+            setup.axes_header,
+            setup.swapped,
+        )
+
+    def __repr__(self) -> str:
+        return f"{self.instrument} - {self.day} ({len(self.observations)} observations)"
@@ -6,31 +6,84 @@ project: Raumschiff
 """
 import datetime
 import logging
-import multiprocessing
 import os
-from concurrent.futures import (ALL_COMPLETED,
+from collections import Counter
+from concurrent.futures import (ALL_COMPLETED, FIRST_COMPLETED,
                                 ProcessPoolExecutor, wait)
 
+import pandas as pd
 import typer
 from radiospectra import __version__
 
 import burstlist
 import burstprocessor
+import manifest
+import scheduler
 import utils.timeutils
+import worker
+from burstprocessor import DayChunk
 from connectors import defaultconnector, webdavconnector
+from connectors.spoolconnector import SpoolConnector
+from connectors.uploadqueue import UploadQueue
+from manifest import Manifest
+from Observation import OUTPUT_DATASET, OUTPUT_FILES
+from prefetcher import Prefetcher
+from scheduler import MemoryScheduler
+from utils.availability import AvailabilityIndex
+from utils.dataset import MonthlyStores
+from utils.fitscache import FitsCache
+from utils.instrumentation import RunReport
+from utils.tensorexport import TensorStore, parse_grid
+from utils.validation import Screening
 
+# Directory of the monthly HDF5 files on the server
+DATASET_DIR = "datasets"
 
-def main(year: int = typer.Option(..., help="Observation year"),
-         month: int = typer.Option(..., help="Obervation month"),
+
+def main(year: int = typer.Option(0, help="Observation year"),
+         month: int = typer.Option(0, help="Obervation month"),
          day: int = typer.Option(0, help="Observation day"),
+         start: str = typer.Option("", help="First year, month or day to process (2020, 2020-03 or 2020-03-14). Replaces --year, --month and --day."),
+         end: str = typer.Option("", help="Last year, month or day to process. If not given, the period of --start is processed."),
          type: str = typer.Option("all", help="The burst type to process (I to V). If not given, all types are processed."),
-         remote: bool = typer.Option(False, help="Write files to raumschiff server.\nNeeds credentials for server access.")
+         remote: bool = typer.Option(False, help="Write files to raumschiff server.\nNeeds credentials for server access."),
+         cache_dir: str = typer.Option("", help="Directory to cache the e-Callisto FITS files in. No caching if not given."),
+         cache_size: int = typer.Option(20, help="Size limit of the FITS cache in GB"),
+         prefetch: int = typer.Option(8, help="Number of concurrent downloads into the FITS cache ahead of the workers. 0 to let the workers download."),
+         uploads: int = typer.Option(4, help="Number of concurrent uploads"),
+         upload_queue: int = typer.Option(16, help="Number of files that may wait for the upload"),
+         fast_bg: bool = typer.Option(False, help="Use the fast background subtraction instead of radiospectra's"),
+         screen: bool = typer.Option(True, help="Drop observations without a burst before plotting and uploading"),
+         min_snr: float = typer.Option(0.0, help="Observations with a lower snr are dropped by the screening"),
+         manifest_file: str = typer.Option("manifest.sqlite", "--manifest", help="Remembers the observations already produced. Empty to process everything."),
+         force: bool = typer.Option(False, help="Process all observations, even those in the manifest"),
+         availability_file: str = typer.Option("availability.sqlite", "--availability", help="Index of the files in the archive. Empty to ask the archive in every worker."),
+         report_file: str = typer.Option("", "--report", help="Write the run report to this file, .json or .csv. Default: logs/report_<time>.json"),
+         profile: bool = typer.Option(False, help="Write cProfile statistics of every worker to logs/profile_<pid>.prof"),
+         workers: int = typer.Option(0, help="Number of worker processes. 0 picks a number from the cores and the memory."),
+         memory_limit: float = typer.Option(0, "--memory", help="Memory in GB the tasks in flight may use. 0 takes a share of the free memory."),
+         max_tasks_per_child: int = typer.Option(scheduler.MAX_TASKS_PER_CHILD, help="Replace a worker after this many tasks. 0 keeps the workers."),
+         chunk: int = typer.Option(burstprocessor.CHUNK_OBSERVATIONS, help="Number of observations of an instrument sent to a worker as one task"),
+         output: str = typer.Option(OUTPUT_FILES, help="files: a .jpg and a .fit.gz per burst. dataset: one HDF5 file per month."),
+         dataset_dir: str = typer.Option(DATASET_DIR, help="Directory of the HDF5 files with --output dataset"),
+         compression: str = typer.Option("gzip", help="Compression of the HDF5 files: gzip, lzf or none. Only uncompressed bursts can be memory mapped."),
+         tensor_dir: str = typer.Option("", help="Export every burst resampled onto --grid for the classifier to this directory. No export if not given."),
+         grid: str = typer.Option("256x512", help="Frequencies x times of the exported tensors")
          ):
 
     print(f"\n Radiospectra version = {__version__}\n")
 
-    utils.timeutils.check_valid_date(year, month, day)
-    year, m, d = utils.timeutils.adjust_year_month_day(year, month, day)
+    first, last = date_range(year, month, day, start, end)
+    if output not in (OUTPUT_FILES, OUTPUT_DATASET):
+        raise typer.BadParameter(f"Unknown output {output}, use {OUTPUT_FILES} or {OUTPUT_DATASET}")
+    if compression not in ("gzip", "lzf", "none"):
+        raise typer.BadParameter(f"Unknown compression {compression}, use gzip, lzf or none")
+    tensor_grid = None
+    if tensor_dir:
+        try:
+            tensor_grid = parse_grid(grid)
+        except ValueError as e:
+            raise typer.BadParameter(str(e))
 
     if not os.path.isdir("logs"):
         os.mkdir("logs")
@@ -44,28 +97,266 @@ def main(year: int = typer.Option(..., help="Observation year"),
     else:
         connector = defaultconnector.DefaultConnector()
         connector.base_dir = BASE_DIR
+    # One listing instead of a request per make_dir
+    connector.load_known_dirs()
 
     logging.info(f"===== Start {datetime.datetime.now().strftime('%y-%m-%d %H:%M:%S')} =====\n")
-    logging.info(f"----- Processing data for {year}-{m} -----\n")
+    logging.info(f"----- Processing data from {first} to {last} -----\n")
 
-    filename = f"e-CALLISTO_{year}_{m}.txt"
-    filename = burstlist.download_burst_list(year, month)
-
-    pref_date = None
-    if day > 0:
-        pref_date = f"{year}{m}{d}"
+    # All months are planned up front and go through one worker pool
+    burst_list = burstlist.process_burst_range(first, last)
+    availability = None
+    if availability_file:
+        availability = AvailabilityIndex(availability_file)
+    plan = extract_bursts(burst_list, type, connector=connector, availability=availability)
+    fits_cache = None
+    if cache_dir:
+        fits_cache = FitsCache(cache_dir, max_bytes=cache_size * 1024**3)
+    run_manifest = None
+    if manifest_file:
+        run_manifest = Manifest(manifest_file)
+        if not force:
+            total = len(plan)
+            plan = run_manifest.pending(plan)
+            logging.info(f"{total - len(plan)} observation(s) are in the manifest already, {len(plan)} to process")
+    screening = None
+    if screen:
+        screening = Screening(min_snr=min_snr, fast_background=fast_bg)
+    observations = burstprocessor.observations_from_plan(plan, fits_cache=fits_cache, fast_background=fast_bg,
+                                                         screening=screening, output=output,
+                                                         tensor_grid=tensor_grid)
 
-    burst_list = burstlist.process_burst_list(filename, date=pref_date)
-    observations = extract_bursts(burst_list, type, connector=connector)
     if len(observations) > 0:
-        with ProcessPoolExecutor(max_workers=multiprocessing.cpu_count()-2) as executor:
-            results = [executor.submit(obs.write_observation, connector) for obs in observations]
-            wait(results, return_when=ALL_COMPLETED)
+        # All observations of an instrument on one day go to the same worker
+        days = burstprocessor.plan_days(observations, availability)
+        logging.info(f"Processing {len(observations)} observation(s) in {len(days)} instrument day(s)")
+        uploader = UploadQueue(connector, concurrency=uploads, max_pending=upload_queue)
+        prefetcher = None
+        if fits_cache is not None and prefetch > 0:
+            prefetcher = Prefetcher(fits_cache, concurrency=prefetch)
+        report = RunReport()
+        memory = MemoryScheduler(scheduler.memory_budget(memory_limit))
+        max_workers = workers if workers > 0 else scheduler.worker_count(memory.budget)
+        logging.info(f"{max_workers} worker(s), memory budget {scheduler.format_bytes(memory.budget)}")
+        stores = None
+        if output == OUTPUT_DATASET:
+            stores = MonthlyStores(dataset_dir, compression=None if compression == "none" else compression,
+                                   connector=connector if remote else None, remote_dir=DATASET_DIR)
+        tensors = None
+        if tensor_grid is not None:
+            tensors = TensorStore(tensor_dir, tensor_grid)
+        rejections = process_in_pool(days, uploader, run_manifest, prefetcher, report, profile,
+                                     memory, max_workers, max_tasks_per_child, chunk, stores, tensors)
+        if tensors is not None:
+            logging.info(f"Exported {len(tensors)} tensor(s) to {tensors.close()}")
+        if prefetcher is not None:
+            prefetcher.close()
+            logging.info(f"Prefetched {prefetcher.fetched} file(s), {prefetcher.failed} instrument day(s) failed")
+            report.add_run_stage("prefetch", prefetcher.seconds, prefetcher.bytes)
+        # Wait for all uploads before we finish
+        failed = uploader.close()
+        logging.info(f"Uploaded {uploader.uploaded} file(s), {len(failed)} upload(s) failed")
+        for reason, count in rejections.most_common():
+            logging.info(f"Not written ({reason}): {count} observation(s)")
+        for remote_name, seconds, size in uploader.timings:
+            report.add_upload(remote_name, seconds, size)
+        if not report_file:
+            report_file = os.path.join("logs", f"report_{datetime.datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+        report.write(report_file)
+        summary = report.summary()
+        for stage, totals in summary["stages"].items():
+            logging.info(f"{stage}: {totals['seconds']:.1f} s, {totals['bytes'] / 1024**2:.1f} MB")
+        logging.info(f"Run report written to {report_file}")
+    if run_manifest is not None:
+        run_manifest.close()
+    if availability is not None:
+        availability.close()
 
     logging.info(f"===== End {datetime.datetime.now().strftime('%y-%m-%d %H:%M:%S')} =====\n")
 
 
-def extract_bursts(burst_list, chosen_type: str, connector=None):
+def date_range(year: int, month: int, day: int, start: str, end: str) -> tuple:
+    """
+    Returns: the first and the last day to process, either given by --start
+    and --end or by --year, --month and --day
+    """
+    if start:
+        try:
+            first = utils.timeutils.parse_date_bound(start)
+            last = utils.timeutils.parse_date_bound(end or start, last=True)
+        except ValueError as e:
+            raise typer.BadParameter(str(e))
+        last = min(last, datetime.date.today())
+        if last < first:
+            raise typer.BadParameter(f"The range from {start} to {end} is empty")
+        return first, last
+
+    if year == 0 or month == 0:
+        raise typer.BadParameter("Either --year and --month or --start must be given")
+    utils.timeutils.check_valid_date(year, month, day)
+    if day > 0:
+        first = last = datetime.date(year, month, day)
+    else:
+        first = utils.timeutils.parse_date_bound(f"{year}-{month}")
+        last = utils.timeutils.parse_date_bound(f"{year}-{month}", last=True)
+    return first, last
+
+
+def process_in_pool(tasks: list, upload_queue: UploadQueue, run_manifest: Manifest = None,
+                    prefetcher: Prefetcher = None, report: RunReport = None, profile: bool = False,
+                    memory: MemoryScheduler = None, max_workers: int = 1,
+                    max_tasks_per_child: int = scheduler.MAX_TASKS_PER_CHILD,
+                    chunk_size: int = burstprocessor.CHUNK_OBSERVATIONS,
+                    stores: MonthlyStores = None, tensors: TensorStore = None) -> Counter:
+    """
+    Processes the instrument days in the worker pool. The workers hand their
+    files over to the upload queue of the main process. If the uploads fall
+    behind, the queue blocks and no further tasks are submitted until there
+    is room again. The outcome of every observation goes to the manifest,
+    the written ones as soon as their uploads are finished.
+    With a prefetcher a task is submitted once its files are in the cache,
+    so the workers only read local files.
+    The stage timers of the observations go to the report.
+    A task is only submitted if its estimated memory fits into the budget
+    of the scheduler next to the tasks in flight. The workers are replaced
+    after max_tasks_per_child tasks.
+    The instrument days of an instrument go to a worker in chunks of about
+    chunk_size observations. The days of a chunk are loaded one after the
+    other, so the memory of a chunk is that of its largest day.
+    With stores the spectrograms the workers return are appended to the
+    monthly HDF5 files instead of being uploaded. The files are uploaded
+    once all tasks are finished, their observations are recorded with the
+    upload of their file.
+    With tensors the resampled spectrograms are appended to the tensor export.
+
+    Returns: the number of observations not written by reason
+    """
+    rejections = Counter()
+    uploading = list()
+    if memory is None:
+        memory = MemoryScheduler(scheduler.memory_budget())
+    max_in_flight = 2 * max_workers
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=worker.init_worker,
+                             initargs=(SpoolConnector(), "logs", profile, worker.root_log_file()),
+                             **scheduler.pool_options(max_tasks_per_child)) as executor:
+        # future -> estimated bytes of the task
+        running = dict()
+        if prefetcher is not None:
+            tasks = prefetcher.ready(tasks, look_ahead=max_in_flight)
+        for chunk in burstprocessor.chunk_days(tasks, chunk_size):
+            estimate = max(memory.estimate(task) for task in chunk)
+            while len(running) >= max_in_flight or not memory.fits(estimate):
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    memory.release(running.pop(future))
+                queue_uploads(done, upload_queue, rejections, uploading, run_manifest, report, stores, tensors)
+                uploading = record_uploaded(uploading, run_manifest)
+            memory.acquire(estimate)
+            running[executor.submit(worker.process_chunk, DayChunk(chunk))] = estimate
+        done, _ = wait(running, return_when=ALL_COMPLETED)
+        for future in done:
+            memory.release(running.pop(future))
+        queue_uploads(done, upload_queue, rejections, uploading, run_manifest, report, stores, tensors)
+    if stores is not None:
+        upload_datasets(stores, upload_queue, uploading)
+    upload_queue.join()
+    record_uploaded(uploading, run_manifest)
+    return rejections
+
+
+def queue_uploads(futures, upload_queue: UploadQueue, rejections: Counter, uploading: list,
+                  run_manifest: Manifest = None, report: RunReport = None, stores: MonthlyStores = None,
+                  tensors: TensorStore = None):
+    """
+    Queues the files of the finished tasks for upload. The observations that
+    were not written are counted and recorded in the manifest. The written
+    ones are added to uploading together with the futures of their uploads.
+    A result with a record goes to its monthly HDF5 file and waits there
+    for the upload of the file, see upload_datasets. The tensors of the
+    written observations go to the tensor export. Their rows are flushed
+    to its index log before the observations can be recorded as done.
+    """
+    for future in futures:
+        try:
+            spooled, results = future.result()
+        except BaseException as e:
+            logging.error(f"Worker task failed\nCause: {e.__repr__()}")
+            continue
+        uploads = dict()
+        for remote_name, content, overwrite in spooled:
+            uploads[remote_name] = upload_queue.put_file(remote_name=remote_name, local_name=content,
+                                                         overwrite=overwrite)
+        for result in results:
+            if report is not None:
+                report.add(result)
+            if result.rejection is not None:
+                rejections[result.rejection] += 1
+                if run_manifest is not None:
+                    failed = result.rejection in burstprocessor.RETRY_REASONS
+                    run_manifest.record(result, manifest.FAILED if failed else manifest.REJECTED)
+                continue
+            if result.tensor is not None and tensors is not None:
+                tensors.append(result)
+                result.tensor = None
+            if result.record is not None and stores is not None:
+                try:
+                    file_name, burst_id = stores.append(result)
+                except Exception as e:
+                    logging.error(f"Could not add {result.remote_name} to its dataset\nCause: {e.__repr__()}")
+                    if run_manifest is not None:
+                        run_manifest.record(result, manifest.FAILED)
+                    continue
+                result.remote_name = f"{file_name}/{burst_id}"
+                result.record = None
+            else:
+                files = [f for name, f in uploads.items() if name.startswith(f"{result.remote_name}.")]
+                uploading.append((result, files))
+        if tensors is not None:
+            tensors.flush()
+
+
+def record_uploaded(uploading: list, run_manifest: Manifest = None) -> list:
+    """
+    Records the observations whose uploads are finished in the manifest
+
+    Returns: the observations that are still uploading
+    """
+    still_uploading = list()
+    for result, files in uploading:
+        if not all(f.done() for f in files):
+            still_uploading.append((result, files))
+        elif run_manifest is not None:
+            failed = any(f.exception() is not None for f in files)
+            run_manifest.record(result, manifest.FAILED if failed else manifest.DONE)
+    return still_uploading
+
+
+def upload_datasets(stores: MonthlyStores, upload_queue: UploadQueue, uploading: list) -> None:
+    """
+    Closes the monthly HDF5 files and uploads them if the stores have a
+    connector. Otherwise they stay in their local directory. The results
+    in the files are added to uploading together with the upload of their
+    file.
+    """
+    for path, results in stores.close().items():
+        files = list()
+        if stores.connector is None:
+            logging.info(f"Dataset written to {path}")
+        else:
+            remote_name = stores.remote_name(os.path.basename(path))
+            upload_queue.connector.make_dir(os.path.join(upload_queue.connector.base_dir, stores.remote_dir))
+            # The file holds the bursts of the server, see MonthlyStores
+            files.append(upload_queue.put_file(remote_name=remote_name, local_name=path, overwrite=True))
+            logging.info(f"Dataset {path} queued for upload to {remote_name}")
+        uploading.extend((result, files) for result in results)
+
+
+def extract_bursts(burst_list, chosen_type: str, connector=None, availability=None) -> pd.DataFrame:
+    """
+    Plans the observations for the chosen burst types.
+
+    Returns: the observation plan, see burstprocessor.plan_observations
+    """
     # Let's define all burst types that we want to process
     burst_types = ["I", "II", "III", "IV", "V"]
     types_to_process = list()
@@ -75,26 +366,28 @@ def extract_bursts(burst_list, chosen_type: str, connector=None):
         index = burst_types.index(chosen_type.upper())
         types_to_process.append(burst_types[index])
 
-    observation = list()
+    events = burst_list.loc[burst_list["Type"].isin(types_to_process)]
+    counts = events["Type"].value_counts()
     for type in types_to_process:
-        events = burst_list.loc[burst_list["Type"] == type]
-        if len(events) > 0:
-            logging.info(f"Found {len(events)} event(s) of type {type}")
-            for i in range(len(events)):
-                row = events.iloc[i]
-                try:
-                    observation += burstprocessor.extract_radio_burst(row, connector)
-                except BaseException as e:
-                    logging.error(f"Cannot process image\nCause: {e.__repr__()}")
-
+        if counts.get(type, 0) > 0:
+            logging.info(f"Found {counts[type]} event(s) of type {type}")
         else:
             logging.info(f"No events of type {type} found")
-    return observation
+
+    plan = burstprocessor.plan_observations(events, availability)
+    for type in plan["type"].unique():
+        path = os.path.join(connector.base_dir, f"type_{type}")
+        if connector is None:
+            if not os.path.exists(path):
+                os.makedirs(path)
+        else:
+            connector.make_dir(path)
+    return plan
 
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO,
                         filename='app.log', filemode='a',
-                        format='%(asctime)s:%(name)s:%(levelname)s - %(message)s')
+                        format=worker.LOG_FORMAT)
 
     typer.run(main)
@@ -0,0 +1,121 @@
+"""
+Remembers which observations have been produced already. A run only
+processes the rows of the observation plan that are new or changed since
+the last run, and an interrupted run continues where it stopped.
+version 1.0
+author: Andreas Wassmer
+project: Raumschiff
+"""
+import datetime
+import sqlite3
+
+import pandas as pd
+
+# Status of an observation in the manifest
+DONE = "done"
+REJECTED = "rejected"
+FAILED = "failed"
+
+# Observations with these states are not processed again unless their row
+# in the burst list changes
+FINISHED = (DONE, REJECTED)
+
+KEY_COLUMNS = ["instrument", "type", "start", "end"]
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class ObservationResult:
+    """
+    What a worker reports back about an observation. It is small on purpose,
+    the observation itself holds the spectrogram.
+    """
+    def __init__(self, instrument: str, type: str, start: datetime.datetime, end: datetime.datetime,
+                 row_hash: str = "", remote_name: str = None, snr: float = None, rejection: str = None,
+                 stages: dict = None, record: dict = None, tensor: dict = None) -> None:
+        self.instrument = instrument
+        self.type = type
+        self.start = start
+        self.end = end
+        self.row_hash = row_hash
+        self.remote_name = remote_name
+        self.snr = snr
+        self.rejection = rejection
+        # Time and bytes per stage, see utils.instrumentation.StageTimer
+        self.stages = stages
+        # The spectrogram for the dataset output, see utils.dataset
+        self.record = record
+        # The resampled spectrogram for the tensor export
+        self.tensor = tensor
+
+    def key(self) -> tuple:
+        return (self.instrument, self.type, self.start.strftime(TIME_FORMAT), self.end.strftime(TIME_FORMAT))
+
+    def __repr__(self) -> str:
+        return f"{self.instrument} - {self.start} - {self.end} ({self.rejection or 'written'})"
+
+
+class Manifest:
+    """
+    A SQLite table with one row per observation. Only the main process
+    writes to it.
+    """
+    def __init__(self, path: str = "manifest.sqlite") -> None:
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        with self.connection:
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS observations (
+                    instrument TEXT NOT NULL,
+                    type TEXT NOT NULL,
+                    start TEXT NOT NULL,
+                    end TEXT NOT NULL,
+                    row_hash TEXT,
+                    remote_name TEXT,
+                    snr REAL,
+                    status TEXT NOT NULL,
+                    reason TEXT,
+                    updated TEXT NOT NULL,
+                    PRIMARY KEY (instrument, type, start, end)
+                )""")
+
+    def record(self, result: ObservationResult, status: str) -> None:
+        """
+        Stores the outcome of an observation, replacing an older one
+        """
+        snr = None if result.snr is None else float(result.snr)
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO observations VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                result.key() + (result.row_hash, result.remote_name, snr, status, result.rejection,
+                                datetime.datetime.now().strftime(TIME_FORMAT)))
+
+    def status(self, result: ObservationResult) -> str:
+        row = self.connection.execute(
+            "SELECT status FROM observations WHERE instrument = ? AND type = ? AND start = ? AND end = ?",
+            result.key()).fetchone()
+        return None if row is None else row[0]
+
+    def pending(self, plan: pd.DataFrame) -> pd.DataFrame:
+        """
+        Returns the rows of an observation plan that have not been finished
+        yet or whose row in the burst list has changed since
+        """
+        finished = pd.read_sql_query(
+            f"SELECT instrument, type, start, end, row_hash FROM observations "
+            f"WHERE status IN ({', '.join('?' * len(FINISHED))})",
+            self.connection, params=FINISHED)
+        if len(plan) == 0 or len(finished) == 0:
+            return plan
+        keys = pd.DataFrame({
+            "instrument": plan["instrument"].astype(str),
+            "type": plan["type"].astype(str),
+            "start": plan["start"].dt.strftime(TIME_FORMAT),
+            "end": plan["end"].dt.strftime(TIME_FORMAT),
+            "row_hash": plan["row_hash"].astype(str),
+        }, index=plan.index)
+        merged = keys.reset_index().merge(finished, on=KEY_COLUMNS + ["row_hash"], how="left", indicator=True)
+        new = merged.loc[merged["_merge"] == "left_only", "index"]
+        return plan.loc[new]
+
+    def close(self) -> None:
+        self.connection.close()
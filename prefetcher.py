@@ -0,0 +1,83 @@
+"""
+Downloads the FITS files of the instrument days into the local cache before
+the workers need them. The downloads run in threads of the main process,
+so the network is busy while the workers decode and plot.
+version 1.0
+author: Andreas Wassmer
+project: Raumschiff
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import burstprocessor
+from dayloader import InstrumentDay
+from utils.fitscache import FitsCache
+
+
+class Prefetcher:
+    """
+    Fetches the files of instrument days into a FitsCache with a fixed
+    number of threads. ready() hands the days on in their order as soon as
+    their files are on the local disk. seconds and bytes sum up the
+    downloads of all threads.
+    """
+    def __init__(self, fits_cache: FitsCache, concurrency: int = 8) -> None:
+        self.fits_cache = fits_cache
+        self.fetched = 0
+        self.failed = 0
+        self.seconds = 0.0
+        self.bytes = 0
+        self.__lock = threading.Lock()
+        self.__executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="prefetch")
+
+    def prefetch(self, instrument_day: InstrumentDay):
+        """
+        Starts fetching the files of an instrument day.
+
+        Returns: a future that is done when all files are in the cache
+        """
+        return self.__executor.submit(self.__fetch_day, instrument_day)
+
+    def ready(self, instrument_days: list, look_ahead: int):
+        """
+        Yields the instrument days in their order once their files are in the
+        cache. At most look_ahead days are fetched ahead, so the cache is not
+        flooded with files that are evicted again before they are used.
+        A day whose files could not be fetched is passed on as well, its
+        worker tries again and reports the failure.
+        """
+        fetching = deque()
+        for instrument_day in instrument_days:
+            fetching.append((instrument_day, self.prefetch(instrument_day)))
+            if len(fetching) > look_ahead:
+                yield self.__wait(*fetching.popleft())
+        while len(fetching) > 0:
+            yield self.__wait(*fetching.popleft())
+
+    def close(self) -> None:
+        self.__executor.shutdown(wait=True)
+
+    def __wait(self, instrument_day: InstrumentDay, future) -> InstrumentDay:
+        try:
+            future.result()
+        except BaseException as e:
+            self.failed += 1
+            logging.warning(f"Cannot prefetch the files of {instrument_day}\nCause: {e.__repr__()}")
+        return instrument_day
+
+    def __fetch_day(self, instrument_day: InstrumentDay) -> None:
+        # The worker gets the file names, so it does not list the archive again
+        names = instrument_day.file_names(burstprocessor.load_windows(instrument_day))
+        instrument_day.known_files = names
+        for name in names:
+            begin = time.perf_counter()
+            path = self.fits_cache.fetch(name)
+            seconds = time.perf_counter() - begin
+            with self.__lock:
+                self.fetched += 1
+                self.seconds += seconds
+                self.bytes += os.path.getsize(path)
@@ -0,0 +1,193 @@
+"""
+Decides how many workers run and how many instrument days may be in the
+pool at once. Every instrument day gets an estimate of the memory its
+worker needs, and the days in flight must fit into a memory budget.
+version 1.0
+author: Andreas Wassmer
+project: Raumschiff
+"""
+import datetime
+import logging
+import math
+import multiprocessing
+import os
+import sys
+
+from astropy.io import fits
+
+import burstprocessor
+from dayloader import InstrumentDay
+from utils.fitscache import FILE_DURATION
+
+# Used for instruments whose files have not been seen yet. Most Callisto
+# stations record 200 channels at 4 samples per second.
+DEFAULT_CHANNELS = 200
+DEFAULT_T_DELT = 0.25
+
+# Bytes per sample: the float32 day array, the decoded file that is copied
+# into it and the copies of an observation for the screening and the
+# background subtraction
+DAY_BYTES_PER_SAMPLE = 4
+FILE_BYTES_PER_SAMPLE = 8
+OBSERVATION_BYTES_PER_SAMPLE = 3 * 4
+
+# A worker with matplotlib, astropy and the renderer set up
+WORKER_BASE_BYTES = 300 * 1024**2
+
+# Share of the available memory the workers may use
+MEMORY_SHARE = 0.7
+
+# Workers are replaced after this many tasks, so memory held by a worker
+# after a large task is returned to the system
+MAX_TASKS_PER_CHILD = 50
+
+
+def available_cpus() -> int:
+    """
+    Returns: the number of cores this process may run on
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return multiprocessing.cpu_count()
+
+
+def available_memory() -> int:
+    """
+    Returns: the memory that is free at the moment in bytes, or the total
+    memory if the system does not tell
+    """
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        pass
+    try:
+        return os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        return 8 * 1024**3
+
+
+def memory_budget(gigabytes: float = 0) -> int:
+    """
+    Returns: the memory the tasks in flight may use. 0 takes a share of the
+    available memory.
+    """
+    if gigabytes > 0:
+        return int(gigabytes * 1024**3)
+    return int(MEMORY_SHARE * available_memory())
+
+
+def worker_count(budget: int, cpus: int = None) -> int:
+    """
+    Returns: one worker per core, leaving a core for the main process which
+    uploads and prefetches, but no more workers than the budget can hold
+    """
+    if cpus is None:
+        cpus = available_cpus()
+    by_cpu = max(1, cpus - 1)
+    by_memory = max(1, budget // (2 * WORKER_BASE_BYTES))
+    return int(min(by_cpu, by_memory))
+
+
+def pool_options(max_tasks_per_child: int = MAX_TASKS_PER_CHILD) -> dict:
+    """
+    Returns: the arguments of ProcessPoolExecutor that recycle the workers.
+    Python 3.11 is needed for this. A recycling pool cannot fork, the workers
+    are started with forkserver or spawn.
+    """
+    if max_tasks_per_child <= 0 or sys.version_info < (3, 11):
+        return dict()
+    methods = multiprocessing.get_all_start_methods()
+    method = "forkserver" if "forkserver" in methods else "spawn"
+    return {"max_tasks_per_child": max_tasks_per_child, "mp_context": multiprocessing.get_context(method)}
+
+
+class MemoryScheduler:
+    """
+    Estimates the memory of the instrument days and keeps track of the bytes
+    in flight. The channel count of an instrument is read from a cached file
+    of it once and remembered.
+    """
+    def __init__(self, budget: int) -> None:
+        self.budget = budget
+        self.in_flight = 0
+        self.__channels = dict()
+
+    def channels(self, instrument_day: InstrumentDay) -> int:
+        instrument = instrument_day.instrument
+        if instrument not in self.__channels:
+            channels = self.__read_channels(instrument_day)
+            if channels is None:
+                return DEFAULT_CHANNELS
+            self.__channels[instrument] = channels
+        return self.__channels[instrument]
+
+    def estimate(self, instrument_day: InstrumentDay) -> int:
+        """
+        Returns: the bytes a worker needs for an instrument day. Every load
+        window has an array of the files it overlaps, the hours between the
+        windows are not loaded.
+        """
+        windows = burstprocessor.load_windows(instrument_day)
+        if len(windows) == 0:
+            return WORKER_BASE_BYTES
+        spans = sorted((floor_to_file(start), ceil_to_file(end)) for start, end in windows)
+        merged = [list(spans[0])]
+        for first, last in spans[1:]:
+            if first < merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], last)
+            else:
+                merged.append([first, last])
+        samples = sum((last - first).total_seconds() for first, last in merged) / DEFAULT_T_DELT
+        longest = max((obs.event_time_end - obs.event_time_start).total_seconds()
+                      for obs in instrument_day.observations) / DEFAULT_T_DELT
+        file_samples = FILE_DURATION.total_seconds() / DEFAULT_T_DELT
+        channels = self.channels(instrument_day)
+        return int(channels * (samples * DAY_BYTES_PER_SAMPLE + file_samples * FILE_BYTES_PER_SAMPLE
+                               + longest * OBSERVATION_BYTES_PER_SAMPLE))
+
+    def fits(self, estimate: int) -> bool:
+        """
+        True if a task of this size may start. A task larger than the budget
+        starts when nothing else is in flight.
+        """
+        return self.in_flight == 0 or self.in_flight + estimate <= self.budget
+
+    def acquire(self, estimate: int) -> None:
+        self.in_flight += estimate
+
+    def release(self, estimate: int) -> None:
+        self.in_flight -= estimate
+
+    @staticmethod
+    def __read_channels(instrument_day: InstrumentDay):
+        fits_cache = instrument_day.fits_cache
+        if fits_cache is None or not instrument_day.known_files:
+            return None
+        path = fits_cache.path_for(instrument_day.known_files[0])
+        if not os.path.exists(path):
+            return None
+        try:
+            return int(fits.getheader(path)["NAXIS2"])
+        except (OSError, KeyError, ValueError):
+            logging.warning(f"Cannot read the channel count from {path}")
+            return None
+
+
+def floor_to_file(time: datetime.datetime) -> datetime.datetime:
+    """
+    Returns: the start of the archive file that holds time
+    """
+    minutes = time.minute - time.minute % int(FILE_DURATION.total_seconds() // 60)
+    return time.replace(minute=minutes, second=0, microsecond=0)
+
+
+def ceil_to_file(time: datetime.datetime) -> datetime.datetime:
+    """
+    Returns: the end of the archive file that holds time
+    """
+    start = floor_to_file(time)
+    return start if start == time else start + FILE_DURATION
+
+
+def format_bytes(size: int) -> str:
+    return f"{size / 1024**3:.1f} GB" if size >= 1024**3 else f"{math.ceil(size / 1024**2)} MB"
@@ -4,7 +4,5 @@ year=2020
 # use "I", "II", "III", "IV", "V", or "all"
 type="V"
 
-for i in 1 2 3 4 5 6 7 8 9 10 11 12
-do
-python main.py --year $year --month $i --type $type
-done
+# All months of the year go through one worker pool
+python main.py --start $year-01 --end $year-12 --type $type
@@ -1,5 +1,15 @@
+import os
+import sys
+
 import pytest
 
+from standins import write_burst_list, write_callisto_fits
+
+# The workers of a pool that are started with forkserver or spawn import the
+# modules of the repository again. The '..' of the tests does not work for
+# them once a test has changed the working directory.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
 
 # Using fixtures here beacause I think that parametrizing
 # the tests clutters the code in this case
@@ -21,3 +31,119 @@ def event_dates():
     dates[(2012, 12, 29)] = ("2012", "12", "29")
 
     return dates
+
+
+@pytest.fixture()
+def make_observation():
+    """
+    A factory for observations of type III on 2023-06-01. start and end are
+    (hour, minute), further attributes of the observation may be given as
+    keywords. They use the fast background subtraction, so the tests do not
+    need the radiospectra fork.
+    """
+    import datetime
+
+    from Observation import RadioBurstObservation
+
+    def make(start, end, instrument="TEST-STATION", **attributes):
+        obs = RadioBurstObservation()
+        obs.instrument = instrument
+        obs.event_time_start = datetime.datetime(2023, 6, 1, *start)
+        obs.event_time_end = datetime.datetime(2023, 6, 1, *end)
+        obs.radio_burst_type = "III"
+        obs.fast_background = True
+        for name, value in attributes.items():
+            setattr(obs, name, value)
+        return obs
+    return make
+
+
+@pytest.fixture()
+def fits_archive(tmp_path):
+    """
+    A local directory that stands in for the e-Callisto archive. It holds
+    one hour of data from the instrument TEST-STATION.
+    """
+    import datetime
+    import os
+
+    archive = tmp_path / "archive"
+    day_dir = archive / "2023" / "06" / "01"
+    os.makedirs(day_dir)
+    start = datetime.datetime(2023, 6, 1, 12, 0)
+    for i in range(4):
+        file_start = start + datetime.timedelta(minutes=15 * i)
+        name = f"TEST-STATION_{file_start.strftime('%Y%m%d_%H%M%S')}_01.fit.gz"
+        write_callisto_fits(day_dir / name, "TEST-STATION", file_start, seed=i)
+    return str(archive)
+
+
+@pytest.fixture()
+def gappy_archive(tmp_path):
+    """
+    Like fits_archive, but the files are one sample short like most files
+    of the e-Callisto archive and the file of 12:30 is missing
+    """
+    import datetime
+    import os
+
+    archive = tmp_path / "gappy"
+    day_dir = archive / "2023" / "06" / "01"
+    os.makedirs(day_dir)
+    start = datetime.datetime(2023, 6, 1, 12, 0)
+    for i in (0, 1, 3):
+        file_start = start + datetime.timedelta(minutes=15 * i)
+        name = f"TEST-STATION_{file_start.strftime('%Y%m%d_%H%M%S')}_01.fit.gz"
+        write_callisto_fits(day_dir / name, "TEST-STATION", file_start, n_time=899, seed=i, burst_at=850 if i == 0 else None)
+    return str(archive)
+
+
+@pytest.fixture()
+def burst_list_file(tmp_path):
+    """
+    A monthly burst list in the format of the server
+    """
+    rows = [
+        "20230601\t01:23-01:25\tIII\tALASKA-ANCHORAGE, GLASGOW",
+        "20230601\t##:##-##:##\t\t",
+        "20230601\t12_55-12:58\tIII\tMEXICO-LANCE, (INDIA-OOTY)",
+        "",
+        "20230602\t09:01-09:30\tII\tMalaysia_Banting, e-Callisto",
+        "20230602\t23:58-00:03\tIV\tAUSTRIA-UNIGRAZ",
+        "20230603\t1x:00-10:05\tI\tGLASGOW",
+        "20230603\t10.10-10:12\tV\t[SWISS-Landschlacht], SWISS-IRSOL",
+    ]
+    path = tmp_path / "e-CALLISTO_2023_06.txt"
+    write_burst_list(path, rows)
+    return str(path)
+
+
+@pytest.fixture()
+def webdav_server(tmp_path):
+    """
+    A local WebDAV server. Its files are in the directory server.root.
+    """
+    import os
+
+    from standins import StandInServer
+
+    root = tmp_path / "webdav"
+    os.makedirs(root)
+    with StandInServer(str(root)) as server:
+        server.root = str(root)
+        yield server
+
+
+@pytest.fixture()
+def webdav_connector(webdav_server, monkeypatch):
+    """
+    A WebdavConnector talking to the local WebDAV server
+    """
+    from connectors.webdavconnector import WebdavConnector
+
+    monkeypatch.setenv("HOST_URL", webdav_server.url)
+    monkeypatch.setenv("USERNAME", "raumschiff")
+    monkeypatch.setenv("PASSWORD", "secret")
+    connector = WebdavConnector()
+    connector.client.verbose = False
+    return connector
@@ -0,0 +1,274 @@
+"""
+Local stand-ins for the servers the extractor talks to. They are small
+enough to run inside the test process.
+"""
+import datetime
+import os
+import threading
+from collections import Counter
+from email.utils import formatdate
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, unquote, urlsplit
+
+import numpy as np
+from astropy.io import fits
+
+
+class WebdavHandler(SimpleHTTPRequestHandler):
+    """
+    Implements the part of WebDAV used by webdavclient3: HEAD, GET, PUT,
+    MKCOL, DELETE and PROPFIND with depth 0 or 1.
+    """
+    def log_message(self, format, *args):
+        pass
+
+    def local_path(self):
+        path = unquote(urlsplit(self.path).path)
+        return os.path.join(self.server.root, path.lstrip("/"))
+
+    def count(self):
+        with self.server.lock:
+            self.server.requests[self.command] += 1
+
+    def do_HEAD(self):
+        self.count()
+        if not os.path.exists(self.local_path()):
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self):
+        self.count()
+        path = self.local_path()
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return
+        with open(path, "rb") as f:
+            body = f.read()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_PUT(self):
+        self.count()
+        path = self.local_path()
+        if not os.path.isdir(os.path.dirname(path)):
+            self.send_error(409)
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        if self.headers.get("Transfer-Encoding", "") == "chunked":
+            body = b""
+            while True:
+                size = int(self.rfile.readline().strip(), 16)
+                if size == 0:
+                    self.rfile.readline()
+                    break
+                body += self.rfile.read(size)
+                self.rfile.readline()
+        else:
+            body = self.rfile.read(length)
+        with open(path, "wb") as f:
+            f.write(body)
+        self.send_response(201)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_MKCOL(self):
+        self.count()
+        path = self.local_path()
+        if os.path.exists(path):
+            self.send_error(405)
+            return
+        if not os.path.isdir(os.path.dirname(path.rstrip("/"))):
+            self.send_error(409)
+            return
+        os.mkdir(path)
+        self.send_response(201)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_DELETE(self):
+        self.count()
+        path = self.local_path()
+        if not os.path.exists(path):
+            self.send_error(404)
+            return
+        os.unlink(path)
+        self.send_response(204)
+        self.end_headers()
+
+    def do_PROPFIND(self):
+        self.count()
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        path = self.local_path()
+        if not os.path.exists(path):
+            self.send_error(404)
+            return
+        href = urlsplit(self.path).path
+        entries = [(href, path)]
+        if os.path.isdir(path) and self.headers.get("Depth", "1").strip() != "0":
+            base = href if href.endswith("/") else href + "/"
+            for name in sorted(os.listdir(path)):
+                entries.append((base + quote(name), os.path.join(path, name)))
+
+        responses = list()
+        for entry_href, entry_path in entries:
+            stats = os.stat(entry_path)
+            if os.path.isdir(entry_path):
+                if not entry_href.endswith("/"):
+                    entry_href += "/"
+                resource = "<d:resourcetype><d:collection/></d:resourcetype>"
+            else:
+                resource = f"<d:resourcetype/><d:getcontentlength>{stats.st_size}</d:getcontentlength>"
+            responses.append(
+                f"<d:response><d:href>{entry_href}</d:href><d:propstat><d:prop>"
+                f"<d:displayname>{os.path.basename(entry_path.rstrip('/'))}</d:displayname>"
+                f"<d:getlastmodified>{formatdate(stats.st_mtime, usegmt=True)}</d:getlastmodified>"
+                f"{resource}</d:prop><d:status>HTTP/1.1 200 OK</d:status></d:propstat></d:response>")
+        body = ('<?xml version="1.0" encoding="utf-8"?><d:multistatus xmlns:d="DAV:">'
+                + "".join(responses) + "</d:multistatus>").encode("utf-8")
+        self.send_response(207)
+        self.send_header("Content-Type", "application/xml; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class ArchiveHandler(SimpleHTTPRequestHandler):
+    """
+    A read-only file server like the e-Callisto archive. Directories are
+    listed as HTML pages with links. Files carry an ETag and Last-Modified
+    and conditional requests are answered with 304.
+    """
+    def log_message(self, format, *args):
+        pass
+
+    def translate_path(self, path):
+        return os.path.join(self.server.root, unquote(urlsplit(path).path).lstrip("/"))
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.requests[self.command] += 1
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            super().do_GET()
+            return
+        stats = os.stat(path)
+        etag = f'"{stats.st_size:x}-{stats.st_mtime_ns:x}"'
+        last_modified = formatdate(stats.st_mtime, usegmt=True)
+        if self.headers.get("If-None-Match") == etag or (
+                "If-None-Match" not in self.headers and self.headers.get("If-Modified-Since") == last_modified):
+            with self.server.lock:
+                self.server.requests["304"] += 1
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        with open(path, "rb") as f:
+            body = f.read()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", last_modified)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class StandInServer:
+    """
+    Runs an HTTP server on a free local port in a background thread
+    """
+    def __init__(self, root: str, handler=WebdavHandler) -> None:
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.httpd.root = root
+        self.httpd.lock = threading.Lock()
+        self.httpd.requests = Counter()
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    @property
+    def requests(self) -> Counter:
+        return self.httpd.requests
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+BURST_LIST_HEADER = """e-CALLISTO Burst-List
+Observatory: worldwide e-CALLISTO network
+Compiled by: C. Monstein
+Time: UT
+Type: I, II, III, IV, V, CTM
+Remarks: Instruments in brackets are uncertain
+
+Date\tTime\tType\tStations
+"""
+
+BURST_LIST_FOOTER = """#-----------------------------------------------------------
+# Note: flux densities are not calibrated
+# Contact: christian.monstein@irsol.usi.ch
+# End of list
+"""
+
+
+def write_burst_list(path, rows: list) -> None:
+    """
+    Writes a monthly burst list in the format of the server. rows are the
+    tab separated lines of the table.
+    """
+    with open(path, "wb") as f:
+        f.write((BURST_LIST_HEADER + "\n".join(rows) + "\n" + BURST_LIST_FOOTER).encode("latin-1"))
+
+
+def write_callisto_fits(path, instrument, start, n_freq=16, n_time=900, t_delt=1.0, seed=0, burst_at=None):
+    """
+    Writes a small FITS file that looks like one of the e-Callisto archive
+    files: a (frequency x time) image plus a table with both axes.
+    If burst_at is given, a burst drifting from the high to the low
+    frequencies starts at that sample.
+    """
+    rng = np.random.default_rng(seed)
+    data = rng.normal(100.0, 5.0, (n_freq, n_time))
+    if burst_at is not None:
+        for i in range(n_freq):
+            x = burst_at + i // 8
+            data[i, x:x + 20] += 60.0
+    data = data.clip(0, 255).astype(np.uint8)
+    end = start + datetime.timedelta(seconds=n_time * t_delt)
+    midnight = datetime.datetime(start.year, start.month, start.day)
+
+    header = fits.Header()
+    header["CONTENT"] = f"{start.strftime('%Y/%m/%d')} Radio flux density, e-CALLISTO ({instrument})"
+    header["INSTRUME"] = instrument
+    header["DATE-OBS"] = start.strftime("%Y/%m/%d")
+    header["TIME-OBS"] = start.strftime("%H:%M:%S.000")
+    header["DATE-END"] = end.strftime("%Y/%m/%d")
+    header["TIME-END"] = end.strftime("%H:%M:%S.000")
+    header["CRVAL1"] = (start - midnight).total_seconds()
+    header["CRPIX1"] = 0
+    header["CTYPE1"] = "Time [UT]"
+    header["CDELT1"] = t_delt
+    header["CRVAL2"] = 200.0
+    header["CRPIX2"] = 0
+    header["CTYPE2"] = "Frequency [MHz]"
+    header["CDELT2"] = -1.0
+
+    time_axis = np.arange(n_time) * t_delt
+    freq_axis = np.linspace(400.0, 45.0, n_freq)
+    table = fits.BinTableHDU.from_columns([
+        fits.Column(name="TIME", format=f"{n_time}D", array=time_axis[np.newaxis, :]),
+        fits.Column(name="FREQUENCY", format=f"{n_freq}D", array=freq_axis[np.newaxis, :]),
+    ])
+    fits.HDUList([fits.PrimaryHDU(data, header=header), table]).writeto(path)
@@ -0,0 +1,76 @@
+import datetime
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, '..')
+import burstprocessor
+from standins import ArchiveHandler, StandInServer
+from utils.availability import AvailabilityIndex
+
+DAY = datetime.date(2023, 6, 1)
+
+
+def plan_row(instrument, start, end, event=0):
+    return {"event": event, "date": "20230601", "time": "", "type": "III", "instrument": instrument,
+            "start": pd.Timestamp(start), "end": pd.Timestamp(end), "row_hash": ""}
+
+
+def test_lists_day_once(fits_archive, tmp_path):
+    index = AvailabilityIndex(str(tmp_path / "availability.sqlite"), archive_url=fits_archive)
+    assert index.instruments(DAY) == {"TEST-STATION"}
+    names = index.file_names("TEST-STATION", datetime.datetime(2023, 6, 1, 12, 10),
+                             datetime.datetime(2023, 6, 1, 12, 20))
+    assert names == ["TEST-STATION_20230601_120000_01.fit.gz", "TEST-STATION_20230601_121500_01.fit.gz"]
+    assert not index.is_available("TEST-STATION", datetime.datetime(2023, 6, 1, 14, 0),
+                                  datetime.datetime(2023, 6, 1, 14, 5))
+    index.close()
+
+    # The listing was made long after the day, so it is final and comes from the file
+    os.rename(fits_archive, fits_archive + ".gone")
+    index = AvailabilityIndex(str(tmp_path / "availability.sqlite"), archive_url=fits_archive)
+    assert index.instruments(DAY) == {"TEST-STATION"}
+    index.close()
+
+
+def test_pools_listings_over_http(fits_archive, tmp_path):
+    with StandInServer(fits_archive, handler=ArchiveHandler) as server:
+        index = AvailabilityIndex(str(tmp_path / "availability.sqlite"), archive_url=server.url + "/")
+        index.ensure([DAY, DAY + datetime.timedelta(days=1), DAY + datetime.timedelta(days=2)])
+        assert index.instruments(DAY) == {"TEST-STATION"}
+        assert index.instruments(DAY + datetime.timedelta(days=1)) == set()
+        assert server.requests["GET"] == 3
+        index.close()
+
+
+def test_filters_and_expands_plan(fits_archive, tmp_path):
+    index = AvailabilityIndex(str(tmp_path / "availability.sqlite"), archive_url=fits_archive)
+    plan = pd.DataFrame([
+        plan_row("TEST-STATION", "2023-06-01 12:20", "2023-06-01 12:25", event=0),
+        plan_row("GLASGOW", "2023-06-01 12:20", "2023-06-01 12:25", event=0),
+        plan_row("TEST-STATION", "2023-06-01 15:00", "2023-06-01 15:05", event=1),
+        plan_row("e-Callisto", "2023-06-01 12:40", "2023-06-01 12:45", event=2),
+        plan_row("e-Callisto", "2023-06-01 18:00", "2023-06-01 18:05", event=3),
+    ])
+
+    expanded = index.expand_wildcards(plan)
+    assert list(expanded["instrument"]) == ["TEST-STATION", "GLASGOW", "TEST-STATION", "TEST-STATION"]
+    assert list(expanded["event"]) == [0, 0, 1, 2]
+
+    available = index.filter_plan(expanded)
+    assert list(zip(available["event"], available["instrument"])) == [(0, "TEST-STATION"), (2, "TEST-STATION")]
+    index.close()
+
+
+def test_plan_days_passes_known_files(fits_archive, tmp_path):
+    index = AvailabilityIndex(str(tmp_path / "availability.sqlite"), archive_url=fits_archive)
+    plan = pd.DataFrame([plan_row("TEST-STATION", "2023-06-01 12:10", "2023-06-01 12:20"),
+                         plan_row("TEST-STATION", "2023-06-01 12:40", "2023-06-01 12:44", event=1)])
+    observations = burstprocessor.observations_from_plan(plan)
+    days = burstprocessor.plan_days(observations, index)
+    assert len(days) == 1
+    assert days[0].known_files == ["TEST-STATION_20230601_120000_01.fit.gz",
+                                   "TEST-STATION_20230601_121500_01.fit.gz",
+                                   "TEST-STATION_20230601_123000_01.fit.gz"]
+    index.close()
@@ -0,0 +1,77 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+from radiospectra.sources import CallistoSpectrogram
+
+sys.path.insert(0, '..')
+from utils.background import prettify, subtract_background
+from utils.validation import spectrogram_stats
+
+
+def sample_spectrogram(fits_archive) -> CallistoSpectrogram:
+    path = os.path.join(fits_archive, "2023", "06", "01", "TEST-STATION_20230601_121500_01.fit.gz")
+    return CallistoSpectrogram.read(path)
+
+
+def test_background_like_radiospectra(fits_archive):
+    spec = sample_spectrogram(fits_archive)
+    expected = spec.data - spec.auto_const_bg()
+
+    result = subtract_background(spec.data, channel_sigma=None)
+    assert result.dtype == np.float32
+    np.testing.assert_allclose(result, expected, atol=1e-3)
+
+
+def test_background_like_the_radiospectra_fork(fits_archive):
+    spec = sample_spectrogram(fits_archive)
+    try:
+        expected = spec.subtract_bg("constbacksub", "elimwrongchannels")
+    except TypeError:
+        pytest.skip("Needs the radiospectra fork of requirements.txt")
+
+    result = prettify(spec)
+    assert result.data.shape == expected.data.shape
+    np.testing.assert_allclose(result.data, expected.data, atol=1e-3)
+
+
+def test_wrong_channels_are_eliminated():
+    rng = np.random.default_rng(3)
+    data = rng.normal(100.0, 1.0, (40, 500)).astype(np.float32)
+    data[7] = rng.normal(100.0, 30.0, 500)
+    data[:, 100] = np.nan
+
+    result = subtract_background(data)
+    assert not np.nan_to_num(result[7]).any()
+    assert np.nan_to_num(result[6]).any()
+    assert np.isnan(result[:, 100]).all()
+
+
+def test_gap_stays_a_gap(fits_archive):
+    spec = sample_spectrogram(fits_archive)
+    expected = subtract_background(spec.data)
+    data = spec.data.astype(np.float32)
+    data[:, 100] = np.nan
+
+    result = subtract_background(data)
+    assert np.isnan(result[:, 100]).all()
+    assert np.isnan(result).sum() == result.shape[0]
+    np.testing.assert_allclose(np.delete(result, 100, axis=1), np.delete(expected, 100, axis=1), atol=0.5)
+
+    spec.data = data
+    assert np.isfinite(spectrogram_stats(prettify(spec)).snr)
+
+
+def test_prettify_leaves_shared_data_alone(fits_archive):
+    spec = sample_spectrogram(fits_archive)
+    spec.data = spec.data.astype(np.float32)
+    original = spec.data.copy()
+
+    result = prettify(spec)
+    np.testing.assert_array_equal(spec.data, original)
+    assert result.data is not spec.data
+
+    in_place = prettify(spec, in_place=True)
+    assert in_place.data is spec.data
+    np.testing.assert_allclose(in_place.data, result.data)
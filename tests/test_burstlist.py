@@ -0,0 +1,100 @@
+import datetime
+import glob
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, '..')
+import burstlist
+from standins import ArchiveHandler, StandInServer
+
+
+def test_fast_parser_matches_python_engine(burst_list_file):
+    expected = pd.read_csv(burst_list_file, sep="\t", skiprows=8, skipfooter=4,
+                           index_col=False, encoding="latin-1",
+                           names=['Date', 'Time', 'Type', 'Instruments'], engine="python")
+    expected['Date'] = expected['Date'].astype('string')
+    expected = expected.loc[expected['Time'] != "##:##-##:##"]
+
+    data = burstlist.process_burst_list(burst_list_file, use_cache=False)
+    pd.testing.assert_frame_equal(data, expected)
+    assert len(burstlist.process_burst_list(burst_list_file, date="20230602", use_cache=False)) == 2
+
+
+def test_parsed_list_is_cached(burst_list_file, monkeypatch):
+    parsed = burstlist.process_burst_list(burst_list_file)
+    assert len(glob.glob(burst_list_file.replace(".txt", ".*.parquet"))) == 1
+
+    def fail(content):
+        raise AssertionError("the list must come from the cache")
+
+    monkeypatch.setattr(burstlist, "parse_burst_list", fail)
+    pd.testing.assert_frame_equal(burstlist.process_burst_list(burst_list_file), parsed)
+
+    # A changed list must be parsed again
+    monkeypatch.undo()
+    with open(burst_list_file, "a") as f:
+        f.write("\n")
+    burstlist.process_burst_list(burst_list_file)
+    assert len(glob.glob(burst_list_file.replace(".txt", ".*.parquet"))) == 1
+
+
+def burst_list_server(tmp_path, burst_list_file):
+    """
+    The lists of June and July 2023 on a local archive stand-in
+    """
+    root = tmp_path / "lists" / "2023"
+    root.mkdir(parents=True)
+    june = open(burst_list_file, encoding="latin-1").read()
+    (root / "e-CALLISTO_2023_06.txt").write_text(june, encoding="latin-1")
+    (root / "e-CALLISTO_2023_07.txt").write_text(june.replace("202306", "202307"), encoding="latin-1")
+    return StandInServer(str(tmp_path / "lists"), handler=ArchiveHandler)
+
+
+def test_burst_range_spans_months(burst_list_file, tmp_path):
+    local = tmp_path / "local"
+    local.mkdir()
+    with burst_list_server(tmp_path, burst_list_file) as server:
+        fetcher = burstlist.BurstListFetcher(server.url, str(local))
+        data = burstlist.process_burst_range(datetime.date(2023, 6, 2), datetime.date(2023, 7, 1), fetcher=fetcher)
+    assert list(data['Date'].unique()) == ["20230602", "20230603", "20230701"]
+
+
+def test_missing_months_are_skipped(burst_list_file, tmp_path, caplog):
+    local = tmp_path / "local"
+    local.mkdir()
+    with burst_list_server(tmp_path, burst_list_file) as server:
+        fetcher = burstlist.BurstListFetcher(server.url, str(local))
+        # The list of August is not published yet
+        data = burstlist.process_burst_range(datetime.date(2023, 7, 1), datetime.date(2023, 8, 31), fetcher=fetcher)
+        assert list(data['Date'].unique()) == ["20230701", "20230702", "20230703"]
+        assert "2023-08" in caplog.text
+
+        empty = burstlist.process_burst_range(datetime.date(2023, 8, 1), datetime.date(2023, 9, 30), fetcher=fetcher)
+    assert len(empty) == 0
+    assert list(empty.columns) == burstlist.COLUMNS
+
+
+def test_unchanged_lists_are_not_downloaded_again(burst_list_file, tmp_path):
+    local = tmp_path / "local"
+    local.mkdir()
+    with burst_list_server(tmp_path, burst_list_file) as server:
+        fetcher = burstlist.BurstListFetcher(server.url, str(local))
+        filename, content = fetcher.fetch(2023, 6)
+        assert fetcher.downloaded == 1
+        assert os.path.exists(filename + ".meta.json")
+
+        fetcher = burstlist.BurstListFetcher(server.url, str(local))
+        again = fetcher.fetch(2023, 6)
+        assert again == (filename, content)
+        assert fetcher.not_modified == 1 and fetcher.downloaded == 0
+        assert server.requests["304"] == 1
+
+        # A changed list is downloaded
+        changed = tmp_path / "lists" / "2023" / "e-CALLISTO_2023_06.txt"
+        changed.write_bytes(content.replace(b"GLASGOW", b"BIR"))
+        os.utime(changed, ns=(0, 10**18))
+        _, content = fetcher.fetch(2023, 6)
+        assert b"BIR" in content
+        assert fetcher.downloaded == 1
@@ -0,0 +1,103 @@
+import datetime
+import pickle
+import sys
+
+sys.path.insert(0, '..')
+import burstprocessor
+from connectors.spoolconnector import SpoolConnector
+from utils import validation
+from utils.validation import Screening
+
+
+def test_plan_loads_merges_overlapping_windows(make_observation):
+    observations = [
+        make_observation((12, 8), (12, 14), "GLASGOW"),
+        make_observation((12, 1), (12, 5), "ALASKA"),
+        make_observation((12, 1), (12, 5), "GLASGOW"),
+        make_observation((12, 5), (12, 9), "GLASGOW"),
+        make_observation((13, 0), (13, 4), "GLASGOW"),
+    ]
+    groups = burstprocessor.plan_loads(observations)
+    windows = sorted((g.instrument, g.start.strftime("%H:%M"), g.end.strftime("%H:%M"), len(g.observations))
+                     for g in groups)
+    assert windows == [("ALASKA", "12:01", "12:05", 1),
+                       ("GLASGOW", "12:01", "12:14", 3),
+                       ("GLASGOW", "13:00", "13:04", 1)]
+
+
+def test_plan_loads_limits_span(make_observation):
+    observations = [make_observation((h, 0), (h + 1, 0), "GLASGOW") for h in range(10, 14)]
+    groups = burstprocessor.plan_loads(observations, max_span=datetime.timedelta(hours=2))
+    assert [len(g.observations) for g in groups] == [2, 2]
+
+
+def test_plan_observations(burst_list_file):
+    import burstlist
+
+    plan = burstprocessor.plan_observations(burstlist.process_burst_list(burst_list_file, use_cache=False))
+    rows = [(r.instrument, r.type, r.start.strftime("%d %H:%M"), r.end.strftime("%d %H:%M"))
+            for r in plan.itertuples()]
+    assert rows == [
+        ("ALASKA-ANCHORAGE", "III", "01 01:21", "01 01:27"),
+        ("GLASGOW", "III", "01 01:21", "01 01:27"),
+        ("MEXICO-LANCE-A", "III", "01 12:53", "01 13:01"),
+        ("MEXICO-LANCE-B", "III", "01 12:53", "01 13:01"),
+        ("Malaysia_Banting", "II", "02 08:59", "02 09:32"),
+        ("Malaysia-Banting", "II", "02 08:59", "02 09:32"),
+        ("AUSTRIA-UNIGRAZ", "IV", "02 23:56", "03 00:05"),
+        ("SWISS-IRSOL", "V", "03 10:08", "03 10:14"),
+    ]
+
+
+def test_write_instrument_day_reports_rejections(fits_archive, make_observation):
+    screening = Screening()
+    observations = [make_observation((12, 5), (12, 10)),
+                    make_observation((12, 20), (12, 30))]
+    for obs in observations:
+        obs.screening = screening
+    day = burstprocessor.plan_days(observations)[0]
+    day.archive_url = fits_archive
+    spool = SpoolConnector()
+
+    results = burstprocessor.write_instrument_day(day, spool)
+    assert [(r.instrument, r.start) for r in results] == [(o.instrument, o.event_time_start) for o in observations]
+    assert {r.rejection for r in results} <= {validation.LOW_SNR, validation.NO_BURST}
+    assert all(o.spectrum is None for o in observations)
+    assert spool.take() == []
+
+
+def test_days_are_sorted_and_chunked(make_observation):
+    observations = [make_observation((12, 0), (12, 5), "B-STATION"),
+                    make_observation((13, 0), (13, 5), "A-STATION"),
+                    make_observation((10, 0), (10, 5), "B-STATION"),
+                    make_observation((14, 0), (14, 5), "A-STATION")]
+    observations[3].event_time_start += datetime.timedelta(days=1)
+    observations[3].event_time_end += datetime.timedelta(days=1)
+    days = burstprocessor.plan_days(observations)
+    assert [(d.instrument, d.day.day, len(d.observations)) for d in days] == [
+        ("A-STATION", 1, 1), ("A-STATION", 2, 1), ("B-STATION", 1, 2)]
+
+    chunks = list(burstprocessor.chunk_days(days, max_observations=2))
+    assert [[d.instrument for d in chunk] for chunk in chunks] == [["A-STATION", "A-STATION"], ["B-STATION"]]
+    assert len(list(burstprocessor.chunk_days(days, max_observations=1))) == 3
+
+
+def test_day_chunk_is_compact(fits_archive, make_observation):
+    screening = Screening()
+    observations = [make_observation((12, 5), (12, 10)),
+                    make_observation((12, 20), (12, 30))]
+    for obs in observations:
+        obs.screening = screening
+        obs.row_hash = f"hash-{obs.event_time_start.minute}"
+    days = burstprocessor.plan_days(observations)
+    days[0].archive_url = fits_archive
+    chunk = burstprocessor.DayChunk(days)
+    assert len(chunk) == 2
+    assert len(pickle.dumps(chunk)) < len(pickle.dumps(days))
+
+    rebuilt = pickle.loads(pickle.dumps(chunk)).instrument_days()
+    assert [(o.event_time_start, o.row_hash, o.radio_burst_type) for o in rebuilt[0].observations] == [
+        (o.event_time_start, o.row_hash, o.radio_burst_type) for o in observations]
+    results = burstprocessor.write_instrument_day(rebuilt[0], SpoolConnector())
+    assert [r.row_hash for r in results] == ["hash-5", "hash-20"]
+    assert all(r.rejection != burstprocessor.LOAD_FAILED for r in results)
@@ -0,0 +1,77 @@
+import io
+import os
+import sys
+
+sys.path.insert(0, '..')
+from connectors.baseconnector import BaseConnector
+from connectors.defaultconnector import DefaultConnector
+from connectors.spoolconnector import SpoolConnector
+
+
+def test_known_dirs_answer_make_dir_locally(webdav_connector, webdav_server):
+    os.makedirs(os.path.join(webdav_server.root, "eCallisto", "bursts", "type_III"))
+    webdav_connector.base_dir = "eCallisto/bursts"
+    webdav_connector.load_known_dirs()
+    before = sum(webdav_server.requests.values())
+
+    for _ in range(100):
+        webdav_connector.make_dir("eCallisto/bursts/type_III")
+        assert webdav_connector.check_dir_exists("eCallisto/bursts/type_III/")
+    assert sum(webdav_server.requests.values()) == before
+
+    webdav_connector.make_dir("eCallisto/bursts/type_II")
+    webdav_connector.make_dir("eCallisto/bursts/type_II")
+    assert webdav_server.requests["MKCOL"] == 1
+    assert os.path.isdir(os.path.join(webdav_server.root, "eCallisto", "bursts", "type_II"))
+
+
+def test_uploads_do_not_ask_for_the_parent(webdav_connector, webdav_server, tmp_path):
+    os.makedirs(os.path.join(webdav_server.root, "eCallisto", "bursts", "type_III"))
+    webdav_connector.base_dir = "eCallisto/bursts"
+    webdav_connector.load_known_dirs()
+    local_name = tmp_path / "local.fit.gz"
+    local_name.write_bytes(b"fits")
+    before = dict(webdav_server.requests)
+
+    for i in range(5):
+        webdav_connector.put_file(remote_name=f"type_III/burst_{i}.jpg", local_name=b"jpg", overwrite=True)
+    webdav_connector.put_file(remote_name="type_III/burst.fit.gz", local_name=str(local_name), overwrite=True)
+    requests = {method: n - before.get(method, 0) for method, n in webdav_server.requests.items()}
+    assert {method: n for method, n in requests.items() if n > 0} == {"PUT": 6}
+    with open(os.path.join(webdav_server.root, "eCallisto", "bursts", "type_III", "burst.fit.gz"), "rb") as f:
+        assert f.read() == b"fits"
+
+    # An unknown parent is made once
+    webdav_connector.put_file(remote_name="type_IV/burst.jpg", local_name=b"jpg", overwrite=True)
+    webdav_connector.put_file(remote_name="type_IV/burst2.jpg", local_name=b"jpg", overwrite=True)
+    assert webdav_server.requests["MKCOL"] == before.get("MKCOL", 0) + 1
+    assert sorted(os.listdir(os.path.join(webdav_server.root, "eCallisto", "bursts", "type_IV"))) == \
+        ["burst.jpg", "burst2.jpg"]
+
+
+def test_default_connector_known_dirs(tmp_path):
+    connector = DefaultConnector()
+    connector.base_dir = str(tmp_path / "bursts")
+    os.makedirs(os.path.join(connector.base_dir, "type_I"))
+    connector.load_known_dirs()
+    assert connector.is_known_dir(os.path.join(connector.base_dir, "type_I"))
+
+    connector.make_dir(os.path.join(connector.base_dir, "type_V"))
+    assert connector.is_known_dir(os.path.join(connector.base_dir, "type_V"))
+    assert os.path.isdir(os.path.join(connector.base_dir, "type_V"))
+
+
+def test_default_connector_writes_bytes(tmp_path):
+    connector = DefaultConnector()
+    connector.base_dir = str(tmp_path)
+    connector.put_file(remote_name="burst.jpg", local_name=b"\xff\xd8jpeg", overwrite=True)
+    assert (tmp_path / "burst.jpg").read_bytes() == b"\xff\xd8jpeg"
+
+
+def test_spool_only_takes_files():
+    spool = SpoolConnector()
+    spool.put_file(remote_name="type_III/a.jpg", local_name=b"jpg")
+    spool.put_file(remote_name="type_III/a.fit.gz", local_name=io.BytesIO(b"fits"), overwrite=True)
+    assert spool.take() == [("type_III/a.jpg", b"jpg", False), ("type_III/a.fit.gz", b"fits", True)]
+    assert spool.take() == []
+    assert not isinstance(spool, BaseConnector)
@@ -0,0 +1,166 @@
+import datetime
+import os
+import sys
+from collections import Counter
+from concurrent.futures import Future
+
+import numpy as np
+
+sys.path.insert(0, '..')
+import burstprocessor
+import main
+import manifest
+from connectors.defaultconnector import DefaultConnector
+from connectors.spoolconnector import SpoolConnector
+from connectors.uploadqueue import UploadQueue
+from manifest import Manifest, ObservationResult
+from Observation import OUTPUT_DATASET
+from utils.dataset import BurstStore, MonthlyStores, month_file_name
+
+
+def make_result(start, n_time=30, snr=2.5):
+    data = np.arange(16 * n_time, dtype=np.float32).reshape(16, n_time)
+    record = {"data": data, "freq_axis": np.linspace(45.0, 870.0, 16), "time_axis": np.arange(n_time) * 0.25,
+              "header": "SIMPLE  =                    T"}
+    return ObservationResult("TEST-STATION", "III", start, start + datetime.timedelta(minutes=5),
+                             remote_name="type_III/a", snr=snr, record=record)
+
+
+def test_store_appends_and_indexes(tmp_path):
+    path = str(tmp_path / "bursts.h5")
+    store = BurstStore(path)
+    first = store.append(make_result(datetime.datetime(2023, 6, 1, 12, 0)))
+    second = store.append(make_result(datetime.datetime(2023, 6, 2, 8, 30), n_time=40, snr=None))
+    store.close()
+
+    store = BurstStore(path, mode="r")
+    index = store.index()
+    assert list(index["id"]) == [first, second]
+    assert list(index["n_time"]) == [30, 40]
+    assert index["start"][1] == datetime.datetime(2023, 6, 2, 8, 30)
+    assert np.isnan(index["snr"][1])
+    data = store.data(second)
+    assert data.compression == "gzip"
+    assert data[3, 5] == 3 * 40 + 5
+    store.close()
+
+
+def test_uncompressed_bursts_are_memory_mapped(tmp_path):
+    path = str(tmp_path / "bursts.h5")
+    store = BurstStore(path, compression=None)
+    burst_id = store.append(make_result(datetime.datetime(2023, 6, 1, 12, 0)))
+    store.close()
+
+    store = BurstStore(path, mode="r")
+    mapped = store.memmap(burst_id)
+    assert mapped.shape == (16, 30)
+    assert np.array_equal(mapped, store.data(burst_id)[:])
+    store.close()
+
+
+def test_monthly_stores_upload_once(tmp_path):
+    connector = DefaultConnector()
+    connector.base_dir = str(tmp_path / "remote")
+    stores = MonthlyStores(str(tmp_path / "datasets"))
+    june = datetime.datetime(2023, 6, 30, 23, 0)
+    assert stores.append(make_result(june)) == (month_file_name(june), "00000000")
+    assert stores.append(make_result(june.replace(hour=22))) == (month_file_name(june), "00000001")
+    # The same burst again
+    assert stores.append(make_result(june)) == (month_file_name(june), "00000000")
+    stores.append(make_result(datetime.datetime(2023, 7, 1, 0, 5)))
+    stores.connector = connector
+    stores.remote_dir = main.DATASET_DIR
+
+    uploader = UploadQueue(connector)
+    uploading = list()
+    main.upload_datasets(stores, uploader, uploading)
+    assert uploader.close() == []
+    assert sorted(os.listdir(tmp_path / "remote" / "datasets")) == ["bursts_2023_06.h5", "bursts_2023_07.h5"]
+    assert len(uploading) == 4
+    assert all(len(files) == 1 and files[0].done() for result, files in uploading)
+    assert stores.close() == {}
+
+
+class UnreachableConnector(DefaultConnector):
+    def get_file(self, file_name, local_file_name=None):
+        pass
+
+    def put_file(self, remote_name=None, local_name=None, overwrite=False):
+        raise ConnectionError("Server unreachable")
+
+
+def test_dataset_is_done_after_its_upload(tmp_path):
+    connector = UnreachableConnector()
+    connector.base_dir = str(tmp_path / "remote")
+    stores = MonthlyStores(str(tmp_path / "datasets"), connector=connector, remote_dir=main.DATASET_DIR)
+    result = make_result(datetime.datetime(2023, 6, 1, 12, 0))
+    future = Future()
+    future.set_result(([], [result]))
+    run = Manifest(str(tmp_path / "manifest.sqlite"))
+    uploading = list()
+    main.queue_uploads([future], None, Counter(), uploading, run, stores=stores)
+    # Nothing is done while the file is local
+    assert uploading == []
+    assert run.status(result) is None
+
+    uploader = UploadQueue(connector)
+    main.upload_datasets(stores, uploader, uploading)
+    assert len(uploader.close()) == 1
+    assert main.record_uploaded(uploading, run) == []
+    assert run.status(result) == manifest.FAILED
+    run.close()
+
+
+def test_bursts_on_the_server_are_kept(tmp_path, webdav_connector, webdav_server):
+    remote_dir = os.path.join(webdav_server.root, main.DATASET_DIR)
+    os.makedirs(remote_dir)
+    store = BurstStore(os.path.join(remote_dir, "bursts_2023_06.h5"))
+    store.append(make_result(datetime.datetime(2023, 6, 1, 12, 0)))
+    store.close()
+
+    # An empty local directory, e.g. on another machine
+    stores = MonthlyStores(str(tmp_path / "datasets"), connector=webdav_connector, remote_dir=main.DATASET_DIR)
+    assert stores.append(make_result(datetime.datetime(2023, 6, 1, 12, 0))) == ("bursts_2023_06.h5", "00000000")
+    assert stores.append(make_result(datetime.datetime(2023, 6, 2, 8, 0))) == ("bursts_2023_06.h5", "00000001")
+    uploader = UploadQueue(webdav_connector)
+    main.upload_datasets(stores, uploader, list())
+    assert uploader.close() == []
+
+    store = BurstStore(os.path.join(remote_dir, "bursts_2023_06.h5"), mode="r")
+    assert list(store.index()["start"].dt.day) == [1, 2]
+    store.close()
+
+
+def test_observations_keep_the_spectrogram(fits_archive, make_observation):
+    obs = make_observation((12, 5), (12, 10), output=OUTPUT_DATASET)
+    day = burstprocessor.plan_days([obs])[0]
+    day.archive_url = fits_archive
+
+    connector = SpoolConnector()
+    results = burstprocessor.write_instrument_day(day, connector)
+    assert connector.take() == []
+    for result in results:
+        assert result.rejection is None
+        assert result.record["data"].dtype == np.float32
+        assert result.record["data"].shape == (len(result.record["freq_axis"]), len(result.record["time_axis"]))
+
+
+def test_pool_appends_to_the_monthly_file(fits_archive, tmp_path, monkeypatch, make_observation):
+    obs = make_observation((12, 5), (12, 10), output=OUTPUT_DATASET)
+    days = burstprocessor.plan_days([obs])
+    days[0].archive_url = fits_archive
+    connector = DefaultConnector()
+    connector.base_dir = str(tmp_path / "out")
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("logs")
+
+    stores = MonthlyStores("datasets", compression=None)
+    uploader = UploadQueue(connector)
+    rejections = main.process_in_pool(days, uploader, max_workers=1, stores=stores)
+    assert uploader.close() == []
+    assert uploader.uploaded == 0
+    assert sum(rejections.values()) == 0
+    assert stores.close() == {}
+    store = BurstStore(os.path.join("datasets", month_file_name(obs.event_time_start)), mode="r")
+    assert list(store.index()["instrument"]) == ["TEST-STATION"]
+    store.close()
@@ -0,0 +1,104 @@
+import datetime
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, '..')
+import burstprocessor
+from dayloader import InstrumentDay
+from radiospectra.sources import CallistoSpectrogram
+from standins import write_callisto_fits
+from utils.validation import Screening, spectrogram_stats
+
+
+def test_window_is_view_into_day_array(fits_archive):
+    day = InstrumentDay("TEST-STATION", datetime.date(2023, 6, 1))
+    day.archive_url = fits_archive
+    day.load([(datetime.datetime(2023, 6, 1, 12, 10), datetime.datetime(2023, 6, 1, 12, 20)),
+              (datetime.datetime(2023, 6, 1, 12, 40), datetime.datetime(2023, 6, 1, 12, 50))])
+
+    first = day.window(datetime.datetime(2023, 6, 1, 12, 10), datetime.datetime(2023, 6, 1, 12, 20))
+    second = day.window(datetime.datetime(2023, 6, 1, 12, 40), datetime.datetime(2023, 6, 1, 12, 50))
+    assert first.data.dtype == np.float32
+    assert first.shape == (16, 600)
+    assert first.start == datetime.datetime(2023, 6, 1, 12, 10)
+    # Each load window has an array of its own files
+    assert first.data.base.shape == (16, 1800)
+    assert second.data.base.shape == (16, 1800)
+    assert first.data.base is not second.data.base
+    inner = day.window(datetime.datetime(2023, 6, 1, 12, 12), datetime.datetime(2023, 6, 1, 12, 14))
+    assert inner.data.base is first.data.base
+
+    # The data must be the same as in the archive file
+    path = os.path.join(fits_archive, "2023", "06", "01", "TEST-STATION_20230601_121500_01.fit.gz")
+    original = CallistoSpectrogram.read(path)
+    np.testing.assert_array_equal(first.data[:, 300:], original.data[:, :300])
+
+
+def test_gaps_repeat_the_last_time_step(gappy_archive):
+    day = InstrumentDay("TEST-STATION", datetime.date(2023, 6, 1))
+    day.archive_url = gappy_archive
+    day.load([(datetime.datetime(2023, 6, 1, 12, 10), datetime.datetime(2023, 6, 1, 12, 20)),
+              (datetime.datetime(2023, 6, 1, 12, 40), datetime.datetime(2023, 6, 1, 12, 50))])
+
+    first = day.window(datetime.datetime(2023, 6, 1, 12, 10), datetime.datetime(2023, 6, 1, 12, 20))
+    assert np.isfinite(first.data).all()
+    # 12:14:59 is missing between the first and the second file
+    np.testing.assert_array_equal(first.data[:, 299], first.data[:, 298])
+
+    # Nothing is allocated for the missing file of 12:30 between the windows
+    second = day.window(datetime.datetime(2023, 6, 1, 12, 40), datetime.datetime(2023, 6, 1, 12, 50))
+    assert second.start == datetime.datetime(2023, 6, 1, 12, 45)
+    assert np.isfinite(second.data).all()
+    # 12:00 to 12:30 with the filled sample at 12:14:59, and 12:45 to 13:00
+    assert (first.data.base.shape[1], second.data.base.shape[1]) == (2 * 899 + 1, 899)
+    with pytest.raises(ValueError):
+        day.window(datetime.datetime(2023, 6, 1, 12, 31), datetime.datetime(2023, 6, 1, 12, 35))
+
+
+def test_windows_far_apart_do_not_fill_the_hours_between(fits_archive):
+    day = InstrumentDay("TEST-STATION", datetime.date(2023, 6, 1))
+    day.archive_url = fits_archive
+    day.load([(datetime.datetime(2023, 6, 1, 12, 5), datetime.datetime(2023, 6, 1, 12, 10)),
+              (datetime.datetime(2023, 6, 1, 12, 50), datetime.datetime(2023, 6, 1, 12, 55))])
+
+    first = day.window(datetime.datetime(2023, 6, 1, 12, 5), datetime.datetime(2023, 6, 1, 12, 10))
+    second = day.window(datetime.datetime(2023, 6, 1, 12, 50), datetime.datetime(2023, 6, 1, 12, 55))
+    # One file each, the two files between them are not loaded
+    assert first.data.base.shape == (16, 900)
+    assert second.data.base.shape == (16, 900)
+    with pytest.raises(ValueError):
+        day.window(datetime.datetime(2023, 6, 1, 12, 20), datetime.datetime(2023, 6, 1, 12, 25))
+
+
+def test_gaps_keep_the_observation(gappy_archive, make_observation):
+    obs = make_observation((12, 13), (12, 17))
+    day = burstprocessor.plan_days([obs])[0]
+    day.archive_url = gappy_archive
+    day.load(burstprocessor.load_windows(day))
+
+    rejection = obs.create_spectrogram(source=day.window(obs.event_time_start, obs.event_time_end),
+                                       screening=Screening())
+    assert rejection is None
+    assert np.isfinite(obs.spectrum.data).all()
+    assert np.isfinite(spectrogram_stats(obs.spectrum).snr)
+
+
+def test_observation_is_cut_with_whole_samples(tmp_path, make_observation):
+    day_dir = tmp_path / "2023" / "06" / "01"
+    os.makedirs(day_dir)
+    # 4 samples per second like most of the e-Callisto instruments
+    write_callisto_fits(day_dir / "TEST-STATION_20230601_120000_01.fit.gz", "TEST-STATION",
+                        datetime.datetime(2023, 6, 1, 12, 0), n_time=3600, t_delt=0.25)
+    obs = make_observation((12, 6), (12, 8))
+    obs.event_time_start += datetime.timedelta(seconds=0.1)
+    day = burstprocessor.plan_days([obs])[0]
+    day.archive_url = str(tmp_path)
+    day.load([(datetime.datetime(2023, 6, 1, 12, 5), datetime.datetime(2023, 6, 1, 12, 10))])
+    source = day.window(datetime.datetime(2023, 6, 1, 12, 5), datetime.datetime(2023, 6, 1, 12, 10))
+
+    obs.create_spectrogram(prettify=False, source=source)
+    assert obs.spectrum.shape == (16, 480)
+    np.testing.assert_array_equal(obs.spectrum.data, source.data[:, 240:720])
@@ -0,0 +1,66 @@
+import datetime
+import os
+import sys
+
+sys.path.insert(0, '..')
+from standins import write_callisto_fits
+from utils import fitscache
+from utils.fitscache import FitsCache, parse_fits_filename
+
+
+def test_parse_fits_filename():
+    instrument, start, focus = parse_fits_filename("ALASKA-ANCHORAGE_20230601_121500_01.fit.gz")
+    assert instrument == "ALASKA-ANCHORAGE"
+    assert start == datetime.datetime(2023, 6, 1, 12, 15)
+    assert focus == "01"
+    assert parse_fits_filename("index.html") is None
+
+
+def test_from_range_reads_through_cache(fits_archive, tmp_path):
+    cache = FitsCache(str(tmp_path / "cache"), archive_url=fits_archive)
+    start = datetime.datetime(2023, 6, 1, 12, 10)
+    end = datetime.datetime(2023, 6, 1, 12, 20)
+
+    spec = cache.from_range("TEST-STATION", start, end)
+    assert spec.shape == (16, 1800)
+    cached = sorted(os.path.basename(entry[2]) for entry in cache.cached_files())
+    assert cached == ["TEST-STATION_20230601_120000_01.fit.gz",
+                      "TEST-STATION_20230601_121500_01.fit.gz"]
+
+    # A second request must not touch the archive anymore
+    os.rename(fits_archive, fits_archive + ".gone")
+    path = cache.fetch("TEST-STATION_20230601_121500_01.fit.gz")
+    assert os.path.exists(path)
+
+
+def test_evicts_least_recently_used(fits_archive, tmp_path):
+    cache = FitsCache(str(tmp_path / "cache"), archive_url=fits_archive)
+    cache.EVICTION_GRACE_SECONDS = 0
+    files = cache.files_for_range("TEST-STATION",
+                                  datetime.datetime(2023, 6, 1, 12, 0),
+                                  datetime.datetime(2023, 6, 1, 13, 0))
+    assert len(files) == 4
+    for i, f in enumerate(files[:3]):
+        path = cache.fetch(f)
+        os.utime(path, (1000 + i, 1000 + i))
+
+    # Room for three files only. The oldest one has to go.
+    cache.max_bytes = cache.size() + 1
+    cache.fetch(files[3])
+    cached = sorted(os.path.basename(entry[2]) for entry in cache.cached_files())
+    assert cached == sorted(files[1:])
+
+
+def test_listing_of_today_is_not_remembered(tmp_path):
+    now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None, minute=0, second=0, microsecond=0)
+    day_dir = tmp_path / now.strftime("%Y/%m/%d")
+    os.makedirs(day_dir)
+    first = now.replace(hour=0)
+    write_callisto_fits(day_dir / f"TEST-STATION_{first.strftime('%Y%m%d_%H%M%S')}_01.fit.gz", "TEST-STATION", first)
+    end = first + datetime.timedelta(days=1)
+    assert len(fitscache.archive_files(str(tmp_path), "TEST-STATION", first, end)) == 1
+
+    # A file uploaded later in the day is seen by the next listing
+    later = first + datetime.timedelta(minutes=15)
+    write_callisto_fits(day_dir / f"TEST-STATION_{later.strftime('%Y%m%d_%H%M%S')}_01.fit.gz", "TEST-STATION", later)
+    assert len(fitscache.archive_files(str(tmp_path), "TEST-STATION", first, end)) == 2
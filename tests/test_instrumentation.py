@@ -0,0 +1,76 @@
+import csv
+import datetime
+import json
+import sys
+
+sys.path.insert(0, '..')
+import burstprocessor
+from connectors.spoolconnector import SpoolConnector
+from manifest import ObservationResult
+from utils.instrumentation import RunReport, StageTimer, peak_rss
+
+
+def make_result(remote_name, rejection=None, seconds=None):
+    timer = StageTimer()
+    for stage, value in (seconds or {}).items():
+        timer.add(stage, value, 100)
+    timer.peak_rss = 1000
+    start = datetime.datetime(2023, 6, 1, 12, 0)
+    return ObservationResult("TEST-STATION", "III", start, start + datetime.timedelta(minutes=5),
+                             remote_name=remote_name, snr=None if rejection else 1.0, rejection=rejection,
+                             stages=timer.as_dict())
+
+
+def test_stage_timer_sums_up():
+    timer = StageTimer()
+    with timer.stage("render", 10):
+        pass
+    with timer.stage("render", 5):
+        pass
+    assert timer.bytes["render"] == 15
+    assert timer.seconds["render"] >= 0.0
+    assert peak_rss() > 0
+
+
+def test_report_aggregates_results_and_uploads(tmp_path):
+    report = RunReport()
+    report.add(make_result("type_III/a", seconds={"load": 1.0, "render": 0.5}))
+    report.add(make_result(None, rejection="no burst", seconds={"load": 1.0, "screen": 0.1}))
+    report.add_upload("type_III/a.jpg", 0.25, 300)
+    report.add_upload("type_III/a.fit.gz", 0.5, 700)
+    report.add_run_stage("prefetch", 3.0, 5000)
+
+    summary = report.summary()
+    assert summary["observations"] == 2
+    assert summary["written"] == 1
+    assert summary["stages"]["load"]["seconds"] == 2.0
+    assert summary["stages"]["upload"] == {"seconds": 0.75, "bytes": 1000}
+    assert summary["stages"]["prefetch"] == {"seconds": 3.0, "bytes": 5000}
+    assert list(summary["stages"]) == ["prefetch", "load", "screen", "render", "upload"]
+    assert summary["worker_peak_rss"] == 1000
+
+    report.write(str(tmp_path / "report.json"))
+    with open(tmp_path / "report.json") as f:
+        assert json.load(f)["observations"][0]["bytes"]["upload"] == 1000
+
+    report.write(str(tmp_path / "report.csv"))
+    with open(tmp_path / "report.csv", newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert [row["rejection"] for row in rows] == ["", "no burst"]
+    assert float(rows[0]["upload_seconds"]) == 0.75
+    assert float(rows[1]["render_seconds"]) == 0.0
+
+
+def test_write_instrument_day_times_stages(fits_archive, make_observation):
+    observations = [make_observation((12, 5), (12, 10)), make_observation((12, 20), (12, 30))]
+    day = burstprocessor.plan_days(observations)[0]
+    day.archive_url = fits_archive
+
+    results = burstprocessor.write_instrument_day(day, SpoolConnector())
+    for result in results:
+        assert {"fetch", "load", "slice", "prettify", "snr"} <= set(result.stages["seconds"])
+        assert result.stages["bytes"]["fetch"] > 0
+        assert result.stages["peak_rss"] > 0
+        if result.rejection is None:
+            assert result.stages["bytes"]["put_file"] > 0
+            assert result.stages["bytes"]["render"] > 0
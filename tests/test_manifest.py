@@ -0,0 +1,64 @@
+import datetime
+import sys
+from collections import Counter
+from concurrent.futures import Future
+
+sys.path.insert(0, '..')
+import burstlist
+import burstprocessor
+import main
+import manifest
+from manifest import Manifest, ObservationResult
+from utils import validation
+
+
+def result_for(row, rejection=None):
+    return ObservationResult(row.instrument, str(row.type), row.start.to_pydatetime(), row.end.to_pydatetime(),
+                             row_hash=row.row_hash, remote_name="type_III/x", snr=1.5, rejection=rejection)
+
+
+def test_only_new_or_changed_rows_are_pending(burst_list_file, tmp_path):
+    plan = burstprocessor.plan_observations(burstlist.process_burst_list(burst_list_file, use_cache=False))
+    path = str(tmp_path / "manifest.sqlite")
+    run = Manifest(path)
+    assert len(run.pending(plan)) == len(plan)
+
+    rows = list(plan.itertuples(index=False))
+    run.record(result_for(rows[0]), manifest.DONE)
+    run.record(result_for(rows[1], "no burst"), manifest.REJECTED)
+    run.record(result_for(rows[2], "load failed"), manifest.FAILED)
+    run.close()
+
+    # An interrupted run starts over with what is left
+    run = Manifest(path)
+    pending = run.pending(plan)
+    assert len(pending) == len(plan) - 2
+    assert rows[2].start in list(pending["start"])
+    assert run.status(result_for(rows[0])) == manifest.DONE
+
+    # A corrected row in the burst list is processed again
+    changed = plan.copy()
+    changed.loc[0, "row_hash"] = "0" * 16
+    assert len(run.pending(changed)) == len(plan) - 1
+    run.close()
+
+
+def test_result_key():
+    result = ObservationResult("GLASGOW", "III", datetime.datetime(2023, 6, 1, 12, 1), datetime.datetime(2023, 6, 1, 12, 9))
+    assert result.key() == ("GLASGOW", "III", "2023-06-01 12:01:00", "2023-06-01 12:09:00")
+
+
+def test_invalid_snr_is_tried_again(burst_list_file, tmp_path):
+    plan = burstprocessor.plan_observations(burstlist.process_burst_list(burst_list_file, use_cache=False))
+    run = Manifest(str(tmp_path / "manifest.sqlite"))
+    rows = list(plan.itertuples(index=False))
+    future = Future()
+    future.set_result(([], [result_for(rows[0], validation.INVALID_SNR), result_for(rows[1], validation.NO_BURST)]))
+
+    rejections = Counter()
+    main.queue_uploads([future], None, rejections, [], run)
+    assert rejections == Counter({validation.INVALID_SNR: 1, validation.NO_BURST: 1})
+    assert run.status(result_for(rows[0])) == manifest.FAILED
+    assert run.status(result_for(rows[1])) == manifest.REJECTED
+    assert len(run.pending(plan)) == len(plan) - 1
+    run.close()
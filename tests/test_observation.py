@@ -13,3 +13,25 @@ def test_suggest_filename():
 
     filename = obs.suggest_filename()
     assert filename == "Arecibo_20230101_1100_1130"
+
+
+def test_encode_fits_roundtrip(fits_archive):
+    import gzip
+    import io
+    import os
+
+    import numpy as np
+    from radiospectra.sources import CallistoSpectrogram
+
+    path = os.path.join(fits_archive, "2023", "06", "01", "TEST-STATION_20230601_120000_01.fit.gz")
+    obs = Observation.RadioBurstObservation()
+    obs.spectrum = CallistoSpectrogram.read(path)
+    obs.spectrum.header.append(("snr", 4.2))
+
+    encoded = obs.encode_fits()
+    decoded = CallistoSpectrogram.read(io.BytesIO(gzip.decompress(encoded)))
+    np.testing.assert_array_equal(decoded.data, obs.spectrum.data)
+    np.testing.assert_array_equal(decoded.freq_axis, obs.spectrum.freq_axis)
+    np.testing.assert_array_equal(decoded.time_axis, obs.spectrum.time_axis)
+    assert decoded.header["snr"] == 4.2
+    assert decoded.start == obs.spectrum.start
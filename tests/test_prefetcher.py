@@ -0,0 +1,42 @@
+import datetime
+import os
+import sys
+
+sys.path.insert(0, '..')
+import burstprocessor
+from prefetcher import Prefetcher
+from standins import ArchiveHandler, StandInServer
+from utils.fitscache import FitsCache
+
+
+def test_days_are_ready_with_local_files(fits_archive, tmp_path, make_observation):
+    with StandInServer(fits_archive, handler=ArchiveHandler) as server:
+        cache = FitsCache(str(tmp_path / "cache"), archive_url=server.url + "/")
+        observations = [make_observation((12, 5), (12, 10), fits_cache=cache),
+                        make_observation((12, 35), (12, 40), fits_cache=cache)]
+        days = burstprocessor.plan_days(observations)
+        # Another day of the station without any files
+        days += burstprocessor.plan_days([make_observation((12, 5), (12, 10), fits_cache=cache)])
+        days[1].day = datetime.date(2023, 6, 2)
+        days[1].observations[0].event_time_start += datetime.timedelta(days=1)
+        days[1].observations[0].event_time_end += datetime.timedelta(days=1)
+
+        prefetcher = Prefetcher(cache, concurrency=2)
+        ready = list(prefetcher.ready(days, look_ahead=1))
+        prefetcher.close()
+        fetched = server.requests["GET"]
+
+    assert ready == days
+    assert days[0].known_files == ["TEST-STATION_20230601_120000_01.fit.gz",
+                                   "TEST-STATION_20230601_123000_01.fit.gz"]
+    assert days[1].known_files == []
+    assert prefetcher.fetched == 2
+    assert prefetcher.seconds > 0.0
+    assert prefetcher.bytes == sum(entry[1] for entry in cache.cached_files())
+    assert sorted(os.path.basename(entry[2]) for entry in cache.cached_files()) == days[0].known_files
+
+    # The server is gone, the worker reads from the cache only
+    results = burstprocessor.write_instrument_day(days[0])
+    assert all(r.rejection != burstprocessor.LOAD_FAILED for r in results)
+    # One listing per day and two files
+    assert fetched == 4
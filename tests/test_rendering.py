@@ -0,0 +1,59 @@
+import io
+import os
+import sys
+
+import numpy as np
+from PIL import Image
+from radiospectra.sources import CallistoSpectrogram
+from radiospectra.spectrogram import _LinearView
+
+sys.path.insert(0, '..')
+from utils.rendering import SpectrogramRenderer, linear_rows, pool
+
+
+def test_pool_keeps_narrow_bursts():
+    data = np.zeros((3, 1000))
+    data[1, 517] = 30.0
+    data[2, :5] = np.nan
+    pooled = pool(data, 100, axis=1, how="max")
+    assert pooled.shape == (3, 100)
+    assert pooled[1, 51] == 30.0
+    assert pooled[2, 0] == 0.0
+    assert pool(data, 2000, axis=1) is data
+
+
+def test_mean_pool_ignores_nan():
+    data = np.array([[1.0, 3.0, np.nan, np.nan, 5.0]])
+    pooled = pool(data, 3, axis=1)
+    np.testing.assert_array_equal(pooled, [[2.0, np.nan, 5.0]])
+
+
+def test_linear_rows_like_radiospectra():
+    freq_axis = np.array([870.0, 860.0, 700.5, 699.0, 410.0, 45.0])
+    rows, delt = linear_rows(freq_axis)
+
+    class Spec:
+        pass
+    spec = Spec()
+    spec.freq_axis = freq_axis
+    spec.time_axis = np.arange(2)
+    spec.data = np.zeros((len(freq_axis), 2))
+    view = _LinearView(spec, delt)
+    assert len(rows) == len(view)
+    assert [view._find(np.arange(len(freq_axis)), i) for i in range(len(view))] == list(rows)
+
+
+def test_renderer_reuses_its_figure(fits_archive):
+    path = os.path.join(fits_archive, "2023", "06", "01", "TEST-STATION_20230601_120000_01.fit.gz")
+    spectrum = CallistoSpectrogram.read(path)
+    renderer = SpectrogramRenderer()
+    first = renderer.render(spectrum)
+    figure = renderer.figure
+    second = renderer.render(CallistoSpectrogram.read(path.replace("120000", "121500")))
+
+    assert renderer.figure is figure
+    assert len(figure.axes) == 2
+    for jpeg in (first, second):
+        image = Image.open(io.BytesIO(jpeg))
+        assert image.format == "JPEG"
+        assert image.size == (1000, 620)
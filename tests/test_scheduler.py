@@ -0,0 +1,88 @@
+import logging
+import os
+import sys
+
+sys.path.insert(0, '..')
+import burstprocessor
+import main
+import scheduler
+from connectors.defaultconnector import DefaultConnector
+from connectors.uploadqueue import UploadQueue
+from scheduler import MemoryScheduler
+from utils.fitscache import FitsCache
+
+
+def test_estimate_follows_the_load_windows(make_observation):
+    memory = MemoryScheduler(1024**3)
+    short = burstprocessor.plan_days([make_observation((12, 5), (12, 10))])[0]
+    spread = burstprocessor.plan_days([make_observation((1, 5), (1, 10)), make_observation((22, 5), (22, 10))])[0]
+    longer = burstprocessor.plan_days([make_observation((12, 5), (14, 10))])[0]
+    # One file of 200 channels at 4 samples per second
+    assert memory.estimate(short) >= scheduler.DEFAULT_CHANNELS * 3600 * scheduler.DAY_BYTES_PER_SAMPLE
+    # The hours between the two observations are not loaded
+    assert memory.estimate(spread) < 3 * memory.estimate(short)
+    assert memory.estimate(longer) > 5 * memory.estimate(short)
+
+
+def test_channels_are_read_from_the_cache(fits_archive, tmp_path, make_observation):
+    cache = FitsCache(str(tmp_path / "cache"), archive_url=fits_archive)
+    day = burstprocessor.plan_days([make_observation((12, 5), (12, 10), fits_cache=cache)])[0]
+    memory = MemoryScheduler(1024**3)
+    assert memory.channels(day) == scheduler.DEFAULT_CHANNELS
+
+    day.known_files = day.file_names(burstprocessor.load_windows(day))
+    cache.fetch(day.known_files[0])
+    assert memory.channels(day) == 16
+
+
+def test_budget_and_worker_count():
+    memory = MemoryScheduler(100)
+    assert memory.fits(500)
+    memory.acquire(60)
+    assert memory.fits(40)
+    assert not memory.fits(41)
+    memory.release(60)
+    assert memory.in_flight == 0
+
+    assert scheduler.worker_count(64 * 1024**3, cpus=1) == 1
+    assert scheduler.worker_count(64 * 1024**3, cpus=2) == 1
+    assert scheduler.worker_count(64 * 1024**3, cpus=32) == 31
+    assert scheduler.worker_count(2 * 1024**3, cpus=32) == 3
+    assert scheduler.memory_budget(1.5) == int(1.5 * 1024**3)
+
+
+def test_pool_recycles_workers(fits_archive, tmp_path, monkeypatch, make_observation):
+    observations = [make_observation((12, 5), (12, 10)), make_observation((12, 40), (12, 44))]
+    days = burstprocessor.plan_days(observations[:1]) + burstprocessor.plan_days(observations[1:])
+    for day in days:
+        day.archive_url = fits_archive
+    connector = DefaultConnector()
+    connector.base_dir = str(tmp_path / "out")
+    os.makedirs(os.path.join(connector.base_dir, "type_III"))
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("logs")
+
+    # The budget holds one day only, so the days run one after the other
+    memory = MemoryScheduler(1)
+    uploader = UploadQueue(connector)
+    rejections = main.process_in_pool(days, uploader, memory=memory, max_workers=1, max_tasks_per_child=1)
+    assert uploader.close() == []
+    assert memory.in_flight == 0
+    assert sum(rejections.values()) + uploader.uploaded // 2 == 2
+
+
+def test_recycled_workers_log_to_the_app_log(tmp_path, monkeypatch, make_observation):
+    days = burstprocessor.plan_days([make_observation((12, 5), (12, 10))])
+    days[0].archive_url = str(tmp_path / "no-archive")
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("logs")
+    # The root logger as main.py sets it up
+    handler = logging.FileHandler(str(tmp_path / "app.log"))
+    monkeypatch.setattr(logging.getLogger(), "handlers", [handler])
+
+    uploader = UploadQueue(DefaultConnector())
+    rejections = main.process_in_pool(days, uploader, max_workers=1, max_tasks_per_child=1)
+    uploader.close()
+    handler.close()
+    assert rejections == {burstprocessor.LOAD_FAILED: 1}
+    assert "Cannot load data for TEST-STATION" in (tmp_path / "app.log").read_text()
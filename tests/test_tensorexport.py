@@ -0,0 +1,171 @@
+import datetime
+import os
+import sys
+from collections import Counter
+from concurrent.futures import Future
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, '..')
+import burstprocessor
+import main
+from connectors.defaultconnector import DefaultConnector
+from connectors.spoolconnector import SpoolConnector
+from connectors.uploadqueue import UploadQueue
+from manifest import ObservationResult
+from utils import tensorexport
+from utils.tensorexport import TensorStore, open_tensors
+
+
+def make_result(value, shape=(4, 6), type="III", minute=0):
+    start = datetime.datetime(2023, 6, 1, 12, minute)
+    tensor = {"tensor": np.full(shape, value, dtype=np.float32), "freq_min": 45.0, "freq_max": 870.0}
+    return ObservationResult("TEST-STATION", type, start, start + datetime.timedelta(minutes=5),
+                             remote_name="type_III/a", snr=value, tensor=tensor)
+
+
+def test_parse_grid():
+    assert tensorexport.parse_grid("256x512") == (256, 512)
+    with pytest.raises(ValueError):
+        tensorexport.parse_grid("256")
+    with pytest.raises(ValueError):
+        tensorexport.parse_grid("0x512")
+
+
+def test_resample_keeps_orientation_and_values():
+    freq_axis = np.array([80.0, 60.0, 40.0])
+    time_axis = np.arange(5) * 0.25
+    data = np.add.outer(freq_axis, time_axis * 4)
+    resampled = tensorexport.resample(data, freq_axis, time_axis, (5, 9))
+    assert resampled.shape == (5, 9)
+    assert resampled.dtype == np.float32
+    # Linear data stays linear, the first row is the highest frequency
+    assert np.allclose(resampled[:, 0], [80, 70, 60, 50, 40])
+    assert np.allclose(resampled[0], 80 + np.linspace(0, 4, 9))
+
+    # Repeated channels do not divide by zero
+    repeated = tensorexport.resample(data, np.array([80.0, 80.0, 40.0]), time_axis, (3, 5))
+    assert np.isfinite(repeated).all()
+
+
+def test_store_grows_and_continues(tmp_path):
+    directory = str(tmp_path / "tensors")
+    store = TensorStore(directory, (4, 6), capacity=2)
+    for value in range(3):
+        assert store.append(make_result(float(value), minute=value)) == value
+    store.close()
+    assert os.path.getsize(os.path.join(directory, tensorexport.TENSOR_FILE)) == 3 * 4 * 6 * 4
+
+    store = TensorStore(directory, (4, 6), capacity=2)
+    store.append(make_result(3.0, type="II"))
+    store.close()
+
+    tensors, index = open_tensors(directory)
+    assert tensors.shape == (4, 4, 6)
+    assert isinstance(tensors, np.memmap)
+    assert [tensors[i, 0, 0] for i in range(4)] == [0.0, 1.0, 2.0, 3.0]
+    assert list(index["type"]) == ["III", "III", "III", "II"]
+    assert list(index["row"]) == [0, 1, 2, 3]
+
+    with pytest.raises(ValueError):
+        TensorStore(directory, (8, 6))
+
+
+def test_index_survives_a_crash(tmp_path):
+    directory = str(tmp_path / "tensors")
+    store = TensorStore(directory, (4, 6), capacity=2)
+    future = Future()
+    future.set_result(([], [make_result(1.0)]))
+    uploading = list()
+    main.queue_uploads([future], None, Counter(), uploading, tensors=store)
+    # The row is on disk before the observation can be done, in the log
+    # only. The index is written by close().
+    assert uploading[0][0].tensor is None
+    assert not os.path.exists(os.path.join(directory, tensorexport.INDEX_FILE))
+    tensors, index = open_tensors(directory)
+    assert list(index["row"]) == [0]
+    assert tensors[0, 0, 0] == 1.0
+    del tensors
+    # The run ends without close(), the next one continues after the index
+    store.append(make_result(2.0, type="II"))
+    store.tensors.flush()
+
+    store = TensorStore(directory, (4, 6), capacity=2)
+    assert len(store) == 1
+    assert store.append(make_result(3.0, type="II")) == 1
+    store.close()
+    assert not os.path.exists(os.path.join(directory, tensorexport.INDEX_LOG))
+    tensors, index = open_tensors(directory)
+    assert [tensors[i, 0, 0] for i in range(2)] == [1.0, 3.0]
+
+
+def test_flush_only_appends_the_new_rows(tmp_path):
+    directory = str(tmp_path / "tensors")
+    store = TensorStore(directory, (4, 6))
+    store.append(make_result(1.0))
+    store.close()
+
+    store = TensorStore(directory, (4, 6))
+    log = os.path.join(directory, tensorexport.INDEX_LOG)
+    sizes = list()
+    for minute in range(1, 4):
+        store.append(make_result(float(minute), minute=minute))
+        store.flush()
+        sizes.append(os.path.getsize(log))
+    # Every flush adds one row of about the same size
+    assert sizes[2] - sizes[1] == sizes[1] - sizes[0]
+    store.flush()
+    assert os.path.getsize(log) == sizes[2]
+    # A replaced row is logged again and wins over the index
+    store.append(make_result(9.0))
+    store.flush()
+
+    tensors, index = open_tensors(directory)
+    assert list(index["row"]) == [0, 1, 2, 3]
+    assert list(index["snr"]) == [9.0, 1.0, 2.0, 3.0]
+    assert index["start"][3] == datetime.datetime(2023, 6, 1, 12, 3)
+    assert tensors[0, 0, 0] == 9.0
+    del tensors
+    store.close()
+    assert list(tensorexport.read_index(os.path.join(directory, tensorexport.INDEX_FILE))[0]["snr"]) == \
+        [9.0, 1.0, 2.0, 3.0]
+
+
+def test_rerun_replaces_the_tensor(tmp_path):
+    directory = str(tmp_path / "tensors")
+    store = TensorStore(directory, (4, 6))
+    store.append(make_result(1.0))
+    store.close()
+
+    store = TensorStore(directory, (4, 6))
+    assert store.append(make_result(5.0)) == 0
+    assert store.append(make_result(6.0, type="II")) == 1
+    assert store.append(make_result(7.0, type="II")) == 1
+    store.close()
+    tensors, index = open_tensors(directory)
+    assert tensors.shape == (2, 4, 6)
+    assert [tensors[i, 0, 0] for i in range(2)] == [5.0, 7.0]
+    assert list(index["snr"]) == [5.0, 7.0]
+
+
+def test_observations_are_exported(fits_archive, tmp_path, monkeypatch, make_observation):
+    days = burstprocessor.plan_days([make_observation((12, 5), (12, 10), tensor_grid=(8, 32)),
+                                     make_observation((12, 20), (12, 30), tensor_grid=(8, 32))])
+    days[0].archive_url = fits_archive
+    results = burstprocessor.write_instrument_day(days[0], SpoolConnector())
+    assert [result.tensor["tensor"].shape for result in results if result.rejection is None] == [(8, 32)] * 2
+
+    connector = DefaultConnector()
+    connector.base_dir = str(tmp_path / "out")
+    os.makedirs(os.path.join(connector.base_dir, "type_III"))
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("logs")
+    tensors = TensorStore("tensors", (8, 32))
+    uploader = UploadQueue(connector)
+    rejections = main.process_in_pool(days, uploader, max_workers=1, tensors=tensors)
+    assert uploader.close() == []
+    tensors.close()
+    exported, index = open_tensors("tensors")
+    assert len(index) == 2 - sum(rejections.values())
+    assert exported.shape == (len(index), 8, 32)
@@ -1,10 +1,14 @@
+import datetime
 import sys
 
+import numpy as np
 import pytest
 
 sys.path.insert(0, '..')
 from utils.timeutils import (adjust_year_month_day, check_valid_date,
-                             extract_and_correct_time)
+                             extract_and_correct_time,
+                             extract_and_correct_times, months_in_range,
+                             parse_date_bound)
 
 
 def test_extractandcorrecttime(event_times):
@@ -26,3 +30,34 @@ def test_adjustyearmonth(event_dates):
 def test_checkvaliddate(year, month, day):
     with pytest.raises(AssertionError):
         check_valid_date(year, month, day)
+
+
+def test_extractandcorrecttimes(event_times):
+    start, end, invalid = extract_and_correct_times(list(event_times) + ["1x:00-10:05", "##:##-##:##"])
+    assert invalid.tolist() == [False] * len(event_times) + [True, True]
+    for i, t in enumerate(event_times):
+        expected_start, expected_end = extract_and_correct_time("12:55-12:56")
+        assert start[i] == np.datetime64(expected_start)
+        assert end[i] == np.datetime64(expected_end)
+        assert (str(start[i])[11:16], str(end[i])[11:16]) == event_times[t]
+
+
+def test_extractandcorrecttimes_with_dates():
+    start, end, invalid = extract_and_correct_times(["23:58-00:03", "10:10-10:12"], ["20230602", "2023060"])
+    assert start[0] == np.datetime64("2023-06-02T23:58")
+    assert end[0] == np.datetime64("2023-06-02T00:03")
+    assert invalid.tolist() == [False, True]
+
+
+def test_parse_date_bound():
+    assert parse_date_bound("2020") == datetime.date(2020, 1, 1)
+    assert parse_date_bound("2020", last=True) == datetime.date(2020, 12, 31)
+    assert parse_date_bound("2024-2", last=True) == datetime.date(2024, 2, 29)
+    assert parse_date_bound("2021-03-14", last=True) == datetime.date(2021, 3, 14)
+    with pytest.raises(ValueError):
+        parse_date_bound("March 2021")
+
+
+def test_months_in_range():
+    months = months_in_range(datetime.date(2020, 11, 15), datetime.date(2021, 2, 1))
+    assert months == [(2020, 11), (2020, 12), (2021, 1), (2021, 2)]
@@ -0,0 +1,65 @@
+import os
+import sys
+import threading
+
+sys.path.insert(0, '..')
+from connectors.defaultconnector import DefaultConnector
+from connectors.spoolconnector import SpoolConnector
+from connectors.uploadqueue import UploadQueue
+
+
+def test_uploads_spooled_files_to_webdav(webdav_connector, webdav_server):
+    os.makedirs(os.path.join(webdav_server.root, "type_III"))
+    spool = SpoolConnector()
+    for i in range(5):
+        spool.put_file(remote_name=f"type_III/burst_{i}.jpg", local_name=b"x" * (i + 1), overwrite=True)
+
+    uploader = UploadQueue(webdav_connector, concurrency=3, max_pending=2)
+    for remote_name, content, overwrite in spool.take():
+        uploader.put_file(remote_name=remote_name, local_name=content, overwrite=overwrite)
+    assert uploader.close() == []
+
+    assert sorted(os.listdir(os.path.join(webdav_server.root, "type_III"))) == [f"burst_{i}.jpg" for i in range(5)]
+    assert os.path.getsize(os.path.join(webdav_server.root, "type_III", "burst_4.jpg")) == 5
+    assert spool.take() == []
+
+
+def test_local_files_are_removed_after_upload(tmp_path):
+    connector = DefaultConnector()
+    connector.base_dir = str(tmp_path / "out")
+    os.makedirs(connector.base_dir)
+    local_name = tmp_path / "local.fit.gz"
+    local_name.write_bytes(b"fits")
+
+    uploader = UploadQueue(connector)
+    uploader.put_file(remote_name="a.fit.gz", local_name=str(local_name), overwrite=True, remove_local=True)
+    assert uploader.close() == []
+    assert not local_name.exists()
+    assert (tmp_path / "out" / "a.fit.gz").read_bytes() == b"fits"
+
+
+class SlowConnector(DefaultConnector):
+    def __init__(self) -> None:
+        super().__init__()
+        self.release = threading.Event()
+
+    def put_file(self, remote_name=None, local_name=None, overwrite=False):
+        self.release.wait(timeout=10)
+
+
+def test_put_file_blocks_when_queue_is_full():
+    connector = SlowConnector()
+    uploader = UploadQueue(connector, concurrency=1, max_pending=2)
+    uploader.put_file(remote_name="a", local_name="a")
+    uploader.put_file(remote_name="b", local_name="b")
+
+    third = threading.Thread(target=uploader.put_file, kwargs={"remote_name": "c", "local_name": "c"})
+    third.start()
+    third.join(timeout=0.2)
+    assert third.is_alive()
+
+    connector.release.set()
+    third.join(timeout=5)
+    assert not third.is_alive()
+    assert uploader.close() == []
+    assert uploader.uploaded == 3
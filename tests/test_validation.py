@@ -1,10 +1,16 @@
+import copy
+import os
 import sys
 
 import numpy as np
 import pytest
+from radiospectra.sources import CallistoSpectrogram
 
 sys.path.insert(0, '..')
-from utils.validation import calculate_snr
+from utils import validation
+from utils.background import subtract_background
+from utils.validation import (Screening, calculate_snr, has_burst_data,
+                              spectrogram_stats)
 
 
 def test_validation_for_gauss():
@@ -19,3 +25,67 @@ def test_burst_detection():
     # valid_spec = CallistoSpectrogram.read("resources/ALASKA_HAARP_VALID.fit.gz")
     # invalid_spec = CallistoSpectrogram.read("resources/ALASKA_HAARP_VALID.fit.gz")
     pass
+
+
+def test_stats_match_numpy():
+    rng = np.random.default_rng(1)
+    data = rng.normal(120.0, 5.0, (200, 3000)).astype(np.float32)
+    data[3, 100:200] = np.nan
+    data[:, 7] = np.nan
+
+    stats = spectrogram_stats(data)
+    assert stats.mean == pytest.approx(np.nanmean(data, dtype=np.float64), rel=1e-9)
+    assert stats.std == pytest.approx(np.nanstd(data, dtype=np.float64), rel=1e-6)
+    assert stats.max == np.nanmax(data)
+    assert stats.count == np.isfinite(data).sum()
+    with pytest.warns(RuntimeWarning):
+        expected = np.nanmean(data, axis=0, dtype=np.float64)
+    np.testing.assert_allclose(stats.time_mean, expected, rtol=1e-9)
+    assert calculate_snr(data) == pytest.approx(np.nanmean(data) / np.nanstd(data), rel=1e-5)
+    assert has_burst_data(data, stats) == has_burst_data(data)
+
+
+def test_stats_of_a_stack():
+    rng = np.random.default_rng(2)
+    first = rng.normal(10.0, 2.0, (50, 400))
+    second = rng.normal(30.0, 1.0, (50, 400))
+
+    stats = spectrogram_stats([first, second])
+    np.testing.assert_allclose(stats.mean, [first.mean(), second.mean()])
+    np.testing.assert_allclose(stats.std, [first.std(), second.std()])
+    np.testing.assert_allclose(stats.max, [first.max(), second.max()])
+    np.testing.assert_allclose(stats.time_mean, [first.mean(axis=0), second.mean(axis=0)])
+
+
+def test_screening_drops_noise():
+    rng = np.random.default_rng(4)
+    noise = rng.normal(100.0, 5.0, (16, 900)).astype(np.float32)
+    burst = noise.copy()
+    burst[:, 400:440] += 40.0
+    gap = np.full((16, 900), np.nan, dtype=np.float32)
+
+    screening = Screening(min_snr=None)
+    assert screening.reject(noise) == validation.NO_BURST
+    assert screening.reject(burst) is None
+    assert screening.reject(gap) == validation.NO_DATA
+    assert Screening(min_snr=100.0).reject(burst) == validation.LOW_SNR
+    assert Screening(min_snr=None, require_burst=False).reject(noise) is None
+
+
+def test_screening_uses_the_chosen_background(fits_archive, monkeypatch):
+    path = os.path.join(fits_archive, "2023", "06", "01", "TEST-STATION_20230601_121500_01.fit.gz")
+    spectrogram = CallistoSpectrogram.read(path)
+    calls = list()
+
+    def subtract_bg(self, *args):
+        calls.append(args)
+        result = copy.copy(self)
+        result.data = subtract_background(self.data, channel_sigma=None)
+        return result
+
+    # The radiospectra fork is not needed to see that it is asked
+    monkeypatch.setattr(CallistoSpectrogram, "subtract_bg", subtract_bg)
+    Screening(min_snr=None, require_burst=False).reject(spectrogram)
+    assert calls == []
+    assert Screening(min_snr=None, require_burst=False, fast_background=False).reject(spectrogram) is None
+    assert calls == [("constbacksub", "elimwrongchannels")]
@@ -0,0 +1,59 @@
+import logging
+import os
+import sys
+
+sys.path.insert(0, '..')
+import burstprocessor
+import worker
+from utils import fitscache
+
+
+def test_init_worker_sets_up_one_handler(tmp_path):
+    worker.init_worker(None, str(tmp_path))
+    worker.init_worker(None, str(tmp_path))
+    logger = logging.getLogger(worker.observation_logger_name())
+    try:
+        assert len(logger.handlers) == 1
+        assert len(list(tmp_path.glob("observations_*.log"))) >= 1
+    finally:
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+            handler.close()
+
+
+def test_profile_is_written_per_worker(tmp_path, fits_archive, make_observation):
+    worker.init_worker(None, str(tmp_path), profile=True)
+    logger = logging.getLogger(worker.observation_logger_name())
+    try:
+        day = burstprocessor.plan_days([make_observation((12, 5), (12, 10))])[0]
+        day.archive_url = fits_archive
+        worker.process_instrument_day(day)
+        assert (tmp_path / f"profile_{os.getpid()}.prof").stat().st_size > 0
+    finally:
+        worker.init_worker(None, str(tmp_path))
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+            handler.close()
+
+
+def test_chunk_reuses_the_listing_of_a_day(tmp_path, fits_archive, make_observation):
+    worker.init_worker(None, str(tmp_path))
+    logger = logging.getLogger(worker.observation_logger_name())
+    try:
+        observations = [make_observation((12, 5), (12, 10)), make_observation((12, 50), (12, 55))]
+        days = burstprocessor.plan_days(observations)
+        days[0].archive_url = fits_archive
+        before = fitscache.cached_archive_day.cache_info()
+        spooled, results = worker.process_chunk(burstprocessor.DayChunk(days))
+        after = fitscache.cached_archive_day.cache_info()
+        assert spooled == []
+        assert len(results) == 2
+        # Two load windows, one listing
+        assert after.misses - before.misses == 1
+        assert after.hits - before.hits == 1
+        log = next(tmp_path.glob("observations_*.log")).read_text()
+        assert "Archive listings of this worker" in log
+    finally:
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+            handler.close()
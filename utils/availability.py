@@ -0,0 +1,199 @@
+"""
+An index of the files the e-Callisto archive holds per day. The listing of
+a day is fetched once and kept in a local SQLite file, so the planner knows
+which instruments recorded data before any worker tries to load it.
+version 1.0
+author: Andreas Wassmer
+project: Raumschiff
+"""
+import datetime
+import logging
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import requests
+
+from utils.fitscache import (DEFAULT_ARCHIVE_URL, FILE_DURATION, is_remote,
+                             list_archive_day, parse_fits_filename)
+
+# Stations upload their files late. The listing of a day is final only
+# after this time.
+FINAL_AFTER = datetime.timedelta(days=3)
+
+# A listing that may still change is fetched again after this time
+REFRESH_AFTER = datetime.timedelta(hours=6)
+
+# The instrument name used in the burst list for "many stations"
+WILDCARD = "e-Callisto"
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class AvailabilityIndex:
+    """
+    Knows for every day which files are in the archive. The index is kept
+    in memory and in a SQLite file. Missing days are listed concurrently over
+    one pooled HTTP session.
+    """
+    def __init__(self, path: str = "availability.sqlite", archive_url: str = DEFAULT_ARCHIVE_URL,
+                 concurrency: int = 8) -> None:
+        self.archive_url = archive_url
+        self.concurrency = concurrency
+        self.connection = sqlite3.connect(path)
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS days (day TEXT PRIMARY KEY, archive TEXT, listed TEXT NOT NULL)")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS files (day TEXT NOT NULL, name TEXT NOT NULL, PRIMARY KEY (day, name))")
+        # day -> instrument -> [(start, file name)]
+        self.__days = dict()
+
+    def ensure(self, days) -> None:
+        """
+        Makes sure the listings of the given days are known and recent
+        """
+        days = sorted(set(days))
+        stale = [day for day in days if not self.__load(day)]
+        if len(stale) == 0:
+            return
+        session = requests.Session() if is_remote(self.archive_url) else None
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=self.concurrency)
+        if session is not None:
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                listings = list(executor.map(lambda d: list_archive_day(self.archive_url, d, session), stale))
+        finally:
+            if session is not None:
+                session.close()
+        # SQLite is written by this thread only
+        for day, names in zip(stale, listings):
+            self.__store(day, names)
+        logging.info(f"Listed {len(stale)} day(s) of the archive")
+
+    def files(self, instrument: str, day: datetime.date) -> list:
+        """
+        Returns: (start, file name) of the files of an instrument on a day
+        """
+        self.ensure([day])
+        return self.__days[day].get(instrument, [])
+
+    def instruments(self, day: datetime.date) -> set:
+        self.ensure([day])
+        return set(self.__days[day])
+
+    def file_names(self, instrument: str, start: datetime.datetime, end: datetime.datetime) -> list:
+        """
+        Returns: the names of the files that overlap with [start, end)
+        """
+        names = list()
+        day = start.date()
+        while day <= end.date():
+            for file_start, name in self.files(instrument, day):
+                if file_start < end and file_start + FILE_DURATION > start:
+                    names.append(name)
+            day += datetime.timedelta(days=1)
+        return names
+
+    def is_available(self, instrument: str, start: datetime.datetime, end: datetime.datetime) -> bool:
+        return len(self.file_names(instrument, start, end)) > 0
+
+    def recording(self, start: datetime.datetime, end: datetime.datetime) -> list:
+        """
+        Returns: the instruments with data in [start, end)
+        """
+        instruments = set()
+        day = start.date()
+        while day <= end.date():
+            for instrument in self.instruments(day):
+                if self.is_available(instrument, start, end):
+                    instruments.add(instrument)
+            day += datetime.timedelta(days=1)
+        return sorted(instruments)
+
+    def expand_wildcards(self, plan: pd.DataFrame) -> pd.DataFrame:
+        """
+        Replaces the rows of the plan with the instrument e-Callisto by one
+        row for every instrument that recorded data in the time window
+        """
+        wildcards = plan["instrument"] == WILDCARD
+        if not wildcards.any():
+            return plan
+        self.ensure(self.__plan_days(plan.loc[wildcards]))
+        expanded = plan.loc[wildcards].copy()
+        expanded["instrument"] = [self.recording(row.start.to_pydatetime(), row.end.to_pydatetime())
+                                  for row in expanded.itertuples(index=False)]
+        expanded = expanded.explode("instrument").dropna(subset=["instrument"])
+        return pd.concat([plan.loc[~wildcards], expanded], ignore_index=True)
+
+    def filter_plan(self, plan: pd.DataFrame) -> pd.DataFrame:
+        """
+        Returns: the rows of the plan whose instrument has data in the time
+        window
+        """
+        if len(plan) == 0:
+            return plan
+        self.ensure(self.__plan_days(plan))
+        available = [self.is_available(row.instrument, row.start.to_pydatetime(), row.end.to_pydatetime())
+                     for row in plan.itertuples(index=False)]
+        dropped = len(plan) - sum(available)
+        if dropped > 0:
+            logging.info(f"Dropped {dropped} observation(s) without data in the archive")
+        return plan.loc[available]
+
+    def close(self) -> None:
+        self.connection.close()
+
+    @staticmethod
+    def __plan_days(plan: pd.DataFrame) -> set:
+        days = set()
+        for start, end in zip(plan["start"], plan["end"]):
+            day = start.date()
+            while day <= end.date():
+                days.add(day)
+                day += datetime.timedelta(days=1)
+        return days
+
+    def __load(self, day: datetime.date) -> bool:
+        """
+        Loads the listing of a day from the SQLite file
+
+        Returns: False if the listing is missing or may have changed since
+        """
+        if day in self.__days:
+            return True
+        row = self.connection.execute("SELECT archive, listed FROM days WHERE day = ?",
+                                      (day.isoformat(),)).fetchone()
+        if row is None or row[0] != self.archive_url:
+            return False
+        listed = datetime.datetime.strptime(row[1], TIME_FORMAT)
+        is_final = listed - datetime.datetime.combine(day, datetime.time()) >= FINAL_AFTER
+        if not is_final and datetime.datetime.now() - listed >= REFRESH_AFTER:
+            return False
+        names = [r[0] for r in self.connection.execute("SELECT name FROM files WHERE day = ?", (day.isoformat(),))]
+        self.__days[day] = self.__by_instrument(names)
+        return True
+
+    def __store(self, day: datetime.date, names: list) -> None:
+        with self.connection:
+            self.connection.execute("DELETE FROM files WHERE day = ?", (day.isoformat(),))
+            self.connection.executemany("INSERT OR IGNORE INTO files VALUES (?, ?)",
+                                        [(day.isoformat(), name) for name in names])
+            self.connection.execute("INSERT OR REPLACE INTO days VALUES (?, ?, ?)",
+                                    (day.isoformat(), self.archive_url,
+                                     datetime.datetime.now().strftime(TIME_FORMAT)))
+        self.__days[day] = self.__by_instrument(names)
+
+    @staticmethod
+    def __by_instrument(names: list) -> dict:
+        instruments = dict()
+        for name in names:
+            parts = parse_fits_filename(name)
+            if parts is None:
+                continue
+            instruments.setdefault(parts[0], list()).append((parts[1], name))
+        for files in instruments.values():
+            files.sort()
+        return instruments
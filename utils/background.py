@@ -0,0 +1,93 @@
+"""
+Background subtraction for the spectrograms. Does what
+subtract_bg("constbacksub", "elimwrongchannels") of the radiospectra fork
+does but writes the result into a single float32 buffer instead of
+allocating several copies of the spectrogram. Time steps without data (NaN)
+are left out of the background and stay NaN.
+tests/test_background.py compares both on the same data if the fork is
+installed. Until they match, radiospectra is the default, see --fast-bg.
+version 1.0
+author: Andreas Wassmer
+project: Raumschiff
+"""
+import copy
+import warnings
+
+import numpy as np
+from radiospectra.sources import CallistoSpectrogram
+
+# Share of the time steps with the lowest deviation that make up the
+# background, the same as radiospectra's auto_find_background
+BACKGROUND_AMOUNT = 0.05
+
+# A channel is eliminated if its standard deviation is more than this many
+# standard deviations above the mean of all channels
+CHANNEL_SIGMA = 5.0
+
+
+def background_columns(deviation: np.ndarray, amount: float = BACKGROUND_AMOUNT) -> np.ndarray:
+    """
+    Returns the time steps with the lowest standard deviation over the
+    channels. deviation is the data minus the mean of every channel. Time
+    steps with a NaN are never chosen.
+    """
+    n_time = deviation.shape[1]
+    n_channels = deviation.shape[0]
+    mean = deviation.sum(axis=0) / n_channels
+    # einsum sums the squares without a temporary copy of the data
+    variance = np.einsum("ij,ij->j", deviation, deviation) / n_channels - mean * mean
+    variance[np.isnan(variance)] = np.inf
+    # A stable sort picks the same columns as radiospectra on ties
+    return np.argsort(variance, kind="stable")[:max(1, int(amount * n_time))]
+
+
+def subtract_background(data: np.ndarray, out: np.ndarray = None, amount: float = BACKGROUND_AMOUNT,
+                        channel_sigma: float = CHANNEL_SIGMA) -> np.ndarray:
+    """
+    Subtracts a constant background from every channel and sets the
+    channels that are mostly noise to 0. NaN in data stays NaN in out.
+
+    The result is written to out, which must be a float32 array of the shape
+    of data. It may be data itself if data is float32 and may be changed.
+    If out is None a new buffer is allocated.
+
+    Returns: out
+    """
+    if out is None:
+        out = np.empty(data.shape, dtype=np.float32)
+    with warnings.catch_warnings():
+        # A channel without any data has no mean and stays NaN
+        warnings.simplefilter("ignore", RuntimeWarning)
+        channel_mean = np.nanmean(data, axis=1, dtype=np.float64)
+        np.subtract(data, channel_mean[:, np.newaxis], out=out, casting="unsafe")
+
+        # The background is the channel mean over the quietest time steps. out
+        # holds the data minus the channel mean already, so only the difference
+        # is left to subtract.
+        columns = background_columns(out, amount)
+        out -= np.nanmean(out[:, columns], axis=1, dtype=np.float64).astype(np.float32)[:, np.newaxis]
+
+        if channel_sigma is not None and out.shape[0] > 1:
+            channel_std = np.nanstd(out, axis=1, dtype=np.float64)
+            wrong = channel_std > np.nanmean(channel_std) + channel_sigma * np.nanstd(channel_std)
+            # Gaps of the channel stay NaN
+            out[wrong] *= 0.0
+    return out
+
+
+def prettify(spectrogram: CallistoSpectrogram, fast: bool = True, in_place: bool = False) -> CallistoSpectrogram:
+    """
+    Removes the background and the wrong channels of a spectrogram. With
+    fast=False radiospectra does the work, as we always did before.
+
+    in_place may only be set if no one else uses the data of the spectrogram.
+    The data of a window of an InstrumentDay is shared with other
+    observations, for example.
+    """
+    if not fast:
+        return spectrogram.subtract_bg("constbacksub", "elimwrongchannels")
+    data = np.asarray(spectrogram.data)
+    out = data if in_place and data.dtype == np.float32 else None
+    result = copy.copy(spectrogram)
+    result.data = subtract_background(data, out=out)
+    return result
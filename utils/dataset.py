@@ -0,0 +1,201 @@
+"""
+Writes the extracted bursts of a month into one HDF5 file instead of a
+.fit.gz and a .jpg per burst. Every burst is a group with its spectrogram
+and axes, and a table indexes all bursts of the file.
+
+Layout of a file:
+    /index            table with one row per burst, see INDEX_DTYPE
+    /bursts/<id>/data        the spectrogram, frequency x time, float32
+    /bursts/<id>/freq_axis   MHz
+    /bursts/<id>/time_axis   seconds since the start of the burst
+The group of a burst carries the metadata of the index and the FITS header
+as attributes.
+version 1.0
+author: Andreas Wassmer
+project: Raumschiff
+"""
+import os
+
+import h5py
+import numpy as np
+import pandas as pd
+
+INDEX_DTYPE = np.dtype([
+    ("id", "S8"),
+    ("instrument", "S32"),
+    ("type", "S8"),
+    ("start", "S19"),
+    ("end", "S19"),
+    ("snr", "f8"),
+    ("n_freq", "i4"),
+    ("n_time", "i4"),
+])
+
+TIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+# Chunks of the spectrograms along the time axis. A reader that needs a
+# part of a long burst only decompresses the chunks it touches.
+TIME_CHUNK = 1024
+
+
+def month_file_name(start) -> str:
+    return f"bursts_{start.strftime('%Y_%m')}.h5"
+
+
+class BurstStore:
+    """
+    One HDF5 file of bursts, opened for appending. compression is passed to
+    h5py. Without compression the spectrograms are stored contiguously and
+    can be memory mapped, see memmap().
+    """
+    def __init__(self, path: str, compression: str = "gzip", mode: str = "a") -> None:
+        self.path = path
+        self.compression = compression
+        self.file = h5py.File(path, mode)
+        if "index" not in self.file and mode != "r":
+            self.file.create_dataset("index", shape=(0,), maxshape=(None,), dtype=INDEX_DTYPE, chunks=(256,))
+            self.file.create_group("bursts")
+        # (instrument, type, start, end) -> id of the bursts in the file
+        index = self.file["index"][:]
+        self.ids = {key: burst_id.decode("ascii") for key, burst_id in
+                    zip(zip(index["instrument"], index["type"], index["start"], index["end"]), index["id"])}
+
+    def __len__(self) -> int:
+        return self.file["index"].shape[0]
+
+    def append(self, result) -> str:
+        """
+        Adds the burst of an ObservationResult that carries a record, see
+        RadioBurstObservation.dataset_record. A burst that is in the file
+        already is not added again.
+
+        Returns: the id of the burst in this file
+        """
+        key = (result.instrument.encode("ascii"), result.type.encode("ascii"),
+               result.start.strftime(TIME_FORMAT).encode("ascii"), result.end.strftime(TIME_FORMAT).encode("ascii"))
+        if key in self.ids:
+            return self.ids[key]
+        record = result.record
+        data = np.asarray(record["data"], dtype=np.float32)
+        burst_id = f"{len(self):08d}"
+        group = self.file["bursts"].create_group(burst_id)
+        if self.compression is None:
+            group.create_dataset("data", data=data)
+        else:
+            chunks = (data.shape[0], max(1, min(TIME_CHUNK, data.shape[1])))
+            group.create_dataset("data", data=data, chunks=chunks, compression=self.compression, shuffle=True)
+        group.create_dataset("freq_axis", data=np.asarray(record["freq_axis"], dtype=np.float64))
+        group.create_dataset("time_axis", data=np.asarray(record["time_axis"], dtype=np.float64))
+
+        row = np.zeros(1, dtype=INDEX_DTYPE)
+        row["id"] = burst_id
+        row["instrument"] = result.instrument
+        row["type"] = result.type
+        row["start"] = result.start.strftime(TIME_FORMAT)
+        row["end"] = result.end.strftime(TIME_FORMAT)
+        row["snr"] = np.nan if result.snr is None else result.snr
+        row["n_freq"], row["n_time"] = data.shape
+        for name in INDEX_DTYPE.names:
+            group.attrs[name] = row[name][0]
+        group.attrs["header"] = record["header"]
+
+        index = self.file["index"]
+        index.resize((len(index) + 1,))
+        index[-1] = row[0]
+        self.ids[key] = burst_id
+        return burst_id
+
+    def index(self) -> pd.DataFrame:
+        """
+        Returns: the index table of the file
+        """
+        table = pd.DataFrame(self.file["index"][:])
+        for column in ("id", "instrument", "type", "start", "end"):
+            table[column] = table[column].str.decode("ascii")
+        for column in ("start", "end"):
+            table[column] = pd.to_datetime(table[column], format=TIME_FORMAT)
+        return table
+
+    def data(self, burst_id: str) -> h5py.Dataset:
+        """
+        Returns: the spectrogram of a burst. Nothing is read until the
+        dataset is sliced.
+        """
+        return self.file["bursts"][burst_id]["data"]
+
+    def memmap(self, burst_id: str) -> np.ndarray:
+        """
+        Returns: the spectrogram of a burst mapped into memory. Only works
+        for files written without compression.
+        """
+        dataset = self.data(burst_id)
+        offset = dataset.id.get_offset()
+        if offset is None or dataset.compression is not None:
+            raise ValueError(f"Burst {burst_id} is not stored contiguously in {self.path}")
+        return np.memmap(self.path, mode="r", dtype=dataset.dtype, offset=offset, shape=dataset.shape)
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class MonthlyStores:
+    """
+    Sorts the bursts of a run into one BurstStore per month. With a
+    connector the files are uploaded to remote_dir after the run. A month
+    that is on the server already is downloaded before the first burst is
+    appended, so the upload keeps the bursts of the earlier runs.
+    """
+    def __init__(self, directory: str, compression: str = "gzip", connector=None, remote_dir: str = "") -> None:
+        self.directory = directory
+        self.compression = compression
+        self.connector = connector
+        self.remote_dir = remote_dir
+        self.stores = dict()
+        # file name -> results appended to the file
+        self.results = dict()
+        os.makedirs(directory, exist_ok=True)
+
+    def append(self, result) -> tuple:
+        """
+        Raises an exception if the file of the month cannot be downloaded
+
+        Returns: the name of the file and the id of the burst in it
+        """
+        name = month_file_name(result.start)
+        if name not in self.stores:
+            path = os.path.join(self.directory, name)
+            if self.connector is not None:
+                self.__download(name, path)
+            self.stores[name] = BurstStore(path, compression=self.compression)
+            self.results[name] = list()
+        burst_id = self.stores[name].append(result)
+        self.results[name].append(result)
+        return name, burst_id
+
+    def remote_name(self, name: str) -> str:
+        return os.path.join(self.remote_dir, name)
+
+    def close(self) -> dict:
+        """
+        Returns: the paths of the files written and the results appended to
+        each of them
+        """
+        written = dict()
+        for name, store in self.stores.items():
+            store.close()
+            written[store.path] = self.results[name]
+        self.stores = dict()
+        self.results = dict()
+        return written
+
+    def __download(self, name: str, path: str) -> None:
+        # The server has the file of the month if it was uploaded before.
+        # A partial download must not replace the local file.
+        partial = path + ".part"
+        try:
+            self.connector.get_file(self.remote_name(name), partial)
+            if os.path.exists(partial):
+                os.replace(partial, path)
+        finally:
+            if os.path.exists(partial):
+                os.unlink(partial)
@@ -0,0 +1,281 @@
+"""
+Keeps a local copy of the raw e-Callisto FITS files so that a file is fetched
+from the archive only once, no matter how many observations need it.
+version 1.0
+author: Andreas Wassmer
+project: Raumschiff
+"""
+import datetime
+import fcntl
+import functools
+import logging
+import os
+import shutil
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+
+from bs4 import BeautifulSoup
+from radiospectra.sources import CallistoSpectrogram
+
+DEFAULT_ARCHIVE_URL = "http://soleil.i4ds.ch/solarradio/data/2002-20yy_Callisto/"
+
+# Every FITS file in the archive covers 15 minutes of observation
+FILE_DURATION = datetime.timedelta(minutes=15)
+
+# 20 GB are enough to hold a busy month of the stations we process
+DEFAULT_MAX_BYTES = 20 * 1024**3
+
+# Number of day listings a process remembers, see cached_archive_day
+LISTING_CACHE_DAYS = 64
+
+
+def parse_fits_filename(filename: str):
+    """
+    Splits an archive file name like ALASKA-ANCHORAGE_20230601_121500_01.fit.gz
+    into its parts.
+
+    Returns: a tuple (instrument, start, focus code) or None if the name does
+    not follow the e-Callisto convention
+    """
+    name = os.path.basename(filename).split(".")[0]
+    try:
+        instrument, date, time_of_day, focus = name.rsplit("_", 3)
+        start = datetime.datetime.strptime(date + time_of_day, "%Y%m%d%H%M%S")
+    except ValueError:
+        return None
+    return instrument, start, focus
+
+
+def is_remote(archive_url: str) -> bool:
+    return archive_url.startswith("http://") or archive_url.startswith("https://")
+
+
+def list_archive_day(archive_url: str, day: datetime.date, session=None) -> list:
+    """
+    Returns the names of all FITS files the archive holds for the given day.
+    The archive is either the e-Callisto web server or a local directory with
+    the same year/month/day layout. A requests session may be passed to
+    reuse its connections.
+    """
+    day_path = day.strftime("%Y/%m/%d")
+    if not is_remote(archive_url):
+        directory = os.path.join(archive_url, day_path)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(f for f in os.listdir(directory) if f.endswith(".fit.gz"))
+
+    url = f"{archive_url.rstrip('/')}/{day_path}/"
+    if session is not None:
+        resp = session.get(url, timeout=60)
+        if resp.status_code == 404:
+            return []
+        resp.raise_for_status()
+        page = resp.content
+    else:
+        try:
+            with urllib.request.urlopen(url) as resp:
+                page = resp.read()
+        except urllib.error.HTTPError as err:
+            if err.code == 404:
+                return []
+            raise
+    html = BeautifulSoup(page, "html.parser")
+    files = [a.get("href", "") for a in html.find_all("a")]
+    return sorted(f for f in files if f.endswith(".fit.gz"))
+
+
+@functools.lru_cache(maxsize=LISTING_CACHE_DAYS)
+def cached_archive_day(archive_url: str, day: datetime.date) -> tuple:
+    """
+    Same as list_archive_day, but the listings are remembered by the
+    process. A worker gets the days of an instrument one after the other and
+    the same days again for the next instrument.
+    """
+    return tuple(list_archive_day(archive_url, day))
+
+
+def archive_day(archive_url: str, day: datetime.date) -> tuple:
+    """
+    Returns the listing of a day from cached_archive_day. The listing of the
+    current UTC day is still growing and is asked for every time.
+    """
+    if day >= datetime.datetime.now(datetime.timezone.utc).date():
+        return tuple(list_archive_day(archive_url, day))
+    return cached_archive_day(archive_url, day)
+
+
+def archive_file_url(archive_url: str, filename: str) -> str:
+    """
+    Returns the location of a file in the archive
+    """
+    _, start, _ = parse_fits_filename(filename)
+    day_path = start.strftime("%Y/%m/%d")
+    if is_remote(archive_url):
+        return f"{archive_url.rstrip('/')}/{day_path}/{filename}"
+    return os.path.join(archive_url, day_path, filename)
+
+
+def archive_files(archive_url: str, instrument: str, start: datetime.datetime,
+                  end: datetime.datetime) -> list:
+    """
+    Returns the names of the archive files of an instrument that overlap
+    with the interval [start, end).
+    """
+    files = list()
+    day = start.date()
+    while day <= end.date():
+        for filename in archive_day(archive_url, day):
+            parts = parse_fits_filename(filename)
+            if parts is None or parts[0] != instrument:
+                continue
+            file_start = parts[1]
+            if file_start < end and file_start + FILE_DURATION > start:
+                files.append(filename)
+        day += datetime.timedelta(days=1)
+    return files
+
+
+class FitsCache:
+    """
+    A size limited cache of archive FITS files on the local disk.
+
+    A file is stored under <cache_dir>/<instrument>/<yyyymmdd>/<file name>, so
+    the key is given by the instrument and the time stamp of the file. The
+    archive files never change once they are written, thus a cached file never
+    becomes stale.
+    Several worker processes may share one cache directory. New files are
+    written to a temporary name first and then moved in place atomically.
+    The eviction of the least recently used files is guarded by a file lock.
+    """
+    LOCK_NAME = ".lock"
+
+    # Files used within this time span are never evicted. This keeps a file
+    # alive between the fetch and the read of a worker.
+    EVICTION_GRACE_SECONDS = 120
+
+    def __init__(self, cache_dir: str, max_bytes: int = DEFAULT_MAX_BYTES,
+                 archive_url: str = DEFAULT_ARCHIVE_URL) -> None:
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.archive_url = archive_url
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def path_for(self, filename: str) -> str:
+        """
+        Returns the location of an archive file inside the cache
+        """
+        parts = parse_fits_filename(filename)
+        if parts is None:
+            raise ValueError(f"Not an e-Callisto file name: {filename}")
+        instrument, start, _ = parts
+        return os.path.join(self.cache_dir, instrument, start.strftime("%Y%m%d"),
+                            os.path.basename(filename))
+
+    def archive_url_for(self, filename: str) -> str:
+        return archive_file_url(self.archive_url, filename)
+
+    def files_for_range(self, instrument: str, start: datetime.datetime,
+                        end: datetime.datetime) -> list:
+        return archive_files(self.archive_url, instrument, start, end)
+
+    def fetch(self, filename: str) -> str:
+        """
+        Returns the local path of an archive file. The file is downloaded
+        only if it is not in the cache yet.
+        """
+        local_path = self.path_for(filename)
+        if os.path.exists(local_path):
+            # The modification time serves as time of last use for the LRU
+            os.utime(local_path)
+            return local_path
+
+        directory = os.path.dirname(local_path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".part-")
+        try:
+            with os.fdopen(fd, "wb") as tmp_file:
+                source = self.archive_url_for(filename)
+                if is_remote(self.archive_url):
+                    with urllib.request.urlopen(source) as resp:
+                        shutil.copyfileobj(resp, tmp_file)
+                else:
+                    with open(source, "rb") as src:
+                        shutil.copyfileobj(src, tmp_file)
+            os.replace(tmp_path, local_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+        logging.debug(f"Cached {filename}")
+        self.evict()
+        return local_path
+
+    def cached_files(self) -> list:
+        """
+        Returns (last use, size, path) for every file in the cache
+        """
+        entries = list()
+        for root, _, files in os.walk(self.cache_dir):
+            for f in files:
+                if f == self.LOCK_NAME or f.startswith(".part-"):
+                    continue
+                path = os.path.join(root, f)
+                try:
+                    stats = os.stat(path)
+                except FileNotFoundError:
+                    # evicted by another process in the meantime
+                    continue
+                entries.append((stats.st_mtime, stats.st_size, path))
+        return entries
+
+    def size(self) -> int:
+        return sum(entry[1] for entry in self.cached_files())
+
+    def evict(self) -> None:
+        """
+        Removes the least recently used files until the cache fits into
+        max_bytes again.
+        """
+        with open(os.path.join(self.cache_dir, self.LOCK_NAME), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                entries = self.cached_files()
+                total = sum(entry[1] for entry in entries)
+                if total <= self.max_bytes:
+                    return
+                keep_after = time.time() - self.EVICTION_GRACE_SECONDS
+                for last_use, size, path in sorted(entries):
+                    if total <= self.max_bytes:
+                        break
+                    if last_use >= keep_after:
+                        break
+                    try:
+                        os.unlink(path)
+                    except FileNotFoundError:
+                        pass
+                    total -= size
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def from_range(self, instrument: str, start: datetime.datetime,
+                   end: datetime.datetime) -> CallistoSpectrogram:
+        """
+        Replacement for CallistoSpectrogram.from_range that reads the files
+        from the cache. The spectrograms are joined the same way radiospectra
+        does it.
+        """
+        files = self.files_for_range(instrument, start, end)
+        data = [CallistoSpectrogram.read(self.fetch(f)) for f in files]
+        freq_buckets = defaultdict(list)
+        for elem in data:
+            freq_buckets[tuple(elem.freq_axis)].append(elem)
+        try:
+            return CallistoSpectrogram.combine_frequencies(
+                [CallistoSpectrogram.join_many(elem, maxgap=None, fill=CallistoSpectrogram.JOIN_REPEAT)
+                 for elem in freq_buckets.values()])
+        except ValueError:
+            raise ValueError("No data found.")
@@ -0,0 +1,166 @@
+"""
+Measures where the time of a run goes. Every observation carries a
+StageTimer that records the wall time and the bytes of its stages. The
+timers come back to the main process with the results and RunReport
+writes them as JSON or CSV.
+version 1.0
+author: Andreas Wassmer
+project: Raumschiff
+"""
+import contextlib
+import csv
+import json
+import resource
+import sys
+import time
+from collections import defaultdict
+
+# The stages in the order they happen. "prefetch" is the download into the
+# cache by the prefetcher of the main process, for the whole run only.
+# "fetch" gets the files of an instrument day into the worker, from the
+# cache or the archive, and "load" decodes them. "put_file" hands the files
+# to the connector of the worker and "upload" is the transfer in the main
+# process.
+STAGES = ("prefetch", "fetch", "load", "slice", "screen", "prettify", "snr", "export", "render", "fits", "put_file", "upload")
+
+# The files written for every observation
+FILE_SUFFIXES = (".jpg", ".fit.gz")
+
+# worker_peak_rss is the peak of the worker process up to the end of the
+# observation, not the memory of the observation alone
+REPORT_COLUMNS = ["instrument", "type", "start", "end", "remote_name", "rejection", "snr", "worker_peak_rss"]
+
+
+def peak_rss() -> int:
+    """
+    Returns: the peak resident set size of this process in bytes over its
+    whole life so far
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class StageTimer:
+    """
+    Sums up the wall time and the bytes per stage of one observation
+    """
+    def __init__(self) -> None:
+        self.seconds = defaultdict(float)
+        self.bytes = defaultdict(int)
+        self.peak_rss = 0
+
+    @contextlib.contextmanager
+    def stage(self, name: str, nbytes: int = 0):
+        begin = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] += time.perf_counter() - begin
+            self.bytes[name] += nbytes
+
+    def add(self, name: str, seconds: float, nbytes: int = 0) -> None:
+        self.seconds[name] += seconds
+        self.bytes[name] += nbytes
+
+    def as_dict(self) -> dict:
+        return {"seconds": dict(self.seconds), "bytes": dict(self.bytes), "peak_rss": self.peak_rss}
+
+
+class RunReport:
+    """
+    Collects the stage timers of all observations of a run, aggregated over
+    all workers
+    """
+    def __init__(self) -> None:
+        self.rows = list()
+        self.__by_remote_name = dict()
+        # Stages of the run that belong to no observation
+        self.__run_stages = StageTimer()
+        self.started = time.time()
+
+    def add(self, result) -> None:
+        """
+        Adds the ObservationResult of an observation
+        """
+        stages = result.stages or StageTimer().as_dict()
+        row = {
+            "instrument": result.instrument,
+            "type": result.type,
+            "start": result.start.isoformat(),
+            "end": result.end.isoformat(),
+            "remote_name": result.remote_name,
+            "rejection": result.rejection,
+            "snr": result.snr,
+            "worker_peak_rss": stages["peak_rss"],
+            "seconds": dict(stages["seconds"]),
+            "bytes": dict(stages["bytes"]),
+        }
+        self.rows.append(row)
+        if result.remote_name is not None:
+            self.__by_remote_name[result.remote_name] = row
+
+    def add_upload(self, remote_name: str, seconds: float, nbytes: int) -> None:
+        """
+        Adds an upload of the main process to the observation whose files
+        start with remote_name
+        """
+        for suffix in FILE_SUFFIXES:
+            if remote_name.endswith(suffix):
+                remote_name = remote_name[:-len(suffix)]
+                break
+        row = self.__by_remote_name.get(remote_name)
+        if row is None:
+            return
+        row["seconds"]["upload"] = row["seconds"].get("upload", 0.0) + seconds
+        row["bytes"]["upload"] = row["bytes"].get("upload", 0) + nbytes
+
+    def add_run_stage(self, name: str, seconds: float, nbytes: int) -> None:
+        """
+        Adds time spent for the run as a whole, e.g. by the prefetcher
+        """
+        self.__run_stages.add(name, seconds, nbytes)
+
+    def summary(self) -> dict:
+        """
+        Returns: the totals of every stage and the throughput of the run
+        """
+        seconds = defaultdict(float, self.__run_stages.seconds)
+        nbytes = defaultdict(int, self.__run_stages.bytes)
+        for row in self.rows:
+            for stage, value in row["seconds"].items():
+                seconds[stage] += value
+            for stage, value in row["bytes"].items():
+                nbytes[stage] += value
+        wall_time = time.time() - self.started
+        written = sum(1 for row in self.rows if row["rejection"] is None)
+        return {
+            "wall_time": wall_time,
+            "observations": len(self.rows),
+            "written": written,
+            "observations_per_second": len(self.rows) / wall_time if wall_time > 0 else 0.0,
+            "worker_peak_rss": max((row["worker_peak_rss"] for row in self.rows), default=0),
+            "stages": {stage: {"seconds": seconds[stage], "bytes": nbytes[stage]}
+                       for stage in STAGES if stage in seconds},
+        }
+
+    def write(self, path: str) -> None:
+        """
+        Writes the report. A path ending in .csv gives one row per
+        observation, anything else a JSON file with the summary as well.
+        """
+        if path.endswith(".csv"):
+            columns = (REPORT_COLUMNS + [f"{stage}_seconds" for stage in STAGES]
+                       + [f"{stage}_bytes" for stage in STAGES])
+            with open(path, "w", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=columns)
+                writer.writeheader()
+                for row in self.rows:
+                    flat = {column: row[column] for column in REPORT_COLUMNS}
+                    for stage in STAGES:
+                        flat[f"{stage}_seconds"] = row["seconds"].get(stage, 0.0)
+                        flat[f"{stage}_bytes"] = row["bytes"].get(stage, 0)
+                    writer.writerow(flat)
+        else:
+            with open(path, "w") as f:
+                json.dump({"summary": self.summary(), "observations": self.rows}, f, indent=2)
@@ -0,0 +1,199 @@
+"""
+Renders spectrograms to JPEG images. The figure is set up once per process
+and reused for every image. The data is reduced to the pixel grid of the
+image before it is drawn, so the cost of drawing no longer depends on the
+length of the observation.
+version 1.0
+author: Andreas Wassmer
+project: Raumschiff
+"""
+import datetime
+import io
+import math
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from matplotlib.ticker import FuncFormatter, IndexLocator
+from PIL import Image
+from radiospectra.sources import CallistoSpectrogram
+
+# Same look as CallistoSpectrogram.plot with the settings we always used
+FIGURE_SIZE = (10, 6.2)
+DPI = 100
+VMIN = -2
+VMAX = 17
+CMAP = "plasma"
+
+# radiospectra linearizes the frequency axis to at most this many rows
+DEFAULT_YRES = 1080
+
+# The renderer of this process, see get_renderer
+_renderer = None
+
+
+def pool(data: np.ndarray, size: int, axis: int, how: str = "mean") -> np.ndarray:
+    """
+    Reduces the data along axis to at most size elements by combining
+    neighbouring elements. "mean" gives the same look as the resampling of
+    matplotlib, "max" keeps short bursts that are narrower than a pixel.
+    NaN is ignored unless a whole block is NaN.
+    """
+    n = data.shape[axis]
+    factor = math.ceil(n / size)
+    if factor <= 1:
+        return data
+    data = np.moveaxis(data, axis, -1)
+    blocks = math.ceil(n / factor)
+    padding = blocks * factor - n
+    if padding > 0:
+        pad_width = [(0, 0)] * (data.ndim - 1) + [(0, padding)]
+        data = np.pad(data, pad_width, constant_values=np.nan)
+    data = data.reshape(data.shape[:-1] + (blocks, factor))
+    if how == "max":
+        pooled = np.fmax.reduce(data, axis=-1)
+    elif how == "mean":
+        valid = np.isfinite(data)
+        count = valid.sum(axis=-1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            pooled = np.where(valid, data, 0).sum(axis=-1) / count
+    else:
+        raise ValueError(f"Unknown pooling: {how}")
+    return np.moveaxis(pooled, -1, axis)
+
+
+def linear_rows(freq_axis: np.ndarray, yres: int = DEFAULT_YRES):
+    """
+    Maps the rows of an image with a linear frequency axis to the channels of
+    the spectrogram, the same way radiospectra's _LinearView does it.
+
+    Returns: (channel index for every row, frequency step of a row)
+    """
+    freq_axis = np.asarray(freq_axis, dtype=np.float64)
+    if len(freq_axis) < 2:
+        return np.zeros(1, dtype=np.intp), 1.0
+    deltas = freq_axis[:-1] - freq_axis[1:]
+    delt = float(max((freq_axis[0] - freq_axis[-1]) / (yres - 1), deltas[deltas != 0].min() / 2.0))
+    n_rows = int(1 + (freq_axis[0] - freq_axis[-1]) / delt)
+    freqs = freq_axis[0] - np.arange(n_rows) * delt
+    midpoints = np.concatenate([(freq_axis[:-1] + freq_axis[1:]) / 2, freq_axis[-1:]])
+    # The first channel whose midpoint is at or below the frequency of the row
+    index = np.searchsorted(-midpoints, -freqs, side="left")
+    return np.minimum(index, len(freq_axis) - 1), delt
+
+
+class SpectrogramRenderer:
+    """
+    Draws spectrograms onto one Agg figure that is created once and reused.
+    The image looks like the one of CallistoSpectrogram.plot.
+    """
+    def __init__(self, figsize=FIGURE_SIZE, dpi: int = DPI, vmin: float = VMIN,
+                 vmax: float = VMAX, cmap: str = CMAP, pooling: str = "mean") -> None:
+        self.vmin = vmin
+        self.vmax = vmax
+        self.pooling = pooling
+        self.figure = Figure(figsize=figsize, dpi=dpi)
+        self.canvas = FigureCanvasAgg(self.figure)
+        self.axes = self.figure.add_subplot(111)
+        self.image = self.axes.imshow(np.zeros((2, 2)), origin="lower", aspect="auto", cmap=cmap)
+        self.colorbar = self.figure.colorbar(self.image)
+        self.colorbar.set_label("Intensity")
+        self.title = self.figure.suptitle("")
+        self.axes.tick_params(axis="x", labelsize=10, labelrotation=30)
+        self.figure.subplots_adjust(bottom=0.2, left=0.2)
+        self.__spectrum = None
+        self.__delt = 1.0
+        self.__laid_out = False
+        self.axes.xaxis.set_major_formatter(FuncFormatter(self.__format_time))
+        self.axes.yaxis.set_major_formatter(FuncFormatter(self.__format_freq))
+
+    def pixel_grid(self) -> tuple:
+        """
+        Returns the size of the axes in pixels as (width, height)
+        """
+        bbox = self.axes.get_window_extent()
+        return max(int(bbox.width), 1), max(int(bbox.height), 1)
+
+    def reduce(self, spectrum: CallistoSpectrogram) -> np.ndarray:
+        """
+        Returns the data of the spectrogram clipped to [vmin, vmax] with a
+        linear frequency axis, pooled down to the pixel grid of the axes
+        """
+        width, height = self.pixel_grid()
+        rows, self.__delt = linear_rows(spectrum.freq_axis)
+        data = np.clip(np.asarray(spectrum.data), self.vmin, self.vmax)
+        data = pool(data, width, axis=1, how=self.pooling)
+        return pool(data[rows], height, axis=0, how=self.pooling)
+
+    def draw(self, spectrum: CallistoSpectrogram) -> None:
+        data = self.reduce(spectrum)
+        n_rows = int(1 + (spectrum.freq_axis[0] - spectrum.freq_axis[-1]) / self.__delt)
+        n_samples = spectrum.data.shape[1]
+        self.__spectrum = spectrum
+
+        # Like radiospectra the colors are scaled to the clipped data. The
+        # limits come from the full data, pooling would narrow them.
+        low = max(self.vmin, float(np.nanmin(spectrum.data)))
+        high = min(self.vmax, float(np.nanmax(spectrum.data)))
+        self.image.set_data(data)
+        self.image.set_clim(low, high)
+        self.__set_extent(data, n_samples, n_rows)
+
+        # Major ticks every 10 MHz or more, starting at a multiple of 5
+        init = (spectrum.freq_axis[0] % 5) / self.__delt
+        dist = max(round((spectrum.freq_axis[0] - spectrum.freq_axis[-1]) / 15.0, -1), 10)
+        self.axes.yaxis.set_major_locator(IndexLocator(dist / self.__delt, init))
+        self.axes.yaxis.set_minor_locator(IndexLocator(dist / self.__delt / 10, init))
+        self.axes.set_xlabel(spectrum.t_label)
+        self.axes.set_ylabel(spectrum.f_label)
+        self.title.set_text(" ".join([spectrum.start.strftime("%d %b %Y"), "Radio flux density",
+                                      "(" + ", ".join(spectrum.instruments) + ")"]))
+
+    def render(self, spectrum: CallistoSpectrogram) -> bytes:
+        """
+        Draws the spectrogram and returns the image as JPEG
+        """
+        self.draw(spectrum)
+        if not self.__laid_out:
+            # The tick labels always have the same format, so the layout of
+            # the first image fits the following ones as well. The pixel grid
+            # changes with the layout, so draw once more.
+            self.figure.tight_layout()
+            self.__laid_out = True
+            self.draw(spectrum)
+        self.canvas.draw()
+        image = Image.frombuffer("RGBA", self.canvas.get_width_height(), self.canvas.buffer_rgba(), "raw", "RGBA", 0, 1)
+        buffer = io.BytesIO()
+        image.convert("RGB").save(buffer, format="JPEG")
+        return buffer.getvalue()
+
+    def __set_extent(self, data: np.ndarray, n_samples: int, n_rows: int) -> None:
+        # The pooled image covers whole blocks, which may reach beyond the data.
+        # The axes keep the coordinates of the full resolution data.
+        time_block = math.ceil(n_samples / data.shape[1])
+        row_block = math.ceil(n_rows / data.shape[0])
+        self.image.set_extent((-0.5, data.shape[1] * time_block - 0.5, -0.5, data.shape[0] * row_block - 0.5))
+        self.axes.set_xlim(-0.5, n_samples - 0.5)
+        self.axes.set_ylim(-0.5, n_rows - 0.5)
+
+    def __format_time(self, x, pos) -> str:
+        spectrum = self.__spectrum
+        x = int(x)
+        if spectrum is None or x >= len(spectrum.time_axis) or x < 0:
+            return ""
+        return (spectrum.start + datetime.timedelta(seconds=float(spectrum.time_axis[x]))).strftime("%H:%M:%S")
+
+    def __format_freq(self, x, pos) -> str:
+        if self.__spectrum is None:
+            return ""
+        return f"{self.__spectrum.freq_axis[0] - (x + 0.5) * self.__delt:0.1f}"
+
+
+def get_renderer() -> SpectrogramRenderer:
+    """
+    Returns the renderer of this process. It is created on first use.
+    """
+    global _renderer
+    if _renderer is None:
+        _renderer = SpectrogramRenderer()
+    return _renderer
@@ -0,0 +1,263 @@
+"""
+Exports the bursts as tensors of a fixed shape for the classifier. Every
+prettified spectrogram is resampled onto a frequency x time grid in the
+worker and appended to one memory mapped file of float32:
+    tensors.f32     the tensors, number of bursts x frequency x time
+    index.parquet   one row per tensor with its label, see INDEX_COLUMNS
+    index.log       the rows written since the index, while the export is open
+The grid is kept in the metadata of the index, open_tensors() gives both.
+version 1.0
+author: Andreas Wassmer
+project: Raumschiff
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+GRID = (256, 512)
+
+TENSOR_FILE = "tensors.f32"
+INDEX_FILE = "index.parquet"
+# Rows appended by TensorStore.flush() until the export is closed
+INDEX_LOG = "index.log"
+INDEX_COLUMNS = ["row", "type", "instrument", "snr", "start", "end", "freq_min", "freq_max"]
+
+# Tensors the file is grown by when it is full
+CAPACITY = 1024
+
+
+def parse_grid(grid: str) -> tuple:
+    """
+    Returns: the shape of a grid given as <frequencies>x<times>, e.g. 256x512
+    """
+    try:
+        n_freq, n_time = (int(n) for n in grid.lower().split("x"))
+    except ValueError:
+        raise ValueError(f"Grid {grid} is not of the form <frequencies>x<times>")
+    if n_freq < 1 or n_time < 1:
+        raise ValueError(f"Grid {grid} is empty")
+    return n_freq, n_time
+
+
+def resample(data: np.ndarray, freq_axis: np.ndarray, time_axis: np.ndarray, shape: tuple = GRID) -> np.ndarray:
+    """
+    Interpolates a spectrogram linearly onto shape points that are evenly
+    spaced in frequency and time. The rows keep the order of freq_axis.
+
+    Returns: the resampled spectrogram as float32
+    """
+    data = np.asarray(data, dtype=np.float32)
+    data = _resample_axis(data, np.asarray(freq_axis, dtype=np.float64), shape[0], axis=0)
+    return _resample_axis(data, np.asarray(time_axis, dtype=np.float64), shape[1], axis=1)
+
+
+def _resample_axis(data: np.ndarray, values: np.ndarray, n: int, axis: int) -> np.ndarray:
+    if len(values) == 1:
+        return np.repeat(data, n, axis=axis)
+    descending = values[0] > values[-1]
+    if descending:
+        values = values[::-1]
+        data = np.flip(data, axis=axis)
+    points = np.linspace(values[0], values[-1], n)
+    left = np.clip(np.searchsorted(values, points, side="right") - 1, 0, len(values) - 2)
+    step = values[left + 1] - values[left]
+    # Callisto repeats some channels, a step of 0 takes the left value
+    weight = np.divide(points - values[left], step, out=np.zeros(n), where=step > 0)
+    weight = np.clip(weight, 0.0, 1.0).astype(np.float32)
+    shape = [1, 1]
+    shape[axis] = n
+    weight = weight.reshape(shape)
+    result = np.take(data, left, axis=axis) * (1 - weight) + np.take(data, left + 1, axis=axis) * weight
+    return np.flip(result, axis=axis) if descending else result
+
+
+class TensorStore:
+    """
+    The tensor file and its index in a directory. An existing export is
+    continued, it must have the same grid. The tensor file is preallocated
+    and grown by CAPACITY tensors at a time.
+    flush() appends the rows written since the last flush to INDEX_LOG,
+    which costs only the new rows. close() writes the whole index to
+    INDEX_FILE, removes the log and cuts the file to the tensors written.
+    After a crash the log still holds the rows of the flushed tensors. The
+    tensors beyond the index and the log are overwritten when the export is
+    continued.
+    """
+    def __init__(self, directory: str, shape: tuple = GRID, capacity: int = CAPACITY) -> None:
+        self.directory = directory
+        self.shape = tuple(shape)
+        self.capacity = capacity
+        os.makedirs(directory, exist_ok=True)
+        self.tensor_path = os.path.join(directory, TENSOR_FILE)
+        self.index_path = os.path.join(directory, INDEX_FILE)
+        self.log_path = os.path.join(directory, INDEX_LOG)
+        self.rows = list()
+        # Rows changed since the last flush
+        self.unlogged = list()
+        self.count = 0
+        if os.path.exists(self.index_path) or os.path.exists(self.log_path):
+            index, stored_shape = load_index(directory)
+            if stored_shape != self.shape:
+                raise ValueError(f"{directory} holds tensors of {stored_shape[0]}x{stored_shape[1]}, "
+                                 f"not {self.shape[0]}x{self.shape[1]}")
+            self.rows = index.to_dict("records")
+            self.count = len(index)
+        # (instrument, type, start, end) -> row
+        self.keys = {self.__key(row["instrument"], row["type"], row["start"], row["end"]): row["row"]
+                     for row in self.rows}
+        self.tensors = self.__map(self.count + capacity)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def append(self, result) -> int:
+        """
+        Adds the tensor of an ObservationResult, see
+        RadioBurstObservation.tensor_record. The tensor of an observation
+        that is in the export already replaces the old one.
+
+        Returns: the row of the tensor in the file
+        """
+        record = result.tensor
+        if record["tensor"].shape != self.shape:
+            raise ValueError(f"Tensor of {result.instrument} has the shape {record['tensor'].shape}, not {self.shape}")
+        key = self.__key(result.instrument, result.type, result.start, result.end)
+        if key in self.keys:
+            row = self.keys[key]
+            self.tensors[row] = record["tensor"]
+            self.rows[row] = self.__row(row, result)
+            self.unlogged.append(row)
+            return row
+        if self.count == len(self.tensors):
+            self.tensors.flush()
+            self.tensors = self.__map(self.count + self.capacity)
+        row = self.count
+        self.tensors[row] = record["tensor"]
+        self.rows.append(self.__row(row, result))
+        self.unlogged.append(row)
+        self.keys[key] = row
+        self.count += 1
+        return row
+
+    def index(self) -> pd.DataFrame:
+        return pd.DataFrame(self.rows, columns=INDEX_COLUMNS)
+
+    def flush(self) -> None:
+        """
+        Writes the tensors to disk, then appends their rows to the log. The
+        log never lists a tensor that is not in the file.
+        """
+        if len(self.unlogged) == 0:
+            return
+        self.tensors.flush()
+        new_log = not os.path.exists(self.log_path)
+        with open(self.log_path, "a") as f:
+            if new_log:
+                f.write(json.dumps({"grid": f"{self.shape[0]}x{self.shape[1]}"}) + "\n")
+            for row in self.unlogged:
+                entry = dict(self.rows[row])
+                entry["start"] = pd.Timestamp(entry["start"]).isoformat()
+                entry["end"] = pd.Timestamp(entry["end"]).isoformat()
+                f.write(json.dumps(entry) + "\n")
+        self.unlogged = list()
+
+    def close(self) -> str:
+        """
+        Returns: the path of the tensor file
+        """
+        self.tensors.flush()
+        del self.tensors
+        table = pa.Table.from_pandas(self.index(), preserve_index=False)
+        metadata = dict(table.schema.metadata or {})
+        metadata[b"grid"] = f"{self.shape[0]}x{self.shape[1]}".encode()
+        # The index is replaced atomically before the log is given up
+        partial = self.index_path + ".part"
+        pq.write_table(table.replace_schema_metadata(metadata), partial)
+        os.replace(partial, self.index_path)
+        if os.path.exists(self.log_path):
+            os.unlink(self.log_path)
+        self.unlogged = list()
+        os.truncate(self.tensor_path, self.count * int(np.prod(self.shape)) * np.dtype(np.float32).itemsize)
+        return self.tensor_path
+
+    @staticmethod
+    def __key(instrument, type, start, end) -> tuple:
+        return instrument, type, pd.Timestamp(start), pd.Timestamp(end)
+
+    @staticmethod
+    def __row(row: int, result) -> dict:
+        record = result.tensor
+        return {"row": row, "type": result.type, "instrument": result.instrument,
+                "snr": np.nan if result.snr is None else float(result.snr),
+                "start": result.start, "end": result.end,
+                "freq_min": float(record["freq_min"]), "freq_max": float(record["freq_max"])}
+
+    def __map(self, length: int) -> np.memmap:
+        # r+ grows the file to the length
+        mode = "r+" if os.path.exists(self.tensor_path) else "w+"
+        return np.memmap(self.tensor_path, mode=mode, dtype=np.float32, shape=(length,) + self.shape)
+
+
+def read_index(path: str) -> tuple:
+    """
+    Returns: the index of an export and its grid
+    """
+    table = pq.read_table(path)
+    return table.to_pandas(), parse_grid(table.schema.metadata[b"grid"].decode())
+
+
+def load_index(directory: str) -> tuple:
+    """
+    Reads the index of an export together with the rows in its log, i.e.
+    the index as it was at the last flush of a TensorStore that was not
+    closed. A row in the log replaces the row of the same number.
+
+    Returns: the index and the grid
+    """
+    rows, shape = list(), None
+    index_path = os.path.join(directory, INDEX_FILE)
+    if os.path.exists(index_path):
+        index, shape = read_index(index_path)
+        rows = index.to_dict("records")
+    log_path = os.path.join(directory, INDEX_LOG)
+    lines = list()
+    if os.path.exists(log_path):
+        with open(log_path) as f:
+            lines = f.read().splitlines()
+    if len(lines) > 0:
+        logged_shape = parse_grid(json.loads(lines[0])["grid"])
+        if shape is not None and logged_shape != shape:
+            raise ValueError(f"The log of {directory} is of another grid than its index")
+        shape = logged_shape
+        for line in lines[1:]:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # The last line of a crash may be cut off
+                break
+            entry["start"] = pd.Timestamp(entry["start"])
+            entry["end"] = pd.Timestamp(entry["end"])
+            if entry["row"] < len(rows):
+                rows[entry["row"]] = entry
+            else:
+                rows.append(entry)
+    return pd.DataFrame(rows, columns=INDEX_COLUMNS), shape
+
+
+def open_tensors(directory: str) -> tuple:
+    """
+    Opens an export for reading. Batches sliced from the tensors are read
+    from the file without a copy.
+
+    Returns: the tensors, memory mapped, and the index
+    """
+    index, shape = load_index(directory)
+    if len(index) == 0:
+        return np.zeros((0,) + shape, dtype=np.float32), index
+    tensors = np.memmap(os.path.join(directory, TENSOR_FILE), mode="r", dtype=np.float32,
+                        shape=(len(index),) + shape)
+    return tensors, index
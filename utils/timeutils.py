@@ -1,4 +1,13 @@
+import calendar
 import datetime
+import re
+
+import numpy as np
+import pandas as pd
+
+# Start and end of an event, i.e. 12:55-12:56. Typos like 12_55 or 12.55
+# are accepted as well
+EVENT_TIME_PATTERN = r"^\s*(\d{1,2})[:._](\d{2})\s*-\s*(\d{1,2})[:._](\d{2})"
 
 
 def extract_and_correct_time(event_time):
@@ -23,6 +32,36 @@ def extract_and_correct_time(event_time):
     return datetime.datetime.strptime(start, "%H:%M"), datetime.datetime.strptime(end, "%H:%M")
 
 
+def extract_and_correct_times(event_times, dates=None):
+    """
+    Does the same as extract_and_correct_time for a whole column of event
+    times at once. If dates (yyyymmdd) are given, the times are placed on
+    these days. Otherwise they are on 1900-01-01, as strptime does it.
+
+    Returns: start and end as arrays of datetime64 and a mask that is True
+    for the rows that cannot be parsed
+    """
+    times = pd.Series(event_times, dtype="string").reset_index(drop=True)
+    parts = times.str.extract(EVENT_TIME_PATTERN).astype("float64")
+    hours = parts[[0, 2]].to_numpy()
+    minutes = parts[[1, 3]].to_numpy()
+    invalid = np.isnan(parts.to_numpy()).any(axis=1)
+    invalid |= (np.nan_to_num(hours) > 23).any(axis=1) | (np.nan_to_num(minutes) > 59).any(axis=1)
+
+    if dates is None:
+        days = np.full(len(times), np.datetime64("1900-01-01", "ns"))
+    else:
+        days = pd.to_datetime(pd.Series(dates, dtype="string").reset_index(drop=True),
+                              format="%Y%m%d", errors="coerce").to_numpy(dtype="datetime64[ns]")
+        invalid |= np.isnat(days)
+
+    offsets = np.where(invalid[:, np.newaxis], 0, hours * 60 + minutes).astype("int64")
+    offsets = offsets.astype("timedelta64[m]")
+    start = np.where(invalid, np.datetime64("NaT"), days + offsets[:, 0])
+    end = np.where(invalid, np.datetime64("NaT"), days + offsets[:, 1])
+    return start.astype("datetime64[ns]"), end.astype("datetime64[ns]"), invalid
+
+
 def check_valid_date(year, month, day):
     """
     Check if the argument to the funtion download_burst_list
@@ -61,3 +100,35 @@ def adjust_year_month_day(year, month, day=None):
         d = ""
 
     return str(year), m, d
+
+
+def parse_date_bound(text: str, last: bool = False) -> datetime.date:
+    """
+    Reads a bound of a date range given as year (2021), month (2021-03) or
+    day (2021-03-14). If last is True the bound is the last day of the
+    given year or month, otherwise the first.
+
+    Returns: the date of the bound
+    """
+    match = re.fullmatch(r"\s*(\d{4})(?:-(\d{1,2}))?(?:-(\d{1,2}))?\s*", text)
+    if match is None:
+        raise ValueError(f"Not a year, month or day: {text}")
+    year = int(match.group(1))
+    month = int(match.group(2)) if match.group(2) else (12 if last else 1)
+    if match.group(3):
+        day = int(match.group(3))
+    else:
+        day = calendar.monthrange(year, month)[1] if last else 1
+    return datetime.date(year, month, day)
+
+
+def months_in_range(first: datetime.date, last: datetime.date) -> list:
+    """
+    Returns: (year, month) of every month that overlaps with [first, last]
+    """
+    months = list()
+    year, month = first.year, first.month
+    while (year, month) <= (last.year, last.month):
+        months.append((year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
@@ -1,25 +1,152 @@
+import math
+
 import numpy as np
 from radiospectra.sources import CallistoSpectrogram
 
+from utils.background import prettify, subtract_background
+
+# Number of values processed at once by spectrogram_stats. A block of this
+# size in float64 stays within the CPU caches.
+STATS_BLOCK_ELEMENTS = 1 << 18
+
+
+class SpectrogramStats:
+    """
+    The statistics of a spectrogram that are needed for the snr and the
+    burst detection. NaN values are ignored like np.nanmean etc. do.
+    For a stack of spectrograms every attribute has one entry per
+    spectrogram.
+    """
+    def __init__(self, mean, std, max, time_mean, count) -> None:
+        self.mean = mean
+        self.std = std
+        self.max = max
+        # Mean over the frequency channels for every time step
+        self.time_mean = time_mean
+        self.count = count
+
+    @property
+    def snr(self):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return self.mean / self.std
+
+
+def as_array(spectrogram) -> np.ndarray:
+    if isinstance(spectrogram, np.ndarray):
+        return spectrogram
+    if isinstance(spectrogram, (list, tuple)):
+        return np.stack([as_array(s) for s in spectrogram])
+    return np.asarray(spectrogram.data)
+
+
+def spectrogram_stats(spectrogram) -> SpectrogramStats:
+    """
+    Calculates mean, standard deviation, maximum and the time mean of the
+    frequency channels in a single pass over the data. The data is read in
+    blocks of channels and only the block is converted to float64, so a
+    float32 spectrogram is not copied as a whole.
+
+    spectrogram may be a CallistoSpectrogram, a 2d array (channels, time),
+    or a stack of them, i.e. a list or a 3d array (spectrograms, channels, time).
+    A 1d array is treated as a single column.
+    """
+    data = as_array(spectrogram)
+    if data.ndim == 1:
+        data = data[:, np.newaxis]
+    n_channels, n_time = data.shape[-2:]
+    stack_shape = data.shape[:-2]
+
+    col_sum = np.zeros(stack_shape + (n_time,))
+    col_count = np.zeros(stack_shape + (n_time,), dtype=np.int64)
+    sum_sq = np.zeros(stack_shape)
+    maximum = np.full(stack_shape, -np.inf)
+    rows = max(1, STATS_BLOCK_ELEMENTS // max(1, n_time * int(np.prod(stack_shape))))
+    for r in range(0, n_channels, rows):
+        block = data[..., r:r + rows, :]
+        valid = np.isfinite(block)
+        values = np.where(valid, block, 0).astype(np.float64)
+        col_sum += values.sum(axis=-2)
+        col_count += valid.sum(axis=-2)
+        sum_sq += np.square(values).sum(axis=(-2, -1))
+        maximum = np.maximum(maximum, np.where(valid, block, -np.inf).max(axis=(-2, -1)))
+
+    count = col_count.sum(axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = col_sum.sum(axis=-1) / count
+        # E[x^2] - E[x]^2 is exact enough with float64 sums for the value
+        # range of e-Callisto data
+        std = np.sqrt(np.maximum(sum_sq / count - mean * mean, 0.0))
+        time_mean = col_sum / col_count
+    maximum = np.where(count > 0, maximum, np.nan)
+    if stack_shape == ():
+        return SpectrogramStats(float(mean), float(std), float(maximum), time_mean, int(count))
+    return SpectrogramStats(mean, std, maximum, time_mean, count)
+
 
 def calculate_snr(spectrogram: CallistoSpectrogram) -> float:
     """
     Calculates the signal to noise ratio of a spectrogram
     """
-    signal = np.nanmean(spectrogram.data)
-    noise = np.nanstd(spectrogram.data)
-    return signal/noise
+    return spectrogram_stats(spectrogram).snr
 
 
-def has_burst_data(spectrogram: CallistoSpectrogram) -> bool:
-    std = np.nanstd(spectrogram.data)
-    time_mean = np.nanmean(spectrogram.data, axis=0)
-    # print(f"{spectrogram.header['INSTRUME']}  std = {std}, max = {np.max(time_mean)}")
-    if np.max(time_mean) >= 2.*std:
+def has_burst_data(spectrogram: CallistoSpectrogram, stats: SpectrogramStats = None) -> bool:
+    """
+    Pass stats if they are known already to save another pass over the data
+    """
+    if stats is None:
+        stats = spectrogram_stats(spectrogram)
+    # print(f"{spectrogram.header['INSTRUME']}  std = {stats.std}, max = {np.max(stats.time_mean)}")
+    if np.max(stats.time_mean) >= 2.*stats.std:
         return True
     return False
 
 
+# Reasons why an observation is not written
+NO_DATA = "no data"
+INVALID_SNR = "invalid snr"
+LOW_SNR = "low snr"
+NO_BURST = "no burst"
+
+
+class Screening:
+    """
+    Decides on the raw spectrogram whether an observation is worth the
+    background subtraction, the plot and the upload. Only every time_step-th
+    sample is looked at, and the background is removed from this thinned
+    out copy only.
+    With fast_background=False the background is removed by radiospectra
+    like prettify(fast=False) does, from the whole CallistoSpectrogram, so
+    the decision is made on the data that would be written.
+    """
+    def __init__(self, min_snr: float = 0.0, require_burst: bool = True, time_step: int = 4,
+                 fast_background: bool = True) -> None:
+        self.min_snr = min_snr
+        self.require_burst = require_burst
+        self.time_step = time_step
+        self.fast_background = fast_background
+
+    def reject(self, spectrogram) -> str:
+        """
+        Returns: the reason to drop the observation or None if it passes
+        """
+        data = as_array(spectrogram)[:, ::self.time_step]
+        if data.size == 0 or not np.isfinite(data).any():
+            return NO_DATA
+        if self.fast_background:
+            data = subtract_background(data)
+        else:
+            data = as_array(prettify(spectrogram, fast=False))[:, ::self.time_step]
+        stats = spectrogram_stats(data)
+        if not math.isfinite(stats.snr):
+            return INVALID_SNR
+        if self.min_snr is not None and stats.snr < self.min_snr:
+            return LOW_SNR
+        if self.require_burst and not has_burst_data(data, stats):
+            return NO_BURST
+        return None
+
+
 if __name__ == "__main__":
     import glob
     import shutil
@@ -0,0 +1,126 @@
+"""
+Runs in the worker processes of the pool. The expensive setup of a worker is
+done once by init_worker and not for every observation.
+version 1.0
+author: Andreas Wassmer
+project: Raumschiff
+"""
+import cProfile
+import datetime
+import logging
+import multiprocessing
+import os
+
+import matplotlib
+
+import burstprocessor
+from connectors.spoolconnector import SpoolConnector
+from utils import fitscache, rendering
+
+LOG_FORMAT = '%(asctime)s:%(name)s:%(levelname)s - %(message)s'
+
+# State of the worker process, set by init_worker
+_connector = None
+_profiler = None
+_log_dir = "logs"
+
+
+def observation_logger_name() -> str:
+    return f"observations_{multiprocessing.current_process().pid}"
+
+
+def profile_file_name(log_dir: str = "logs") -> str:
+    return os.path.join(log_dir, f"profile_{multiprocessing.current_process().pid}.prof")
+
+
+def root_log_file() -> str:
+    """
+    Returns: the file the root logger of this process writes to or None
+    """
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, logging.FileHandler):
+            return handler.baseFilename
+    return None
+
+
+def init_worker(connector=None, log_dir: str = "logs", profile: bool = False, app_log: str = None) -> None:
+    """
+    Initializer of the ProcessPoolExecutor. Sets up logging, matplotlib and
+    the connector of the worker process. With profile the tasks of the
+    worker are profiled, see process_instrument_day.
+    A worker that was not forked has no root logger set up. It then logs to
+    app_log, the log file of the main process, see root_log_file.
+    """
+    global _connector, _profiler, _log_dir
+    _connector = connector
+    _log_dir = log_dir
+    _profiler = cProfile.Profile() if profile else None
+
+    # No GUI in the workers. This must happen before pyplot is used.
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    plt.ioff()
+    # The figure for the images is set up once and reused
+    rendering.get_renderer()
+
+    if app_log is not None and not logging.getLogger().handlers:
+        logging.basicConfig(level=logging.INFO, filename=app_log, filemode='a', format=LOG_FORMAT)
+
+    logger = logging.getLogger(observation_logger_name())
+    for handler in list(logger.handlers):
+        # A forked worker may inherit the handlers of its parent
+        logger.removeHandler(handler)
+        handler.close()
+    formatter = logging.Formatter(LOG_FORMAT)
+    pid = multiprocessing.current_process().pid
+    datei_handler = logging.FileHandler(
+        os.path.join(log_dir, f'observations_{pid}_{datetime.datetime.now().strftime("%Y%m%d-%H%M%S")}.log'), 'w+')
+    datei_handler.setFormatter(formatter)
+    logger.setLevel(logging.INFO)
+    logger.addHandler(datei_handler)
+
+
+def process_instrument_day(instrument_day) -> tuple:
+    """
+    Task of the pool: writes all observations of an instrument day with the
+    connector of this worker
+
+    Returns: the spooled files the main process has to upload and an
+    ObservationResult for every observation
+    """
+    results = write_instrument_day(instrument_day)
+    return take_spooled(), results
+
+
+def process_chunk(chunk) -> tuple:
+    """
+    Task of the pool: writes the instrument days of a DayChunk one after
+    the other
+
+    Returns: the same as process_instrument_day for all days of the chunk
+    """
+    results = list()
+    for instrument_day in chunk.instrument_days():
+        results += write_instrument_day(instrument_day)
+    logging.getLogger(observation_logger_name()).info(
+        f"Archive listings of this worker: {fitscache.cached_archive_day.cache_info()}")
+    return take_spooled(), results
+
+
+def write_instrument_day(instrument_day) -> list:
+    if _profiler is None:
+        return burstprocessor.write_instrument_day(instrument_day, _connector)
+    # The pool gives no hook at the exit of a worker, so the statistics
+    # of all tasks so far are written after every task
+    _profiler.enable()
+    try:
+        return burstprocessor.write_instrument_day(instrument_day, _connector)
+    finally:
+        _profiler.disable()
+        _profiler.dump_stats(profile_file_name(_log_dir))
+
+
+def take_spooled() -> list:
+    if isinstance(_connector, SpoolConnector):
+        return _connector.take()
+    return []